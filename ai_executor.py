@@ -0,0 +1,104 @@
+import asyncio
+import logging
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+
+from collections import Counter
+
+from mcts import best_of, root_visits
+from metrics import REGISTRY
+from search import find_best_move
+
+WORKER_TIME_BUDGET = 0.3
+
+AI_SECONDS = REGISTRY.histogram("bot_ai_move_seconds", "Время выбора хода бота", ("difficulty",))
+AI_FALLBACKS = REGISTRY.counter(
+    "bot_ai_fallbacks_total", "Ходы бота, посчитанные эвристикой вместо поиска", ("reason",)
+)
+
+
+def compute_move(state, time_budget):
+    # Выполняется в рабочем процессе: получает только компактный кортеж состояния
+    return find_best_move(*state, time_budget=time_budget)
+
+
+def compute_visits(state, time_budget, tree_key):
+    # Независимое дерево MCTS в рабочем процессе; дерево остаётся в процессе до следующего хода
+    return root_visits(*state, time_budget=time_budget, tree_key=tree_key)
+
+
+def merge_visits(results):
+    # Параллелизм по корню: посещения ходов из всех процессов складываются
+    total = Counter()
+    for visits in results:
+        total.update(visits)
+    return best_of(total)
+
+
+class AIExecutor:
+    def __init__(self, max_workers=2, max_pending=64, timeout=1.0,
+                 use_processes=True, time_budget=WORKER_TIME_BUDGET, mcts_workers=2):
+        executor = ProcessPoolExecutor if use_processes else ThreadPoolExecutor
+        self.pool = executor(max_workers=max_workers)
+        # У MCTS свои пулы из одного процесса: дерево с номером i всегда считается
+        # в одном и том же процессе и переиспользуется между ходами, а сильный бот
+        # не ждёт, пока MCTS занимает все процессы
+        self.mcts_pools = [executor(max_workers=1) for _ in range(mcts_workers)]
+        self.max_workers = max_workers
+        self.max_pending = max_pending
+        self.timeout = timeout
+        self.time_budget = time_budget
+        self.tasks = {}  # Ключ: chat_id, значение: ожидаемый ход бота
+
+    async def choose_move(self, chat_id, game):
+        with AI_SECONDS.time(game.difficulty):
+            return await self.compute(chat_id, game)
+
+    async def compute(self, chat_id, game):
+        # Лёгкий бот считает ход сразу, без пула
+        if game.difficulty not in ("hard", "mcts"):
+            return game.choose_heuristic_move()
+
+        if len(self.tasks) >= self.max_pending:
+            logging.warning("Очередь вычисления ходов переполнена, используется эвристика")
+            AI_FALLBACKS.inc("overloaded")
+            return game.choose_heuristic_move()
+
+        loop = asyncio.get_running_loop()
+        state = game.get_state()
+        if game.difficulty == "mcts":
+            future = asyncio.gather(*(
+                loop.run_in_executor(pool, compute_visits, state, self.time_budget, (chat_id, index))
+                for index, pool in enumerate(self.mcts_pools)
+            ))
+        else:
+            future = loop.run_in_executor(self.pool, compute_move, state, self.time_budget)
+        self.tasks[chat_id] = future
+        try:
+            result = await asyncio.wait_for(future, self.timeout)
+            if game.difficulty == "mcts":
+                return merge_visits(result)
+            return result
+        except asyncio.TimeoutError:
+            logging.warning("Превышено время вычисления хода для %s, используется эвристика", chat_id)
+            AI_FALLBACKS.inc("timeout")
+            return game.choose_heuristic_move()
+        except asyncio.CancelledError:
+            # Ход отменён через cancel(): игрок вышел или сдался
+            if self.tasks.get(chat_id) is not future:
+                return None
+            raise
+        finally:
+            if self.tasks.get(chat_id) is future:
+                del self.tasks[chat_id]
+
+    def cancel(self, chat_id):
+        future = self.tasks.pop(chat_id, None)
+        if future is not None:
+            future.cancel()
+
+    def shutdown(self):
+        for future in self.tasks.values():
+            future.cancel()
+        self.tasks.clear()
+        for pool in [self.pool] + self.mcts_pools:
+            pool.shutdown(wait=False, cancel_futures=True)
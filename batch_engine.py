@@ -0,0 +1,176 @@
+import argparse
+import time
+
+import numpy as np
+
+from game import TicTacToeGame
+from lines import MASK_FIELD_LIMIT, get_line_masks, get_neighbourhoods, winning_length_for
+
+POLICIES = ("heuristic", "random")
+
+X_WINS = 1
+O_WINS = 2
+DRAW = 3
+
+
+def mask_matrix(masks, cells):
+    # Матрица клетки × маски: произведение доски на неё даёт число камней в каждой маске
+    matrix = np.zeros((cells, len(masks)), dtype=np.float32)
+    for line, mask in enumerate(masks):
+        for cell in range(cells):
+            if mask >> cell & 1:
+                matrix[cell, line] = 1
+    return matrix
+
+
+class BatchEngine:
+    def __init__(self, field_size=3, winning_length=None, seed=None):
+        self.field_size = field_size
+        self.winning_length = winning_length or winning_length_for(field_size)
+        self.cells = field_size * field_size
+        self.lines = mask_matrix(get_line_masks(field_size, self.winning_length), self.cells)
+        # На больших полях эвристика, как и TicTacToeGame.candidate_positions,
+        # ходит только рядом с камнями, а на пустом поле — в центр
+        if field_size > MASK_FIELD_LIMIT:
+            self.neighbours = mask_matrix(get_neighbourhoods(field_size, 1), self.cells)
+            self.center = np.zeros(self.cells, dtype=bool)
+            self.center[(field_size // 2) * field_size + field_size // 2] = True
+        else:
+            self.neighbours = None
+        self.rng = np.random.default_rng(seed)
+
+    def line_counts(self, stones):
+        return stones @ self.lines
+
+    def threat_cells(self, me, opp, empty):
+        # Клетки, которые достраивают линию me до выигрыша: в линии k-1 своих и ни одного чужого
+        almost = (self.line_counts(me) == self.winning_length - 1) & (self.line_counts(opp) == 0)
+        return (almost.astype(np.float32) @ self.lines.T > 0) & empty
+
+    def candidate_cells(self, me, opp, empty):
+        if self.neighbours is None:
+            return empty
+        stones = me + opp
+        near = (stones @ self.neighbours > 0) & empty
+        return np.where(stones.any(axis=1)[:, None], near, self.center)
+
+    def random_choice(self, allowed):
+        # Случайная разрешённая клетка в каждой строке: максимум шума по маске
+        noise = self.rng.random(allowed.shape)
+        noise[~allowed] = -1.0
+        return noise.argmax(axis=1)
+
+    def choose_moves(self, me, opp, policy):
+        empty = (me + opp) == 0
+        if policy == "random":
+            return self.random_choice(empty)
+
+        # То же правило, что в TicTacToeGame.choose_heuristic_move:
+        # выигрыш или блок (при обоих — монетка), иначе любая клетка-кандидат
+        empty = self.candidate_cells(me, opp, empty)
+        wins = self.threat_cells(me, opp, empty)
+        blocks = self.threat_cells(opp, me, empty)
+        has_wins = wins.any(axis=1)
+        has_blocks = blocks.any(axis=1)
+        coin = self.rng.random(len(me)) < 0.5
+        use_wins = has_wins & (~has_blocks | coin)
+        use_blocks = has_blocks & ~use_wins
+        allowed = np.where(use_wins[:, None], wins, np.where(use_blocks[:, None], blocks, empty))
+        return self.random_choice(allowed)
+
+    def play(self, games, x_policy="heuristic", o_policy="heuristic"):
+        # Все партии идут параллельно; законченные просто перестают ходить
+        boards = np.zeros((2, games, self.cells), dtype=np.float32)
+        results = np.zeros(games, dtype=np.int8)
+        rows = np.arange(games)
+        policies = (x_policy, o_policy)
+
+        for ply in range(self.cells):
+            player = ply % 2
+            active = rows[results == 0]
+            if not len(active):
+                break
+            me = boards[player, active]
+            opp = boards[1 - player, active]
+            moves = self.choose_moves(me, opp, policies[player])
+            boards[player, active, moves] = 1
+
+            won = (self.line_counts(boards[player, active]) == self.winning_length).any(axis=1)
+            results[active[won]] = X_WINS if player == 0 else O_WINS
+
+        results[results == 0] = DRAW
+        return results
+
+    def evaluate(self, x_boards, o_boards):
+        # Оценка позиций как в NegamaxSearch.evaluate, за крестиков, для всей пачки сразу
+        x_counts = self.line_counts(x_boards)
+        o_counts = self.line_counts(o_boards)
+        x_open = o_counts == 0
+        o_open = x_counts == 0
+        return (np.where(x_open, x_counts ** 2, 0) - np.where(o_open, o_counts ** 2, 0)).sum(axis=1)
+
+
+def play_scalar(games, field_size, x_policy, o_policy, rng):
+    # Та же самоигра по одной партии через TicTacToeGame, для сравнения скорости
+    results = {X_WINS: 0, O_WINS: 0, DRAW: 0}
+    for _ in range(games):
+        game = TicTacToeGame("X", field_size=field_size)
+        while game.winner is None:
+            policy = x_policy if game.current_player == "X" else o_policy
+            if policy == "random":
+                move = rng.choice(game.empty_positions())
+            else:
+                # choose_heuristic_move играет за bot_symbol, поэтому меняем стороны
+                game.player_symbol = "O" if game.current_player == "X" else "X"
+                move = game.choose_heuristic_move()
+            game.make_move(move)
+        results[{"X": X_WINS, "O": O_WINS}.get(game.winner, DRAW)] += 1
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Пакетная самоигра на NumPy")
+    parser.add_argument("--games", type=int, default=1_000_000)
+    parser.add_argument("--batch", type=int, default=100_000)
+    parser.add_argument("--size", type=int, default=3)
+    parser.add_argument("--x-policy", choices=POLICIES, default="heuristic")
+    parser.add_argument("--o-policy", choices=POLICIES, default="heuristic")
+    parser.add_argument("--seed", type=int, default=None)
+    parser.add_argument("--scalar-games", type=int, default=2000,
+                        help="сколько партий сыграть по одной для сравнения (0 — не играть)")
+    args = parser.parse_args()
+
+    engine = BatchEngine(args.size, seed=args.seed)
+    totals = np.zeros(DRAW + 1, dtype=np.int64)
+    started = time.perf_counter()
+    played = 0
+    while played < args.games:
+        batch = min(args.batch, args.games - played)
+        totals += np.bincount(engine.play(batch, args.x_policy, args.o_policy), minlength=DRAW + 1)
+        played += batch
+    elapsed = time.perf_counter() - started
+
+    print(
+        f"{args.size}x{args.size}, X: {args.x_policy}, O: {args.o_policy}, партий: {played}"
+    )
+    print(
+        f"X: {totals[X_WINS] / played:.1%}, O: {totals[O_WINS] / played:.1%}, "
+        f"ничьи: {totals[DRAW] / played:.1%}"
+    )
+    print(f"Пакетно: {played / elapsed:,.0f} партий/с")
+
+    if args.scalar_games:
+        rng = np.random.default_rng(args.seed)
+        started = time.perf_counter()
+        results = play_scalar(args.scalar_games, args.size, args.x_policy, args.o_policy, rng)
+        elapsed = time.perf_counter() - started
+        print(
+            f"По одной — X: {results[X_WINS] / args.scalar_games:.1%}, "
+            f"O: {results[O_WINS] / args.scalar_games:.1%}, "
+            f"ничьи: {results[DRAW] / args.scalar_games:.1%}"
+        )
+        print(f"По одной: {args.scalar_games / elapsed:,.0f} партий/с")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,314 @@
+import argparse
+import asyncio
+import itertools
+import json
+import os
+import platform
+import random
+import statistics
+import tempfile
+import time
+from types import SimpleNamespace
+
+from bot_ai import TicTacToeAI
+from display import create_game_keyboard, format_board_as_emoji, render_game
+from game import TicTacToeGame
+
+MICRO_SIZES = (3, 4, 5, 7, 10, 15)
+MAX_MOVES_PER_GAME = 1000
+# Для поиска по всему полю берём только малые доски: дальше работает оценка угроз
+SEARCH_SIZES = (3, 4)
+
+
+def random_game(field_size, moves, rng, difficulty="easy"):
+    # Партия в середине игры: случайные ходы, пока никто не выиграл
+    while True:
+        game = TicTacToeGame("X", mode="bot", field_size=field_size, difficulty=difficulty)
+        for position in rng.sample(range(game.board_size), moves):
+            if not game.make_move(position) or game.winner:
+                break
+        else:
+            return game
+
+
+def time_operation(function, min_time=0.2, repeats=5):
+    # Число повторов подбирается так, чтобы один замер шёл не меньше min_time / repeats
+    number = 1
+    while True:
+        started = time.perf_counter()
+        for _ in range(number):
+            function()
+        elapsed = time.perf_counter() - started
+        if elapsed >= min_time / repeats:
+            break
+        number *= 2
+
+    samples = [elapsed / number]
+    for _ in range(repeats - 1):
+        started = time.perf_counter()
+        for _ in range(number):
+            function()
+        samples.append((time.perf_counter() - started) / number)
+    return {"ns_per_op": statistics.median(samples) * 1e9, "ops": number * repeats}
+
+
+def micro_benchmarks(min_time, seed):
+    rng = random.Random(seed)
+    results = {}
+
+    for field_size in MICRO_SIZES:
+        game = random_game(field_size, min(field_size * 2, game_moves_limit(field_size)), rng)
+        board = game.get_board()
+        snapshot = game.to_snapshot()
+        snapshot[1] = "bot"
+
+        results[f"is_winner/{field_size}"] = time_operation(
+            lambda: game.is_winner(board, "X"), min_time
+        )
+        results[f"format_board_as_emoji/{field_size}"] = time_operation(
+            lambda: format_board_as_emoji(board, field_size), min_time
+        )
+        results[f"create_game_keyboard/{field_size}"] = time_operation(
+            lambda: create_game_keyboard(board, field_size, sequence=game.sequence).to_json(),
+            min_time,
+        )
+        results[f"render_game_cached/{field_size}"] = time_operation(
+            lambda: render_game(board, field_size, sequence=game.sequence), min_time
+        )
+        results[f"get_best_move_easy/{field_size}"] = time_operation(
+            lambda: TicTacToeAI.get_best_move(game), min_time
+        )
+
+        def bot_move():
+            # Каждый замер ходит из одной и той же позиции
+            copy = TicTacToeGame.from_snapshot(snapshot)
+            copy.player_symbol = "O" if copy.current_player == "X" else "X"
+            copy.bot_move()
+
+        results[f"bot_move_easy/{field_size}"] = time_operation(bot_move, min_time)
+
+    for field_size in SEARCH_SIZES:
+        game = random_game(field_size, 2, rng, difficulty="hard")
+        results[f"get_best_move_hard/{field_size}"] = time_operation(
+            lambda: TicTacToeAI.get_best_move(game), min_time, repeats=3
+        )
+    return results
+
+
+def game_moves_limit(field_size):
+    return field_size * field_size // 2
+
+
+class FakeAsyncTeleBot:
+    # Минимальная замена AsyncTeleBot: запоминает обработчики и отвечает с заданной задержкой
+    def __init__(self, latency=0.0):
+        self.latency = latency
+        self.message_handlers = []
+        self.callback_handlers = []
+        self.message_ids = itertools.count(1)
+        self.calls = 0
+
+    def message_handler(self, **kwargs):
+        def decorator(function):
+            self.message_handlers.append(function)
+            return function
+        return decorator
+
+    def callback_query_handler(self, **kwargs):
+        def decorator(function):
+            self.callback_handlers.append(function)
+            return function
+        return decorator
+
+    async def request(self):
+        self.calls += 1
+        if self.latency:
+            await asyncio.sleep(self.latency)
+
+    async def send_message(self, chat_id, text, **kwargs):
+        await self.request()
+        return SimpleNamespace(message_id=next(self.message_ids), chat=SimpleNamespace(id=chat_id))
+
+    async def edit_message_text(self, chat_id=None, message_id=None, text=None, **kwargs):
+        await self.request()
+        return True
+
+    async def answer_callback_query(self, callback_query_id, text=None, **kwargs):
+        await self.request()
+        return True
+
+    async def get_chat(self, chat_id):
+        await self.request()
+        return SimpleNamespace(id=chat_id, username=f"user{chat_id}", first_name=None)
+
+    async def set_my_commands(self, commands):
+        return True
+
+    async def close_session(self):
+        pass
+
+
+def make_user(chat_id):
+    return SimpleNamespace(id=chat_id, username=f"user{chat_id}", first_name=None)
+
+
+def make_message(chat_id, text):
+    return SimpleNamespace(chat=SimpleNamespace(id=chat_id), text=text, from_user=make_user(chat_id))
+
+
+def make_call(chat_id, data, query_ids):
+    return SimpleNamespace(
+        id=str(next(query_ids)),
+        data=data,
+        message=SimpleNamespace(chat=SimpleNamespace(id=chat_id), message_id=1),
+        from_user=make_user(chat_id),
+    )
+
+
+def percentile(values, fraction):
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    return ordered[min(int(fraction * len(ordered)), len(ordered) - 1)]
+
+
+async def play_games(bot, fake, games, field_size, rounds, rng):
+    on_message = fake.message_handlers[0]
+    on_callback = fake.callback_handlers[0]
+    query_ids = itertools.count(1)
+    chat_ids = [1_000_000 + i for i in range(games * 2)]
+    latencies = []
+
+    async def play(first, second):
+        players = {bot.games[first].symbol: first, bot.games[second].symbol: second}
+        moves = 0
+        # Ничья очищает поле, поэтому ограничиваем число ходов в одной партии
+        while first in bot.games and moves < MAX_MOVES_PER_GAME:
+            game = bot.games[first].game
+            position = rng.choice(game.empty_positions())
+            call = make_call(
+                players[game.current_player], f"move_{position}_{game.sequence}", query_ids
+            )
+            started = time.perf_counter()
+            await on_callback(call)
+            latencies.append(time.perf_counter() - started)
+            moves += 1
+
+    elapsed = 0.0
+    for _ in range(rounds):
+        # Подбор соперников не измеряется: чаты встают в очередь по одному и сразу находят пару
+        for chat_id in chat_ids:
+            await on_message(make_message(chat_id, "Против игрока"))
+            await on_message(make_message(chat_id, f"Поле {field_size}x{field_size}"))
+        pairs = [
+            (chat_id, bot.games[chat_id].opponent)
+            for chat_id in chat_ids
+            if bot.games[chat_id].symbol == "X"
+        ]
+
+        started = time.perf_counter()
+        await asyncio.gather(*(play(first, second) for first, second in pairs))
+        elapsed += time.perf_counter() - started
+    return latencies, elapsed
+
+
+async def macro_benchmark(games, field_size, rounds, api_latency, seed):
+    # Импорт здесь: бот открывает базы в текущем каталоге, а он к этому моменту временный
+    import bot as bot_module
+    from outbound import OutboundScheduler
+
+    fake = FakeAsyncTeleBot(api_latency)
+    bot = bot_module.TicTacToeBot("benchmark", bot=fake)
+    # Ограничения Telegram здесь не нужны: меряем сами обработчики
+    bot.outbound = OutboundScheduler(
+        fake, global_rate=1e9, global_burst=1e9, chat_rate=1e9, chat_burst=1e9
+    )
+    try:
+        latencies, elapsed = await play_games(bot, fake, games, field_size, rounds, random.Random(seed))
+    finally:
+        await bot.shutdown()
+
+    return {
+        "chats": games * 2,
+        "field_size": field_size,
+        "moves": len(latencies),
+        "seconds": elapsed,
+        "moves_per_second": len(latencies) / elapsed if elapsed else 0.0,
+        "p50_ms": percentile(latencies, 0.5) * 1000,
+        "p99_ms": percentile(latencies, 0.99) * 1000,
+        "api_calls": fake.calls,
+    }
+
+
+def compare(results, baseline):
+    # Отношение новое / старое: больше 1 — медленнее для микро, быстрее для ходов в секунду
+    lines = []
+    for name, current in sorted(results["micro"].items()):
+        previous = baseline.get("micro", {}).get(name)
+        if previous:
+            ratio = current["ns_per_op"] / previous["ns_per_op"]
+            lines.append(f"{name:40} {previous['ns_per_op']:12.0f} → {current['ns_per_op']:12.0f} нс  ×{ratio:.2f}")
+    macro, previous = results.get("macro"), baseline.get("macro")
+    if macro and previous:
+        for key in ("moves_per_second", "p50_ms", "p99_ms"):
+            ratio = macro[key] / previous[key] if previous[key] else float("inf")
+            lines.append(f"macro {key:34} {previous[key]:12.2f} → {macro[key]:12.2f}  ×{ratio:.2f}")
+    return "\n".join(lines)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Бенчмарки движка, ИИ, отрисовки и обработчиков")
+    parser.add_argument("--only", choices=("micro", "macro"), default=None)
+    parser.add_argument("--min-time", type=float, default=0.2, help="время на один микробенчмарк, с")
+    parser.add_argument("--games", type=int, default=1000, help="одновременных партий (чатов вдвое больше)")
+    parser.add_argument("--rounds", type=int, default=1, help="партий подряд в каждой паре чатов")
+    parser.add_argument("--field-size", type=int, default=3)
+    parser.add_argument("--api-latency", type=float, default=0.0, help="задержка поддельного Bot API, с")
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--output", help="куда записать JSON с результатами")
+    parser.add_argument("--baseline", help="JSON прошлого запуска для сравнения")
+    args = parser.parse_args()
+
+    results = {
+        "meta": {
+            "python": platform.python_version(),
+            "machine": platform.machine(),
+            "time": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        },
+        "micro": {},
+    }
+    if args.only != "macro":
+        results["micro"] = micro_benchmarks(args.min_time, args.seed)
+        for name, stats in results["micro"].items():
+            print(f"{name:40} {stats['ns_per_op']:12.0f} нс/оп")
+
+    if args.only != "micro":
+        output = os.path.abspath(args.output) if args.output else None
+        baseline = os.path.abspath(args.baseline) if args.baseline else None
+        workdir = os.getcwd()
+        with tempfile.TemporaryDirectory() as directory:
+            os.chdir(directory)
+            try:
+                results["macro"] = asyncio.run(macro_benchmark(
+                    args.games, args.field_size, args.rounds, args.api_latency, args.seed
+                ))
+            finally:
+                os.chdir(workdir)
+        args.output, args.baseline = output, baseline
+        macro = results["macro"]
+        print(
+            f"macro: {macro['chats']} чатов, {macro['moves']} ходов, "
+            f"{macro['moves_per_second']:.0f} ходов/с, p50 {macro['p50_ms']:.2f} мс, "
+            f"p99 {macro['p99_ms']:.2f} мс"
+        )
+
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as file:
+            json.dump(results, file, ensure_ascii=False, indent=2)
+    if args.baseline:
+        with open(args.baseline, "r", encoding="utf-8") as file:
+            print(compare(results, json.load(file)))
+
+
+if __name__ == "__main__":
+    main()
@@ -1,89 +1,129 @@
 import logging
-import json
-import os
 import asyncio
+import os
 from config import API_TOKEN
 from telebot.async_telebot import AsyncTeleBot
-from display import format_board_as_emoji, create_game_keyboard
+from display import render_game, create_leaderboard_keyboard, shift_viewport, VIEWPORT_SHIFTS
 from game import TicTacToeGame
+from chat_session import ChatSession
+from ai_executor import AIExecutor
+from leaderboard_store import LeaderboardStore
+from ranking import RankedLeaderboard
+from rating import BOT_IDS, RatingStore
+from identity_cache import IdentityCache
+from dispatcher import Dispatcher, parse_move, parse_page, parse_surrender, parse_view
+from metrics import REGISTRY, MetricsServer
+from webhook import WebhookServer, configure_api
+from outbound import OutboundScheduler, PRIORITY_BOARD, PRIORITY_INFO
 from telebot import types
 from keyboards import (
+    DIFFICULTY_CHOICES,
+    FIELD_SIZE_CHOICES,
     choice_keyboard,
     play_keyboard,
     game_mode_keyboard,
     field_size_keyboard,
+    difficulty_keyboard,
     exit_queue_keyboard,
     exit_game_keyboard,
 )
 from player_queue import PlayerQueue
+from timers import TimingWheel
+from session_store import MemorySessionStore, SQLiteSessionStore, VersionConflict, dump_record, load_record
 
 
 logging.basicConfig(
-    level=logging.DEBUG,
+    level=os.environ.get("LOG_LEVEL", "INFO").upper(),
     format="%(asctime)s [%(levelname)s] %(message)s",
     handlers=[logging.StreamHandler()],
 )
 
+MOVE_SECONDS = REGISTRY.histogram(
+    "bot_make_move_seconds", "Время применения хода к игре", ("player",),
+    bounds=(0.00001, 0.000025, 0.00005, 0.0001, 0.00025, 0.0005, 0.001, 0.005),
+)
+RENDER_SECONDS = REGISTRY.histogram(
+    "bot_render_seconds", "Время подготовки текста и клавиатуры доски",
+    bounds=(0.00001, 0.000025, 0.00005, 0.0001, 0.00025, 0.0005, 0.001, 0.005, 0.01),
+)
+GAMES_FINISHED = REGISTRY.counter(
+    "bot_games_finished_total", "Завершённые партии", ("mode", "field_size")
+)
+
+# Часы хода в партии с игроком и время простоя сессии, в секундах
+TURN_TIMEOUT = 120
+TURN_WARNING = 30  # За сколько секунд до конца хода напомнить игроку
+IDLE_TIMEOUT = 1800
+# Как часто заново подбирать пары среди ждущих: окна по рейтингу со временем расширяются
+REMATCH_INTERVAL = 5
+
 class TicTacToeBot:
-    def __init__(self, api_token):
-        self.bot = AsyncTeleBot(api_token)
+    def __init__(self, api_token, session_store=None, metrics_port=None, bot=None):
+        # bot позволяет подставить свой клиент Bot API, например поддельный в бенчмарках
+        self.bot = bot or AsyncTeleBot(api_token)
+        self.outbound = OutboundScheduler(self.bot)
         self.games = {}
+        self.session_store = session_store or MemorySessionStore()
         self.player_queue = PlayerQueue()
+        self.ai_executor = AIExecutor()
+        self.identities = IdentityCache()
+        self.redraws = {}  # Ключ: chat_id, значение: нужна ли ещё одна перерисовка
+        self.game_locks = {}  # Ключ: game_key, значение: asyncio.Lock
+        self.timers = TimingWheel()
 
         self._register_handlers()
+        self.leaderboard_store = LeaderboardStore()
         self.leaderboard = self.load_leaderboard()
-
-    def _register_handlers(self):
-        @self.bot.message_handler(func=lambda message: message.text == "Выход")
-        async def handle_exit(message):
-            await self.handle_exit_game(message)
-
-        @self.bot.message_handler(func=lambda message: message.text == "Выйти из очереди")
-        async def handle_exit_queue(message):
-            await self.handle_exit_from_queue(message)
-
-        @self.bot.message_handler(func=lambda message: message.text in ["Да", "Нет"])
-        async def handle_yes_no(message):
-            await self.handle_yes_no(message)
-
-        @self.bot.message_handler(
-            func=lambda message: message.text in ["Против бота", "Против игрока"]
+        self.ratings = RatingStore()
+        self.ratings.open()
+
+        self.metrics_server = MetricsServer(port=metrics_port) if metrics_port else None
+        REGISTRY.gauge("bot_active_chats", "Чаты с активной сессией", lambda: len(self.games))
+        REGISTRY.gauge("bot_active_games", "Идущие партии", self.count_active_games)
+        REGISTRY.gauge("bot_player_queue_depth", "Игроки в очереди подбора", lambda: len(self.player_queue))
+        REGISTRY.gauge(
+            "bot_outbound_queue_depth", "Запросы к Bot API в очереди", self.outbound.queue_depth
         )
-        async def handle_game_mode_choice(message):
-            await self.handle_game_mode_choice(message)
+        REGISTRY.gauge("bot_timers_scheduled", "Запланированные таймеры", lambda: len(self.timers))
 
-        @self.bot.message_handler(
-            func=lambda message: message.text in ["Крестик", "Нолик"]
-        )
-        async def handle_symbol_choice(message):
-            await self.handle_symbol_choice(message)
+    def count_active_games(self):
+        return len({id(game_data.game) for game_data in self.games.values() if game_data.game})
 
-        @self.bot.message_handler(
-            func=lambda message: message.text in ["Поле 3x3", "Поле 4x4"]
-        )
-        async def handle_field_size_choice(message):
-            await self.handle_field_size_choice(message)
+    def _register_handlers(self):
+        # Telebot видит один обработчик на тип обновления, дальше маршрутизирует Dispatcher
+        self.dispatcher = Dispatcher(self.handle_any_text, self.handle_unknown_callback)
+        self.dispatcher.on_text(["Выход"], self.handle_exit_game)
+        self.dispatcher.on_text(["Выйти из очереди"], self.handle_exit_from_queue)
+        self.dispatcher.on_text(["Да", "Нет"], self.handle_yes_no)
+        self.dispatcher.on_text(["Против бота", "Против игрока"], self.handle_game_mode_choice)
+        self.dispatcher.on_text(["Крестик", "Нолик"], self.handle_symbol_choice)
+        self.dispatcher.on_text(FIELD_SIZE_CHOICES, self.handle_field_size_choice)
+        self.dispatcher.on_text(DIFFICULTY_CHOICES, self.handle_difficulty_choice)
+        self.dispatcher.on_text(["Инструкция"], self.handle_instruction)
+        self.dispatcher.on_text(["Лидерборд"], self.handle_leaderboard)
+
+        self.dispatcher.on_command(["start"], self.handle_start)
+        self.dispatcher.on_command(["exit"], self.handle_exit_game)
+        self.dispatcher.on_command(["instruction"], self.handle_instruction)
+        self.dispatcher.on_command(["leaderboard"], self.handle_leaderboard)
+
+        self.dispatcher.on_callback("move", parse_move, self.handle_move)
+        self.dispatcher.on_callback("surrender", parse_surrender, self.handle_surrender)
+        self.dispatcher.on_callback("leaderboard", parse_page, self.handle_leaderboard_page)
+        self.dispatcher.on_callback("view", parse_view, self.handle_viewport)
 
         @self.bot.callback_query_handler(func=lambda call: True)
         async def handle_callback(call):
-            if call.data.startswith("move_"):
-                await self.handle_move(call)
-            elif call.data == "surrender":
-                await self.handle_surrender(call)
-            else:
-                await self.bot.answer_callback_query(call.id, "Неизвестная команда.")
+            self.identities.remember(call.from_user)
+            self.touch(call.message.chat.id)
+            await self.load_chat(call.message.chat.id)
+            await self.dispatcher.dispatch_callback(call)
 
         @self.bot.message_handler(func=lambda message: True)
-        async def handle_any_text(message):
-            await self.handle_any_text(message)
-
-        @self.bot.message_handler(commands=['/instruction'])
-        async def handle_instruction(message):
-            await self.send_instruction(message.chat.id)
-
-        @self.bot.message_handler(commands=['/leaderboard'])
-        async def handle_leaderboard(message):
-            await self.send_leaderboard(message.chat.id)
+        async def handle_message(message):
+            self.touch(message.chat.id)
+            await self.load_chat(message.chat.id)
+            await self.dispatcher.dispatch_message(message)
 
     async def set_bot_commands(self):
         commands = [
@@ -97,83 +137,205 @@ class TicTacToeBot:
     async def send_main_menu(self, chat_id):
         menu_keyboard = types.ReplyKeyboardMarkup(resize_keyboard=True, row_width=2)
         menu_keyboard.add("Инструкция", "Лидерборд")
-        await self.bot.send_message(
+        await self.outbound.send_message(
             chat_id,
             "Добро пожаловать! Выберите действие из меню:",
             reply_markup=menu_keyboard,
         )
 
+    async def handle_start(self, message):
+        await self.send_game_invite(message.chat.id)
+
+    async def handle_instruction(self, message):
+        await self.send_instruction(message.chat.id)
+
+    async def handle_leaderboard(self, message):
+        await self.send_leaderboard(message.chat.id, message.from_user)
+
     async def send_instruction(self, chat_id):
         instruction_text = (
             "Добро пожаловать в Крестики-Нолики! 🎮\n\n"
             "Вот как играть:\n"
             "1. Выберите режим: против бота или другого игрока.\n"
-            "2. Выберите размер поля (3x3 или 4x4).\n"
-            "3. Дождитесь начала игры и делайте ходы, нажимая на кнопки на игровом поле.\n\n"
-            "Цель: собрать три  символа подряд по горизонтали, вертикали или диагонали. Удачи!"
+            "2. Выберите размер поля (от 3x3 до 15x15) и, в игре с ботом, его сложность.\n"
+            "3. Дождитесь начала игры и делайте ходы, нажимая на кнопки на игровом поле.\n"
+            "На полях больше 8x8 кнопки показывают часть поля, стрелки сдвигают её.\n\n"
+            "Цель: собрать символы подряд по горизонтали, вертикали или диагонали: "
+            "три на полях 3x3 и 4x4, четыре на 5x5, пять на больших полях. Удачи!"
         )
-        await self.bot.send_message(chat_id, instruction_text)
+        await self.outbound.send_message(chat_id, instruction_text)
 
     def load_leaderboard(self):
-
-        if os.path.exists("leaderboard.json"):
-            with open("leaderboard.json", "r", encoding="utf-8") as file:
-                return json.load(file)
-        return {}
-
-    def save_leaderboard(self):
-
-        with open("leaderboard.json", "w", encoding="utf-8") as file:
-            json.dump(self.leaderboard, file, ensure_ascii=False, indent=4)
+        self.leaderboard_store.open()
+        wins, names = self.leaderboard_store.load()
+        return RankedLeaderboard(wins, names)
 
     async def update_leaderboard(self, user_id):
         try:
-
-            user = await self.bot.get_chat(user_id)
+            name = await self.identities.resolve(user_id, self.bot)
         except Exception as e:
-            logging.error(f"Ошибка получения объекта пользователя для ID {user_id}: {e}")
+            logging.error("Ошибка получения объекта пользователя для ID %s: %s", user_id, e)
             return
 
+        # Записи храним по ID: смена имени не разделяет и не склеивает их
+        identifier = str(user_id)
+        self.leaderboard.set_name(identifier, name)
+        self.leaderboard.add_win(identifier)
+        self.leaderboard_store.increment(identifier, name)
+
+        logging.info("Лидерборд обновлен для пользователя: %s (%s)", name, user_id)
+
+    def format_leaderboard(self):
+        return self.leaderboard.format_top()
+
+    def format_leaderboard_page(self, page, user=None):
+        leaderboard_text = "🏆 Лидерборд:\n" + self.leaderboard.format_page(page)
+        if user is not None:
+            self.identities.remember(user)
+            rank = self.leaderboard.rank(str(user.id))
+            if rank is not None:
+                leaderboard_text += f"\nВаше место: {rank}"
+            sizes = self.ratings.played_sizes(user.id)
+            if sizes:
+                leaderboard_text += "\nВаш рейтинг: " + ", ".join(
+                    f"{size}x{size} — {self.ratings.get(user.id, size):.0f}" for size in sizes
+                )
+            else:
+                leaderboard_text += "\nРейтинг появится после первой игры против игрока"
+        return leaderboard_text
 
-        if user.username:
-            identifier = user.username.lstrip('@')
-        elif user.first_name:
-            identifier = user.first_name
-        else:
-            identifier = f"User_{user_id}"
-
-
-        if identifier not in self.leaderboard:
-            self.leaderboard[identifier] = 0
-        self.leaderboard[identifier] += 1
-
-
-        self.save_leaderboard()
-
-
-        logging.info(f"Лидерборд обновлен для пользователя: {identifier}")
-
-    async def send_leaderboard(self, chat_id):
+    async def send_leaderboard(self, chat_id, user=None):
         if not self.leaderboard:
-            await self.bot.send_message(chat_id, "🏆 Лидерборд пока пуст. Сыграйте, чтобы попасть в таблицу!")
+            await self.outbound.send_message(chat_id, "🏆 Лидерборд пока пуст. Сыграйте, чтобы попасть в таблицу!")
             return
 
-        sorted_leaderboard = sorted(self.leaderboard.items(), key=lambda x: x[1], reverse=True)
-        leaderboard_text = "🏆 Лидерборд:\n"
-        for idx, (identifier, wins) in enumerate(sorted_leaderboard, start=1):
+        await self.outbound.send_message(
+            chat_id,
+            self.format_leaderboard_page(0, user),
+            reply_markup=create_leaderboard_keyboard(0, self.leaderboard.pages_count()),
+        )
 
-            if "@" not in identifier:
-                identifier = f"@{identifier}"
+    async def handle_leaderboard_page(self, call, action):
+        pages_count = self.leaderboard.pages_count()
+        page = min(max(action.page, 0), pages_count - 1)
+        await self.outbound.edit_message_text(
+            chat_id=call.message.chat.id,
+            message_id=call.message.message_id,
+            text=self.format_leaderboard_page(page, call.from_user),
+            priority=PRIORITY_INFO,
+            reply_markup=create_leaderboard_keyboard(page, pages_count),
+        )
+        await self.bot.answer_callback_query(call.id)
 
-            leaderboard_text += f"{idx}. {identifier} - Побед: {wins}\n"
+    async def save_chat(self, chat_id):
+        game_data = self.games.get(chat_id)
+        if game_data is None:
+            await self.session_store.delete(f"chat:{chat_id}")
+            return
+        await self.session_store.put(f"chat:{chat_id}", dump_record(game_data.to_record()))
 
-        await self.bot.send_message(chat_id, leaderboard_text)
+    async def commit_game(self, chat_id, new_game=False):
+        # Оптимистичная блокировка: снимок пишется, только если его никто не успел изменить.
+        # Новая партия заменяет прежний снимок под тем же ключом без проверки версии
+        game_data = self.games[chat_id]
+        game = game_data.game
+        key = f"game:{game_data.game_key}"
+        try:
+            game.version = await self.session_store.put(
+                key, dump_record(game.to_snapshot()), None if new_game else game.version
+            )
+        except VersionConflict:
+            logging.warning("Конфликт версий игры %s, состояние перечитано", key)
+            await self.reload_game(chat_id)
+            return False
+        return True
+
+    async def reload_game(self, chat_id):
+        # Перечитывает партию из хранилища для чата и его соперника
+        game_data = self.games[chat_id]
+        record = await self.session_store.get(f"game:{game_data.game_key}")
+        if record is None:
+            return
+        data, version = record
+        game = TicTacToeGame.from_snapshot(load_record(data), version)
+        for session in (game_data, self.games.get(game_data.opponent)):
+            if session is not None and session.game_key == game_data.game_key:
+                session.game = game
+
+    async def load_chat(self, chat_id):
+        # Сессию мог начать другой процесс с тем же хранилищем: при промахе кэша
+        # читаем её снимок. Очередь подбора и таймеры у каждого процесса свои,
+        # поэтому ожидание в очереди другого процесса здесь не продолжается
+        if chat_id in self.games:
+            return
+        record = await self.session_store.get(f"chat:{chat_id}")
+        if record is None:
+            return
+        game_data = ChatSession.from_record(load_record(record[0]))
+        if game_data.game_key is not None:
+            opponent = self.games.get(game_data.opponent)
+            if opponent is not None and opponent.game_key == game_data.game_key and opponent.game:
+                # Соперник уже в памяти: оба чата делят один объект партии
+                game_data.game = opponent.game
+            else:
+                game_record = await self.session_store.get(f"game:{game_data.game_key}")
+                if game_record is None:
+                    return
+                data, version = game_record
+                game_data.game = TicTacToeGame.from_snapshot(load_record(data), version)
+        self.games.setdefault(chat_id, game_data)
+
+    async def forget_chats(self, *chat_ids):
+        # Удаляет записи чатов и их игры из хранилища
+        game_keys = set()
+        for chat_id in chat_ids:
+            if not chat_id:
+                continue
+            record = await self.session_store.get(f"chat:{chat_id}")
+            if record is not None:
+                game_key = ChatSession.from_record(load_record(record[0])).game_key
+                if game_key is not None:
+                    game_keys.add(game_key)
+            await self.session_store.delete(f"chat:{chat_id}")
+            self.timers.cancel(("queue", chat_id))
+            # Сессии без партии блокируются по chat_id, такой замок тоже больше не нужен
+            self.game_locks.pop(chat_id, None)
+        for game_key in game_keys:
+            await self.session_store.delete(f"game:{game_key}")
+            self.game_locks.pop(game_key, None)
+            self.stop_turn_clock(game_key)
+
+    async def restore_sessions(self):
+        games = {}
+        for key, data, version in await self.session_store.items("game:"):
+            games[int(key.split(":")[1])] = TicTacToeGame.from_snapshot(load_record(data), version)
+
+        for key, data, _ in await self.session_store.items("chat:"):
+            chat_id = int(key.split(":")[1])
+            game_data = ChatSession.from_record(load_record(data))
+            game_key = game_data.game_key
+            if game_key is not None:
+                if game_key not in games:
+                    continue
+                game_data.game = games[game_key]
+            elif game_data.mode == "player" and game_data.field_size:
+                self.player_queue.add_player(
+                    chat_id, game_data.field_size, rating=self.ratings.get(chat_id, game_data.field_size)
+                )
+                self.start_queue_clock(chat_id)
+            self.games[chat_id] = game_data
+            self.touch(chat_id)
+        # Часы хода после перезапуска идут заново
+        for chat_id, game_data in self.games.items():
+            if game_data.game is not None and game_data.symbol == "X":
+                self.start_turn_clock(chat_id)
+        logging.info("Восстановлено сессий: %d", len(self.games))
 
     def is_game_active(self, chat_id):
         return chat_id in self.games
 
     async def send_game_invite(self, chat_id):
-        await self.bot.send_message(
+        await self.outbound.send_message(
             chat_id, "Привет! Хочешь сыграть в игру?", reply_markup=choice_keyboard
         )
 
@@ -183,45 +345,61 @@ class TicTacToeBot:
             await self.send_game_invite(chat_id)
             return
 
-        game_data = self.games.pop(chat_id, None)
-        if game_data and game_data.get("opponent"):
-            opponent_id = game_data["opponent"]
-            await self.bot.send_message(opponent_id, "Противник вышел из игры. Игра завершена.")
+        self.ai_executor.cancel(chat_id)
+        async with self.game_lock(chat_id):
+            game_data = self.games.pop(chat_id, None)
+            opponent_id = game_data.opponent if game_data else None
+            if game_data is not None and game_data.game is None and game_data.field_size:
+                # Игрок ещё ждал соперника: убираем его и из очереди подбора
+                self.player_queue.remove_player(chat_id, game_data.field_size)
             self.games.pop(opponent_id, None)
+            await self.forget_chats(chat_id, opponent_id)
 
-        await self.bot.send_message(chat_id, "Вы вышли из игры. Увидимся в следующий раз!")
+        notifications = [
+            self.outbound.send_message(chat_id, "Вы вышли из игры. Увидимся в следующий раз!")
+        ]
+        if opponent_id:
+            notifications.append(
+                self.outbound.send_message(opponent_id, "Противник вышел из игры. Игра завершена.")
+            )
+        await asyncio.gather(*notifications)
 
     async def handle_exit_from_queue(self, message):
         chat_id = message.chat.id
 
-        field_size = self.games.get(chat_id, {}).get("field_size")
+        game_data = self.games.get(chat_id)
+        field_size = game_data.field_size if game_data else None
         if not field_size:
-            await self.bot.send_message(chat_id, "Ошибка: вы не в очереди.")
+            await self.outbound.send_message(chat_id, "Ошибка: вы не в очереди.")
             return
 
 
         if self.player_queue.remove_player(chat_id, field_size):
-            await self.bot.send_message(chat_id, "Вы вышли из очереди. Увидимся в следующий раз!")
+            self.games.pop(chat_id, None)
+            await self.forget_chats(chat_id)
+            await self.outbound.send_message(chat_id, "Вы вышли из очереди. Увидимся в следующий раз!")
         else:
-            await self.bot.send_message(chat_id, "Ошибка: не удалось выйти из очереди.")
+            await self.outbound.send_message(chat_id, "Ошибка: не удалось выйти из очереди.")
 
     async def handle_yes_no(self, message):
         if message.text == "Да":
-            await self.bot.send_message(
+            await self.outbound.send_message(
                 message.chat.id, "Выберите режим игры:", reply_markup=game_mode_keyboard
             )
         else:
-            await self.bot.send_message(message.chat.id, "Увидимся в следующий раз!")
+            await self.outbound.send_message(message.chat.id, "Увидимся в следующий раз!")
 
     async def handle_game_mode_choice(self, message):
         chat_id = message.chat.id
+        self.identities.remember(message.from_user)
         if self.is_game_active(chat_id):
-            await self.bot.send_message(chat_id, "Игра уже идёт. Завершите текущую игру.")
+            await self.outbound.send_message(chat_id, "Игра уже идёт. Завершите текущую игру.")
             return
 
         game_mode = "bot" if message.text == "Против бота" else "player"
-        self.games[chat_id] = {"mode": game_mode}
-        await self.bot.send_message(chat_id, "Выберите размер поля:", reply_markup=field_size_keyboard)
+        self.games[chat_id] = ChatSession(mode=game_mode)
+        await self.save_chat(chat_id)
+        await self.outbound.send_message(chat_id, "Выберите размер поля:", reply_markup=field_size_keyboard)
 
     async def handle_field_size_choice(self, message):
         chat_id = message.chat.id
@@ -229,24 +407,45 @@ class TicTacToeBot:
             await self.send_game_invite(chat_id)
             return
 
-        field_size = 3 if message.text == "Поле 3x3" else 4
-        self.games[chat_id]["field_size"] = field_size
-        game_mode = self.games[chat_id]["mode"]
+        field_size = FIELD_SIZE_CHOICES.get(message.text, 3)
+        game_data = self.games[chat_id]
+        game_data.field_size = field_size
+        game_mode = game_data.mode
+        await self.save_chat(chat_id)
 
         if game_mode == "bot":
-            await self.send_symbol_choice(chat_id)
+            await self.send_difficulty_choice(chat_id)
         elif game_mode == "player":
-            self.player_queue.add_player(chat_id, field_size)
+            self.player_queue.add_player(
+                chat_id, field_size, rating=self.ratings.get(chat_id, field_size)
+            )
             opponent_id = self.player_queue.get_opponent(chat_id, field_size)
             if opponent_id:
                 await self.start_game(chat_id, opponent_id, field_size)
             else:
-                await self.bot.send_message(
+                self.start_queue_clock(chat_id)
+                await self.outbound.send_message(
                     chat_id, "Вы в очереди. Ожидайте другого игрока.", reply_markup=exit_queue_keyboard
                 )
 
+    async def send_difficulty_choice(self, chat_id):
+        await self.outbound.send_message(
+            chat_id, "Выберите сложность бота:", reply_markup=difficulty_keyboard
+        )
+
+    async def handle_difficulty_choice(self, message):
+        chat_id = message.chat.id
+        if not self.is_game_active(chat_id):
+            await self.send_game_invite(chat_id)
+            return
+
+        difficulty = DIFFICULTY_CHOICES.get(message.text, "easy")
+        self.games[chat_id].difficulty = difficulty
+        await self.save_chat(chat_id)
+        await self.send_symbol_choice(chat_id)
+
     async def send_symbol_choice(self, chat_id):
-        await self.bot.send_message(
+        await self.outbound.send_message(
             chat_id, "Выберите: Крестик или Нолик", reply_markup=play_keyboard
         )
 
@@ -257,248 +456,470 @@ class TicTacToeBot:
             return
 
         player_symbol = "X" if message.text == "Крестик" else "O"
-        game_mode = self.games[message.chat.id]["mode"]
-        field_size = self.games[message.chat.id].get("field_size", 3)
+        game_data = self.games[message.chat.id]
+        game_mode = game_data.mode
+        field_size = game_data.field_size or 3
+        difficulty = game_data.difficulty or "easy"
 
         if game_mode == "bot":
             game = TicTacToeGame(
-                player_symbol, mode=game_mode, field_size=field_size
+                player_symbol, mode=game_mode, field_size=field_size, difficulty=difficulty
             )
-            self.games[message.chat.id]["game"] = game
-            self.games[message.chat.id]["symbol"] = player_symbol
-            self.games[message.chat.id]["message_id"] = None
-            logging.debug(f"Игра против бота инициализирована для {message.chat.id}")
-
-            await self.bot.send_message(
+            game_data.game = game
+            game_data.symbol = player_symbol
+            game_data.message_id = None
+            game_data.game_key = message.chat.id
+            await self.commit_game(message.chat.id, new_game=True)
+            await self.save_chat(message.chat.id)
+            logging.debug("Игра против бота инициализирована для %s", message.chat.id)
+
+            await self.outbound.send_message(
                 message.chat.id,
                 f"Ты выбрал {player_symbol}. Начинаем игру!",
                 reply_markup=exit_game_keyboard
             )
 
             if player_symbol == "O":
-                game.bot_move()
+                if not await self.make_bot_move(message.chat.id, game):
+                    return
             await self.display_board(message.chat.id)
         else:
-            await self.bot.send_message(message.chat.id, "Ожидаем второго игрока...", reply_markup=exit_game_keyboard)
+            await self.outbound.send_message(message.chat.id, "Ожидаем второго игрока...", reply_markup=exit_game_keyboard)
 
     async def start_game(self, player_1_id, player_2_id, field_size):
         game = TicTacToeGame("X", mode="player", field_size=field_size)
-        self.games[player_1_id] = {
-            "game": game,
-            "opponent": player_2_id,
-            "symbol": "X",
-            "message_id": None,
-        }
-        self.games[player_2_id] = {
-            "game": game,
-            "opponent": player_1_id,
-            "symbol": "O",
-            "message_id": None,
-        }
-
-        await self.bot.send_message(
-            player_1_id, "Игра начинается! Вы играете за Крестики.", reply_markup=exit_game_keyboard
+        self.games[player_1_id] = ChatSession(
+            mode="player", field_size=field_size, symbol="X",
+            opponent=player_2_id, game_key=player_1_id, game=game,
+        )
+        self.games[player_2_id] = ChatSession(
+            mode="player", field_size=field_size, symbol="O",
+            opponent=player_1_id, game_key=player_1_id, game=game,
         )
-        await self.bot.send_message(
-            player_2_id, "Игра начинается! Вы играете за Нолики.", reply_markup=exit_game_keyboard
+        await self.commit_game(player_1_id, new_game=True)
+        await asyncio.gather(self.save_chat(player_1_id), self.save_chat(player_2_id))
+        self.timers.cancel(("queue", player_1_id))
+        self.timers.cancel(("queue", player_2_id))
+        self.start_turn_clock(player_1_id)
+
+        await asyncio.gather(
+            self.outbound.send_message(
+                player_1_id, "Игра начинается! Вы играете за Крестики.", reply_markup=exit_game_keyboard
+            ),
+            self.outbound.send_message(
+                player_2_id, "Игра начинается! Вы играете за Нолики.", reply_markup=exit_game_keyboard
+            ),
         )
 
-        await self.display_board(player_1_id)
-        await self.display_board(player_2_id)
+        await self.display_boards(player_1_id, player_2_id)
+
+    async def display_boards(self, *chat_ids):
+        await asyncio.gather(*(self.display_board(chat_id) for chat_id in chat_ids if chat_id))
 
     async def display_board(self, chat_id):
         if chat_id not in self.games:
-            await self.bot.send_message(
+            await self.outbound.send_message(
                 chat_id, "Игра не найдена. Начните новую игру."
             )
-            logging.error(
-                f"Попытка отобразить доску для отсутствующей игры: chat_id={chat_id}"
-            )
+            logging.error("Попытка отобразить доску для отсутствующей игры: chat_id=%s", chat_id)
             return
 
-        game_data = self.games[chat_id]
-        game = game_data["game"]
-        field_size = game.field_size
-        board_display = format_board_as_emoji(game.get_board(), field_size)
-        keyboard = create_game_keyboard(
-            game.get_board(), field_size, game_over=False
-        )
+        if chat_id in self.redraws:
+            # Перерисовка уже идёт: она подхватит свежее состояние доски
+            self.redraws[chat_id] = True
+            return
 
-        logging.debug(f"Отображение доски для {chat_id}")
+        game_data = self.games[chat_id]
+        self.redraws[chat_id] = False
+        try:
+            while True:
+                # Партия могла закончиться во время перерисовки: тогда последний
+                # проход рисует итоговую доску из уже завершённой партии
+                current = self.games.get(chat_id)
+                if current is not None and current.game is not None:
+                    game_data = current
+                await self.render_board(chat_id, game_data)
+                if not self.redraws[chat_id]:
+                    break
+                self.redraws[chat_id] = False
+        finally:
+            del self.redraws[chat_id]
+
+    async def render_board(self, chat_id, game_data):
+        game = game_data.game
+        with RENDER_SECONDS.time():
+            board_display, keyboard = render_game(
+                game.get_board(), game.field_size, game_over=False, sequence=game.sequence,
+                viewport=game_data.viewport,
+            )
+        rendered = hash((board_display, keyboard))
 
-        if game_data.get("message_id") is None:
-            sent_message = await self.bot.send_message(
-                chat_id, board_display, reply_markup=keyboard
+        if game_data.message_id is None:
+            sent_message = await self.outbound.send_message(
+                chat_id, board_display, priority=PRIORITY_BOARD, reply_markup=keyboard
             )
-            self.games[chat_id]["message_id"] = sent_message.message_id
-        else:
-            await self.bot.edit_message_text(
+            game_data.message_id = sent_message.message_id
+            await self.save_chat(chat_id)
+        elif game_data.rendered != rendered:
+            logging.debug("Отображение доски для %s", chat_id)
+            await self.outbound.edit_message_text(
                 chat_id=chat_id,
-                message_id=game_data["message_id"],
+                message_id=game_data.message_id,
                 text=board_display,
                 reply_markup=keyboard,
             )
+        game_data.rendered = rendered
+
+    def game_lock(self, chat_id):
+        # Одна блокировка на игру: ходы в ней идут по очереди, разные игры не мешают друг другу
+        game_key = self.games[chat_id].game_key or chat_id
+        lock = self.game_locks.get(game_key)
+        if lock is None:
+            lock = asyncio.Lock()
+            self.game_locks[game_key] = lock
+        return lock
+
+    def touch(self, chat_id):
+        # Любое действие в чате откладывает закрытие сессии по простою
+        self.timers.schedule(("idle", chat_id), IDLE_TIMEOUT, self.evict_idle, chat_id)
+
+    def start_queue_clock(self, chat_id):
+        self.timers.schedule(
+            ("queue", chat_id), self.player_queue.entry_ttl, self.expire_queue_entry, chat_id
+        )
+        if len(self.player_queue) > 1 and ("rematch",) not in self.timers:
+            self.timers.schedule(("rematch",), REMATCH_INTERVAL, self.rematch_queue)
+
+    async def rematch_queue(self):
+        pairs = self.player_queue.rematch()
+        if len(self.player_queue) > 1:
+            self.timers.schedule(("rematch",), REMATCH_INTERVAL, self.rematch_queue)
+        await asyncio.gather(*(
+            self.start_game(player_id, opponent_id, field_size)
+            for player_id, opponent_id, field_size in pairs
+        ))
+
+    def start_turn_clock(self, chat_id):
+        # Часы идут только в партии с игроком и перезапускаются после каждого хода
+        game_data = self.games.get(chat_id)
+        if game_data is None or game_data.game is None or not game_data.opponent:
+            return
+        game = game_data.game
+        mover_id = chat_id if game_data.symbol == game.current_player else game_data.opponent
+        game_key = game_data.game_key
+        self.timers.schedule(
+            ("turn", game_key), TURN_TIMEOUT, self.forfeit_turn, mover_id, game, game.sequence
+        )
+        self.timers.schedule(
+            ("turn_warning", game_key), TURN_TIMEOUT - TURN_WARNING,
+            self.warn_turn, mover_id, game, game.sequence,
+        )
+
+    def stop_turn_clock(self, game_key):
+        self.timers.cancel(("turn", game_key))
+        self.timers.cancel(("turn_warning", game_key))
+
+    def is_same_turn(self, chat_id, game, sequence):
+        # Таймер хода устарел, если партия сменилась или в ней уже походили
+        game_data = self.games.get(chat_id)
+        return game_data is not None and game_data.game is game and game.sequence == sequence
+
+    async def warn_turn(self, chat_id, game, sequence):
+        if self.is_same_turn(chat_id, game, sequence):
+            await self.outbound.send_message(
+                chat_id, f"Осталось {TURN_WARNING} секунд на ход, иначе партия будет проиграна."
+            )
 
-    async def handle_move(self, call):
-        chat_id = call.message.chat.id
-        data = call.data
-        if not data.startswith("move_"):
+    async def forfeit_turn(self, chat_id, game, sequence):
+        if not self.is_same_turn(chat_id, game, sequence):
             return
-        position = int(data.split("_")[1])
+        async with self.game_lock(chat_id):
+            # Пока ждали блокировку, ход мог успеть прийти
+            if self.is_same_turn(chat_id, game, sequence):
+                logging.info("Время хода истекло: chat_id=%s", chat_id)
+                await self.process_surrender(
+                    chat_id,
+                    "Время на ход вышло. Вам засчитано поражение.",
+                    "Противник не сделал ход вовремя. Вы победили!",
+                )
+
+    async def expire_queue_entry(self, chat_id):
+        # Просроченных убирает сама очередь, а сессию чата закрываем здесь
+        self.player_queue.expire()
+        game_data = self.games.get(chat_id)
+        if game_data is None or game_data.game is not None:
+            return
+        if self.player_queue.is_waiting(chat_id, game_data.field_size):
+            return
+        self.games.pop(chat_id, None)
+        await self.forget_chats(chat_id)
+        await self.outbound.send_message(
+            chat_id, "Соперник не нашёлся, вы вышли из очереди. Попробуйте позже: /start"
+        )
+
+    async def evict_idle(self, chat_id):
+        game_data = self.games.get(chat_id)
+        # Партию с игроком завершают часы хода, ожидание в очереди — свой таймер
+        if game_data is None or game_data.opponent:
+            return
+        if self.player_queue.is_waiting(chat_id, game_data.field_size):
+            return
+        self.ai_executor.cancel(chat_id)
+        async with self.game_lock(chat_id):
+            if self.games.pop(chat_id, None) is None:
+                return
+            await self.forget_chats(chat_id)
+        await self.outbound.send_message(
+            chat_id, "Сессия закрыта из-за неактивности. Напишите /start, чтобы сыграть снова."
+        )
 
+    async def handle_move(self, call, action):
+        chat_id = call.message.chat.id
         if chat_id not in self.games:
-            await self.bot.send_message(
+            await self.outbound.send_message(
                 chat_id, "Игра не найдена. Начните новую игру."
             )
-            logging.error(
-                f"Попытка сделать ход без активной игры: chat_id={chat_id}"
-            )
+            logging.error("Попытка сделать ход без активной игры: chat_id=%s", chat_id)
             return
 
-        game_data = self.games[chat_id]
-        game = game_data["game"]
-        player_symbol = game_data["symbol"]
+        async with self.game_lock(chat_id):
+            await self.process_move(call, action)
+
+    async def process_move(self, call, action):
+        chat_id = call.message.chat.id
+        position = action.position
+        sequence = action.sequence
+
+        # Пока ждали своей очереди, игра могла закончиться
+        game_data = self.games.get(chat_id)
+        if game_data is None or game_data.game is None:
+            await self.bot.answer_callback_query(call.id, "Игра уже завершена.")
+            return
+
+        game = game_data.game
+        player_symbol = game_data.symbol
+
+        if sequence > game.sequence:
+            # Доску рисовал другой процесс: наша копия партии отстала
+            await self.reload_game(chat_id)
+            game = game_data.game
+        if sequence != game.sequence:
+            await self.bot.answer_callback_query(call.id, "Поле уже обновилось. Сделайте ход ещё раз.")
+            return
 
         if game.current_player != player_symbol:
             await self.bot.answer_callback_query(call.id, "Сейчас не ваш ход.")
             return
 
-        if game.make_move(position):
-            opponent_id = game_data.get("opponent")
-            await self.display_board(chat_id)
-            if opponent_id:
-                await self.display_board(opponent_id)
+        with MOVE_SECONDS.time("human"):
+            moved = game.make_move(position)
+        if moved:
+            opponent_id = game_data.opponent
+            if not await self.commit_game(chat_id):
+                await self.bot.answer_callback_query(call.id, "Игра уже изменилась. Попробуйте ещё раз.")
+                await self.display_boards(chat_id, opponent_id)
+                return
+            self.start_turn_clock(chat_id)
+            await self.display_boards(chat_id, opponent_id)
 
             if game.winner:
                 if game.winner == "Draw":
-                    await self.bot.send_message(chat_id, "Поле заполнено. Игровое поле очищено и игра продолжается.")
-                    if opponent_id:
-                        await self.bot.send_message(opponent_id, "Поле заполнено. Игровое поле очищено и игра продолжается.")
-                    game.reset_board()
-                    await self.display_board(chat_id)
-                    if opponent_id:
-                        await self.display_board(opponent_id)
+                    await self.outbound.send_to_all(
+                        (chat_id, opponent_id),
+                        "Поле заполнено. Игровое поле очищено и игра продолжается.",
+                    )
+                    game.reset_board(bot_first=False)
+                    await self.commit_game(chat_id)
+                    self.start_turn_clock(chat_id)
+                    await self.display_boards(chat_id, opponent_id)
 
 
                     if game.mode == "bot" and game.bot_symbol == "X":
-                        game.bot_move()
-                        await self.display_board(chat_id)
-                        if opponent_id:
-                            await self.display_board(opponent_id)
+                        if not await self.make_bot_move(chat_id, game):
+                            return
+                        await self.display_boards(chat_id, opponent_id)
                 else:
                     result_message = f"Победитель: {game.winner}"
-                    await self.bot.send_message(chat_id, result_message)
-                    if opponent_id:
-                        await self.bot.send_message(opponent_id, result_message)
+                    await self.outbound.send_to_all((chat_id, opponent_id), result_message)
 
                     if game.winner != "Draw":
                         winner_id = chat_id if game.winner == player_symbol else opponent_id
+                        self.rate_game(game, chat_id, opponent_id, 1.0 if winner_id == chat_id else 0.0)
                         await self.update_leaderboard(winner_id)
                         leaderboard_text = f"🏆 Победитель: {game.winner}!\n\nОбновленный лидерборд:\n"
-                        leaderboard_text += await self.format_leaderboard()
-                        await self.bot.send_message(chat_id, leaderboard_text)
-                        if opponent_id:
-                            await self.bot.send_message(opponent_id, leaderboard_text)
-
-                    del self.games[chat_id]
-                    if opponent_id in self.games:
-                        del self.games[opponent_id]
+                        leaderboard_text += self.format_leaderboard()
+                        await self.outbound.send_to_all((chat_id, opponent_id), leaderboard_text)
+
+                    self.games.pop(chat_id, None)
+                    self.games.pop(opponent_id, None)
+                    await self.forget_chats(chat_id, opponent_id)
             else:
                 if game.mode == "bot" and game.current_player == game.bot_symbol:
-                    game.bot_move()
+                    if not await self.make_bot_move(chat_id, game):
+                        return
                     await self.display_board(chat_id)
                     if game.winner:
                         if game.winner == "Draw":
-                            await self.bot.send_message(chat_id, "Поле заполнено. Игровое поле очищено и игра продолжается.")
-                            game.reset_board()
+                            await self.outbound.send_message(chat_id, "Поле заполнено. Игровое поле очищено и игра продолжается.")
+                            game.reset_board(bot_first=False)
+                            await self.commit_game(chat_id)
+                            if game.bot_symbol == "X":
+                                if not await self.make_bot_move(chat_id, game):
+                                    return
                             await self.display_board(chat_id)
                         else:
                             result_message = f"Победитель: {game.winner}"
-                            await self.bot.send_message(chat_id, result_message)
-                            del self.games[chat_id]
+                            await self.outbound.send_message(chat_id, result_message)
+                            self.rate_game(game, chat_id, None, 0.0)
+                            self.games.pop(chat_id, None)
+                            await self.forget_chats(chat_id)
         else:
             await self.bot.answer_callback_query(
                 call.id, "Это место уже занято. Выберите другое."
             )
 
-    async def handle_surrender(self, call):
+    def rate_game(self, game, chat_id, opponent_id, score):
+        # score — результат игрока chat_id; без соперника играли против бота
+        if opponent_id:
+            self.ratings.record_game(chat_id, opponent_id, score, game.field_size, "player")
+            GAMES_FINISHED.inc("player", game.field_size)
+        else:
+            bot_id = BOT_IDS.get(game.difficulty, BOT_IDS["easy"])
+            self.ratings.record_game(chat_id, bot_id, score, game.field_size, "bot")
+            GAMES_FINISHED.inc("bot", game.field_size)
+
+    async def make_bot_move(self, chat_id, game):
+        # Ход бота считается вне цикла событий; за это время игрок мог выйти
+        move = await self.ai_executor.choose_move(chat_id, game)
+        game_data = self.games.get(chat_id)
+        if move is None or not game_data or game_data.game is not game:
+            return False
+        if game.current_player != game.bot_symbol:
+            return False
+        with MOVE_SECONDS.time("bot"):
+            moved = game.make_move(move)
+        if not moved:
+            return False
+        return await self.commit_game(chat_id)
+
+    async def handle_viewport(self, call, action):
+        # Сдвиг видимого окна большого поля; у каждого игрока своё окно
+        chat_id = call.message.chat.id
+        direction = action.direction
+        game_data = self.games.get(chat_id)
+        if game_data is None or game_data.game is None or direction not in VIEWPORT_SHIFTS:
+            await self.bot.answer_callback_query(call.id)
+            return
+        game_data.viewport = shift_viewport(game_data.game.field_size, game_data.viewport, direction)
+        await self.bot.answer_callback_query(call.id)
+        await self.display_board(chat_id)
+
+    async def handle_surrender(self, call, action=None):
         chat_id = call.message.chat.id
 
         if chat_id not in self.games:
-            await self.bot.send_message(chat_id, "Игра не найдена. Начните новую игру.")
-            logging.error(
-                f"Попытка сдаться без активной игры: chat_id={chat_id}"
-            )
+            await self.outbound.send_message(chat_id, "Игра не найдена. Начните новую игру.")
+            logging.error("Попытка сдаться без активной игры: chat_id=%s", chat_id)
             return
 
-        game_data = self.games[chat_id]
-        opponent_id = game_data.get("opponent")
+        self.ai_executor.cancel(chat_id)
+        async with self.game_lock(chat_id):
+            await self.process_surrender(chat_id)
+
+    async def process_surrender(
+        self,
+        chat_id,
+        text="Вы сдались. Игра окончена. Увидимся в следующий раз!",
+        opponent_text="Противник сдался. Вы победили! Увидимся в следующий раз.",
+    ):
+        game_data = self.games.get(chat_id)
+        if game_data is None:
+            return
+        opponent_id = game_data.opponent
+        if game_data.game is not None:
+            self.rate_game(game_data.game, chat_id, opponent_id, 0.0)
 
-        await self.bot.send_message(chat_id, "Вы сдались. Игра окончена. Увидимся в следующий раз!")
+        notifications = [self.outbound.send_message(chat_id, text)]
         if opponent_id:
-            await self.bot.send_message(opponent_id, "Противник сдался. Вы победили! Увидимся в следующий раз.")
-            del self.games[opponent_id]
-        del self.games[chat_id]
-
-    async def handle_callback(self, call):
-        chat_id = call.message.chat.id
-        if not self.is_game_active(chat_id):
-            await self.bot.answer_callback_query(call.id, "Игра не начата. Начните новую игру.")
-            await self.send_game_invite(chat_id)
-            return
+            notifications.append(self.outbound.send_message(opponent_id, opponent_text))
+            self.games.pop(opponent_id, None)
+        self.games.pop(chat_id, None)
+        await self.forget_chats(chat_id, opponent_id)
+        await asyncio.gather(*notifications)
 
-        if call.data.startswith("move_"):
-            await self.handle_move(call)
-        elif call.data == "surrender":
-            await self.handle_surrender(call)
-        else:
-            await self.bot.answer_callback_query(call.id, "Неизвестная команда.")
+    async def handle_unknown_callback(self, call, action=None):
+        await self.bot.answer_callback_query(call.id, "Неизвестная команда.")
 
     async def handle_any_text(self, message):
         chat_id = message.chat.id
-        user_input = message.text
-
-        if user_input == '/instruction':
-            await self.send_instruction(chat_id)
-            return
-
-        if user_input == '/leaderboard':
-            await self.send_leaderboard(chat_id)
-            return
 
         if chat_id not in self.games:
 
             await self.send_game_invite(chat_id)
             return
 
-        game_data = self.games[chat_id]
-        game = game_data.get("game")
-        current_state = {
-            "mode": game_data.get("mode"),
-            "field_size": game_data.get("field_size"),
-            "symbol": game_data.get("symbol"),
-            "is_player_turn": game.current_player == game_data["symbol"],
-        }
-
-        if user_input == "Выход" and current_state["mode"]:
-            await self.handle_exit_game(message)
-        elif user_input == "Выйти из очереди" and not current_state["mode"]:
-            await self.handle_exit_from_queue(message)
-        elif user_input in ["Крестик", "Нолик"] and not current_state["symbol"]:
-            await self.handle_symbol_choice(message)
-        elif user_input in ["Поле 3x3", "Поле 4x4"] and not current_state["field_size"]:
-            await self.handle_field_size_choice(message)
-        else:
+        # Точные тексты кнопок разбирает Dispatcher, сюда попадает всё остальное
+        await self.outbound.send_message(
+            chat_id,
+            "Мы уже начали игру! Следуйте инструкциям для текущего этапа игры.",
+        )
 
-            await self.bot.send_message(
-                chat_id,
-                "Мы уже начали игру! Следуйте инструкциям для текущего этапа игры.",
-            )
+    async def start_metrics(self):
+        if self.metrics_server is not None:
+            await self.metrics_server.start()
+
+    async def shutdown(self):
+        self.dispatcher.log_latency()
+        logging.info("Очередь подбора: %s", self.player_queue.wait_stats())
+        await self.timers.stop()
+        if self.metrics_server is not None:
+            await self.metrics_server.stop()
+        await self.outbound.stop()
+        self.ai_executor.shutdown()
+        await self.leaderboard_store.close()
+        await self.ratings.close()
+        await self.session_store.close()
+        await self.bot.close_session()
 
     async def start_polling(self):
-        await self.bot.infinity_polling()
-        await self.set_bot_commands()
+        try:
+            await self.restore_sessions()
+            await self.start_metrics()
+            self.timers.start()
+            await self.bot.infinity_polling()
+            await self.set_bot_commands()
+        finally:
+            await self.shutdown()
+
+    async def start_webhook(self, webhook_url, secret_token, host="127.0.0.1", port=8080):
+        server = WebhookServer(self.bot, secret_token, host=host, port=port)
+        try:
+            await self.restore_sessions()
+            await self.start_metrics()
+            self.timers.start()
+            await server.start(webhook_url)
+            await self.set_bot_commands()
+            await asyncio.Event().wait()
+        finally:
+            await server.stop()
+            await self.shutdown()
 
 if __name__ == "__main__":
-    bot = TicTacToeBot(API_TOKEN)
-    asyncio.run(bot.start_polling())
+    configure_api(os.environ.get("TELEGRAM_API_URL"))
+    session_db = os.environ.get("SESSION_DB")
+    metrics_port = os.environ.get("METRICS_PORT")
+    bot = TicTacToeBot(
+        API_TOKEN,
+        session_store=SQLiteSessionStore(session_db) if session_db else None,
+        metrics_port=int(metrics_port) if metrics_port else None,
+    )
+    webhook_url = os.environ.get("WEBHOOK_URL")
+    if webhook_url:
+        asyncio.run(bot.start_webhook(
+            webhook_url,
+            os.environ["WEBHOOK_SECRET"],
+            host=os.environ.get("WEBHOOK_HOST", "127.0.0.1"),
+            port=int(os.environ.get("WEBHOOK_PORT", "8080")),
+        ))
+    else:
+        asyncio.run(bot.start_polling())
@@ -3,28 +3,29 @@ import random
 class TicTacToeAI:
     @staticmethod
     def get_best_move(game):
-        board = game.get_board()
-        empty_positions = [i for i, cell in enumerate(board) if cell == '']
+        if game.difficulty == "hard":
+            return game.choose_search_move()
+        if game.difficulty == "mcts":
+            return game.choose_mcts_move()
+
+        empty_positions = game.empty_positions()
+        bot_bits = game.bits(game.bot_symbol)
+        player_bits = game.bits(game.player_symbol)
 
 
         for move in empty_positions:
-            board[move] = game.bot_symbol
-            if game.check_winner():
-                board[move] = ''
+            if game.has_line_through(bot_bits | 1 << move, move):
                 return move
-            board[move] = ''
 
 
         for move in empty_positions:
-            board[move] = game.player_symbol
-            if game.check_winner():
-                board[move] = ''
+            if game.has_line_through(player_bits | 1 << move, move):
                 return move
-            board[move] = ''
 
 
         center = (game.field_size * game.field_size) // 2
-        if game.field_size % 2 == 1 and board[center] == '':
+        occupied = bot_bits | player_bits
+        if game.field_size % 2 == 1 and not occupied >> center & 1:
             return center
 
 
@@ -0,0 +1,32 @@
+# Поля записи чата в хранилище, в фиксированном порядке
+SESSION_FIELDS = ("mode", "field_size", "difficulty", "symbol", "opponent", "message_id", "game_key")
+
+
+class ChatSession:
+    # Состояние одного чата: выбранные настройки и ссылка на общую игру
+    __slots__ = SESSION_FIELDS + ("game", "rendered", "viewport")
+
+    def __init__(self, mode=None, field_size=None, difficulty=None, symbol=None,
+                 opponent=None, message_id=None, game_key=None, game=None):
+        self.mode = mode
+        self.field_size = field_size
+        self.difficulty = difficulty
+        self.symbol = symbol
+        self.opponent = opponent
+        self.message_id = message_id
+        self.game_key = game_key
+        self.game = game
+        self.rendered = None
+        # Видимое окно большого поля (верхняя строка, левый столбец); не сохраняется
+        self.viewport = None
+
+    def to_record(self):
+        # Запись — список значений в порядке SESSION_FIELDS, без имён полей
+        return [getattr(self, field) for field in SESSION_FIELDS]
+
+    @classmethod
+    def from_record(cls, record):
+        # Старые записи хранились словарём с именами полей
+        if isinstance(record, dict):
+            return cls(**{field: record.get(field) for field in SESSION_FIELDS})
+        return cls(*record)
@@ -0,0 +1,100 @@
+import logging
+import time
+from collections import namedtuple
+
+from metrics import REGISTRY
+
+# Разобранные данные инлайн-кнопок
+MoveAction = namedtuple("MoveAction", "position sequence")
+PageAction = namedtuple("PageAction", "page")
+ViewAction = namedtuple("ViewAction", "direction")
+SurrenderAction = namedtuple("SurrenderAction", "")
+
+
+def parse_move(data):
+    # move_<клетка>_<номер состояния>; у старых кнопок номера нет
+    parts = data.split("_")
+    sequence = int(parts[2]) if len(parts) > 2 else None
+    return MoveAction(int(parts[1]), sequence)
+
+
+def parse_page(data):
+    return PageAction(int(data.split("_", 1)[1]))
+
+
+def parse_view(data):
+    return ViewAction(data.split("_", 1)[1])
+
+
+def parse_surrender(data):
+    return SurrenderAction()
+
+
+class Dispatcher:
+    # Обработчик находится одним поиском в словаре: по точному тексту,
+    # по команде или по префиксу данных инлайн-кнопки
+    def __init__(self, fallback_message, fallback_callback, registry=REGISTRY):
+        self.texts = {}
+        self.commands = {}
+        self.callbacks = {}  # Ключ: префикс, значение: (разбор данных, обработчик)
+        self.fallback_message = fallback_message
+        self.fallback_callback = fallback_callback
+        self.latency = registry.histogram(
+            "bot_handler_seconds", "Время обработки обновления", ("handler",)
+        )
+        self.updates = registry.counter("bot_updates_total", "Обработанные обновления", ("type",))
+
+    def on_text(self, texts, handler):
+        for text in texts:
+            self.texts[text] = handler
+
+    def on_command(self, commands, handler):
+        for command in commands:
+            self.commands[command] = handler
+
+    def on_callback(self, prefix, parser, handler):
+        self.callbacks[prefix] = (parser, handler)
+
+    def route_message(self, text):
+        if text.startswith("/"):
+            # /command@bot_name аргументы
+            command = text[1:].split(maxsplit=1)[0].split("@", 1)[0] if len(text) > 1 else ""
+            return self.commands.get(command, self.fallback_message)
+        return self.texts.get(text, self.fallback_message)
+
+    def route_callback(self, data):
+        route = self.callbacks.get(data.split("_", 1)[0])
+        if route is None:
+            return self.fallback_callback, None
+        parser, handler = route
+        try:
+            return handler, parser(data)
+        except (ValueError, IndexError):
+            return self.fallback_callback, None
+
+    async def dispatch_message(self, message):
+        handler = self.route_message(message.text or "")
+        self.updates.inc("message")
+        await self.timed(handler, message)
+
+    async def dispatch_callback(self, call):
+        handler, action = self.route_callback(call.data or "")
+        self.updates.inc("callback_query")
+        await self.timed(handler, call, action)
+
+    async def timed(self, handler, *args):
+        started = time.perf_counter()
+        try:
+            await handler(*args)
+        finally:
+            self.latency.observe(time.perf_counter() - started, handler.__name__)
+
+    def latency_stats(self):
+        return {labels[0]: series.snapshot() for labels, series in self.latency.series.items()}
+
+    def log_latency(self):
+        for name, stats in sorted(self.latency_stats().items()):
+            logging.info(
+                "%s: %d вызовов, в среднем %.1f мс, p50 ≤ %s с, p99 ≤ %s с",
+                name, stats["count"], stats["avg"] * 1000, stats["p50"], stats["p99"],
+            )
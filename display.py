@@ -1,27 +1,103 @@
+from functools import lru_cache
+
 from telebot import types
 
-def format_board_as_emoji(board, field_size):
-    symbols = {"X": "❌", "O": "⭕", "": "⬜"}
-    display = ""
-    for i, cell in enumerate(board):
-        display += symbols[cell]
-        if (i + 1) % field_size == 0:
-            display += "\n"
-    return display
-
-def create_game_keyboard(board, field_size, game_over=False):
-    keyboard = types.InlineKeyboardMarkup(row_width=field_size)
+SYMBOLS = {"X": "❌", "O": "⭕", "": "⬜"}
+# Пустые клетки большого поля вне окна с кнопками
+OUTSIDE_SYMBOL = "⬛"
+
+RENDER_CACHE_SIZE = 4096
+
+# В строке инлайн-клавиатуры не больше 8 кнопок, поэтому большие поля
+# показываются окном 8x8, которое игрок сдвигает стрелками
+VIEWPORT_SIZE = 8
+VIEWPORT_STEP = VIEWPORT_SIZE // 2
+VIEWPORT_SHIFTS = {
+    "left": (0, -VIEWPORT_STEP),
+    "up": (-VIEWPORT_STEP, 0),
+    "down": (VIEWPORT_STEP, 0),
+    "right": (0, VIEWPORT_STEP),
+}
+VIEWPORT_ARROWS = {"left": "⬅", "up": "⬆", "down": "⬇", "right": "➡"}
+
+
+def needs_viewport(field_size):
+    return field_size > VIEWPORT_SIZE
+
+
+def clamp_viewport(field_size, top, left):
+    last = field_size - VIEWPORT_SIZE
+    return min(max(top, 0), last), min(max(left, 0), last)
+
+
+def default_viewport(field_size):
+    start = (field_size - VIEWPORT_SIZE) // 2
+    return clamp_viewport(field_size, start, start)
+
+
+def shift_viewport(field_size, viewport, direction):
+    d_row, d_col = VIEWPORT_SHIFTS[direction]
+    top, left = viewport or default_viewport(field_size)
+    return clamp_viewport(field_size, top + d_row, left + d_col)
+
+
+def format_board_as_emoji(board, field_size, viewport=None):
+    if viewport is not None:
+        return "".join(format_row(board, field_size, row, viewport) for row in range(field_size))
+
+    rows = []
+    for start in range(0, len(board), field_size):
+        rows.append("".join(SYMBOLS[cell] for cell in board[start:start + field_size]))
+        rows.append("\n")
+    return "".join(rows)
+
+
+def format_row(board, field_size, row, viewport):
+    # Окно с кнопками выделено светлыми клетками, остальное поле — тёмными
+    top, left = viewport
+    inside_row = top <= row < top + VIEWPORT_SIZE
+    cells = []
+    for col in range(field_size):
+        cell = board[row * field_size + col]
+        if cell == "" and not (inside_row and left <= col < left + VIEWPORT_SIZE):
+            cells.append(OUTSIDE_SYMBOL)
+        else:
+            cells.append(SYMBOLS[cell])
+    return "".join(cells) + "\n"
+
+def viewport_cells(field_size, viewport):
+    if viewport is None:
+        return range(field_size * field_size)
+    top, left = viewport
+    return [
+        row * field_size + col
+        for row in range(top, top + VIEWPORT_SIZE)
+        for col in range(left, left + VIEWPORT_SIZE)
+    ]
+
+
+def create_game_keyboard(board, field_size, game_over=False, sequence=0, viewport=None):
+    row_width = field_size if viewport is None else VIEWPORT_SIZE
+    keyboard = types.InlineKeyboardMarkup(row_width=row_width)
     buttons = []
 
-    for i, cell in enumerate(board):
-        emoji = "❌" if cell == "X" else "⭕" if cell == "O" else "⬜"
-        callback_data = f"move_{i}" if not game_over and cell == "" else "disabled"
+    for i in viewport_cells(field_size, viewport):
+        cell = board[i]
+        emoji = SYMBOLS[cell]
+        # Номер состояния в callback_data отсекает нажатия по устаревшей доске
+        callback_data = f"move_{i}_{sequence}" if not game_over and cell == "" else "disabled"
         buttons.append(
             types.InlineKeyboardButton(emoji, callback_data=callback_data)
         )
 
     keyboard.add(*buttons)
 
+    if viewport is not None:
+        keyboard.add(*(
+            types.InlineKeyboardButton(arrow, callback_data=f"view_{direction}")
+            for direction, arrow in VIEWPORT_ARROWS.items()
+        ))
+
     if not game_over:
 
         keyboard.add(
@@ -29,3 +105,36 @@ def create_game_keyboard(board, field_size, game_over=False):
         )
 
     return keyboard
+
+
+@lru_cache(maxsize=RENDER_CACHE_SIZE)
+def _render_game(board_state, field_size, game_over, sequence, viewport):
+    keyboard = create_game_keyboard(board_state, field_size, game_over, sequence, viewport)
+    text = format_board_as_emoji(board_state, field_size, viewport)
+    if viewport is not None:
+        text += "Ходить можно в светлой области, стрелки сдвигают её."
+    return text, keyboard.to_json()
+
+
+def render_game(board, field_size, game_over=False, sequence=0, viewport=None):
+    # Текст и уже сериализованная клавиатура для одинаковых досок берутся из кэша
+    if needs_viewport(field_size):
+        viewport = viewport or default_viewport(field_size)
+    else:
+        viewport = None
+    return _render_game(tuple(board), field_size, game_over, sequence, viewport)
+
+
+def create_leaderboard_keyboard(page, pages_count):
+    keyboard = types.InlineKeyboardMarkup(row_width=2)
+    buttons = []
+    if page > 0:
+        buttons.append(
+            types.InlineKeyboardButton("◀", callback_data=f"leaderboard_{page - 1}")
+        )
+    if page + 1 < pages_count:
+        buttons.append(
+            types.InlineKeyboardButton("▶", callback_data=f"leaderboard_{page + 1}")
+        )
+    keyboard.add(*buttons)
+    return keyboard
@@ -1,30 +1,130 @@
 import random
 
+from lines import (
+    MASK_FIELD_LIMIT,
+    board_to_bits,
+    candidate_moves,
+    get_cell_lines,
+    get_line_masks,
+    has_line_at,
+    iter_bits,
+    winning_length_for,
+)
+from mcts import find_mcts_move
+from search import find_best_move
+
+
 class TicTacToeGame:
-    def __init__(self, player_symbol, mode="player", field_size=3):
+    # Без __dict__ у каждой игры: на десятках тысяч партий это заметная экономия памяти
+    __slots__ = (
+        "field_size", "board_size", "winning_length", "player_symbol", "current_player",
+        "mode", "difficulty", "winner", "line_masks", "cell_lines",
+        "x_bits", "o_bits", "moves_count", "version", "sequence",
+    )
+
+    def __init__(self, player_symbol, mode="player", field_size=3, difficulty="easy",
+                 winning_length=None):
         self.field_size = field_size
         self.board_size = field_size * field_size
-        self.board = [""] * self.board_size
         self.player_symbol = player_symbol
-        self.bot_symbol = "O" if player_symbol == "X" else "X"
         self.current_player = "X"
         self.mode = mode
+        self.difficulty = difficulty
         self.winner = None
 
-        if field_size == 3:
-            self.winning_length = 3
-        elif field_size == 4:
-            self.winning_length = 3
+        self.winning_length = winning_length or winning_length_for(field_size)
+
+        # Маски линий нужны только малым полям; большие проверяются обходом от последнего хода
+        if field_size <= MASK_FIELD_LIMIT:
+            self.line_masks = get_line_masks(field_size, self.winning_length)
+            self.cell_lines = get_cell_lines(field_size, self.winning_length)
         else:
-            self.winning_length = field_size
+            self.line_masks = None
+            self.cell_lines = None
+        self.moves_count = 0
+        # Доска хранится только двумя битовыми масками: позиции крестиков и ноликов
+        self.x_bits = 0
+        self.o_bits = 0
+        # Версия сохранённого снимка для оптимистичной блокировки
+        self.version = 0
+        # Номер состояния доски: растёт с каждым ходом и очисткой поля
+        self.sequence = 0
+
+    @property
+    def bot_symbol(self):
+        return "O" if self.player_symbol == "X" else "X"
+
+    def bits(self, symbol):
+        return self.x_bits if symbol == "X" else self.o_bits
 
     def get_board(self):
-        return self.board
+        # Список клеток собирается из масок только для отрисовки
+        board = []
+        for position in range(self.board_size):
+            if self.x_bits >> position & 1:
+                board.append("X")
+            elif self.o_bits >> position & 1:
+                board.append("O")
+            else:
+                board.append("")
+        return board
+
+    board = property(get_board)
+
+    def empty_positions(self):
+        occupied = self.x_bits | self.o_bits
+        return [i for i in range(self.board_size) if not occupied >> i & 1]
+
+    def candidate_positions(self):
+        # На больших полях бот рассматривает только клетки рядом с камнями
+        if self.cell_lines is not None:
+            return self.empty_positions()
+        return candidate_moves(self.x_bits, self.o_bits, self.field_size, radius=1)
+
+    def to_snapshot(self):
+        return [
+            self.field_size,
+            self.mode,
+            self.difficulty,
+            self.player_symbol,
+            self.x_bits,
+            self.o_bits,
+            self.current_player,
+            self.winner,
+            self.sequence,
+            self.winning_length,
+        ]
+
+    @classmethod
+    def from_snapshot(cls, snapshot, version=0):
+        (field_size, mode, difficulty, player_symbol, x_bits, o_bits,
+         current_player, winner, sequence) = snapshot[:9]
+        # В старых снимках длины линии нет, она следует из размера поля
+        winning_length = snapshot[9] if len(snapshot) > 9 else None
+        game = cls(
+            player_symbol, mode=mode, field_size=field_size, difficulty=difficulty,
+            winning_length=winning_length,
+        )
+        game.x_bits = x_bits
+        game.o_bits = o_bits
+        game.moves_count = bin(x_bits | o_bits).count("1")
+        game.current_player = current_player
+        game.winner = winner
+        game.sequence = sequence
+        game.version = version
+        return game
 
     def make_move(self, position):
-        if self.board[position] == "" and self.winner is None:
-            self.board[position] = self.current_player
-            if self.check_winner():
+        if not 0 <= position < self.board_size or self.winner is not None:
+            return False
+        if not (self.x_bits | self.o_bits) >> position & 1:
+            if self.current_player == "X":
+                self.x_bits |= 1 << position
+            else:
+                self.o_bits |= 1 << position
+            self.moves_count += 1
+            self.sequence += 1
+            if self.has_line_through(self.bits(self.current_player), position):
                 self.winner = self.current_player
             elif self.is_draw():
                 self.winner = "Draw"
@@ -33,11 +133,14 @@ class TicTacToeGame:
             return True
         return False
 
-    def reset_board(self):
-        self.board = [""] * self.board_size
+    def reset_board(self, bot_first=True):
+        self.x_bits = 0
+        self.o_bits = 0
+        self.moves_count = 0
+        self.sequence += 1
         self.winner = None
         self.current_player = "X"
-        if self.mode == "bot" and self.bot_symbol == "X":
+        if bot_first and self.mode == "bot" and self.bot_symbol == "X":
             self.bot_move()
 
     def switch_player(self):
@@ -45,72 +148,92 @@ class TicTacToeGame:
 
     def bot_move(self):
         if self.mode == "bot" and self.current_player == self.bot_symbol:
-            empty_positions = [
-                i for i, cell in enumerate(self.board) if cell == ""
-            ]
-
-            winning_moves = []
-            for move in empty_positions:
-                board_copy = self.board.copy()
-                board_copy[move] = self.bot_symbol
-                if self.is_winner(board_copy, self.bot_symbol):
-                    winning_moves.append(move)
-
-            blocking_moves = []
-            for move in empty_positions:
-                board_copy = self.board.copy()
-                board_copy[move] = self.player_symbol
-                if self.is_winner(board_copy, self.player_symbol):
-                    blocking_moves.append(move)
-
-            possible_moves = []
-            if winning_moves and blocking_moves:
-                choice = random.choice(["win", "block"])
-                if choice == "win":
-                    possible_moves = winning_moves
-                else:
-                    possible_moves = blocking_moves
-            elif winning_moves:
-                possible_moves = winning_moves
-            elif blocking_moves:
-                possible_moves = blocking_moves
+            if self.difficulty == "hard":
+                move = self.choose_search_move()
+            elif self.difficulty == "mcts":
+                move = self.choose_mcts_move()
             else:
-                possible_moves = empty_positions
+                move = self.choose_heuristic_move()
 
-            if possible_moves:
-                move = random.choice(possible_moves)
+            if move is not None:
                 self.make_move(move)
 
-    def check_winner(self):
-        return self.is_winner(self.board, self.current_player)
-
-    def is_winner(self, board, symbol):
-        lines = []
-
-
-        for row in range(self.field_size):
-            for col in range(self.field_size - self.winning_length + 1):
-                lines.append([row * self.field_size + col + i for i in range(self.winning_length)])
-
-
-        for col in range(self.field_size):
-            for row in range(self.field_size - self.winning_length + 1):
-                lines.append([(row + i) * self.field_size + col for i in range(self.winning_length)])
-
+    def choose_search_move(self):
+        return find_best_move(*self.get_state())
+
+    def choose_mcts_move(self):
+        # Дерево поиска переиспользуется между ходами этой партии
+        return find_mcts_move(*self.get_state(), tree_key=id(self))
+
+    def get_state(self):
+        # Компактное состояние для передачи в процессы вычисления хода
+        return (
+            self.field_size,
+            self.winning_length,
+            self.x_bits,
+            self.o_bits,
+            self.current_player,
+        )
+
+    def choose_heuristic_move(self):
+        empty_positions = self.candidate_positions()
+
+        bot_bits = self.bits(self.bot_symbol)
+        player_bits = self.bits(self.player_symbol)
+
+        winning_moves = [
+            move for move in empty_positions
+            if self.has_line_through(bot_bits | 1 << move, move)
+        ]
+
+        blocking_moves = [
+            move for move in empty_positions
+            if self.has_line_through(player_bits | 1 << move, move)
+        ]
+
+        possible_moves = []
+        if winning_moves and blocking_moves:
+            choice = random.choice(["win", "block"])
+            if choice == "win":
+                possible_moves = winning_moves
+            else:
+                possible_moves = blocking_moves
+        elif winning_moves:
+            possible_moves = winning_moves
+        elif blocking_moves:
+            possible_moves = blocking_moves
+        else:
+            possible_moves = empty_positions
 
-        for row in range(self.field_size - self.winning_length + 1):
-            for col in range(self.field_size - self.winning_length + 1):
-                lines.append([(row + i) * self.field_size + col + i for i in range(self.winning_length)])
+        if possible_moves:
+            return random.choice(possible_moves)
+        return None
 
+    def check_winner(self):
+        return self.has_line(self.bits(self.current_player))
 
-        for row in range(self.field_size - self.winning_length + 1):
-            for col in range(self.winning_length - 1, self.field_size):
-                lines.append([(row + i) * self.field_size + col - i for i in range(self.winning_length)])
+    def is_winner(self, board, symbol):
+        return self.has_line(board_to_bits(board, symbol))
+
+    def has_line(self, bits):
+        if self.line_masks is None:
+            return any(
+                has_line_at(bits, self.field_size, self.winning_length, position)
+                for position in iter_bits(bits)
+            )
+        for mask in self.line_masks:
+            if bits & mask == mask:
+                return True
+        return False
 
-        for line in lines:
-            if all(board[pos] == symbol for pos in line):
+    def has_line_through(self, bits, position):
+        # Достаточно проверить линии, проходящие через последний ход
+        if self.cell_lines is None:
+            return has_line_at(bits, self.field_size, self.winning_length, position)
+        for mask in self.cell_lines[position]:
+            if bits & mask == mask:
                 return True
         return False
 
     def is_draw(self):
-        return all(cell != "" for cell in self.board) and self.winner is None
+        return self.moves_count == self.board_size and self.winner is None
@@ -0,0 +1,60 @@
+import random
+
+from lines import DIRECTIONS, candidate_moves, has_line_at
+
+# Защита чуть дешевле атаки: при равных угрозах бот строит свою линию
+DEFENCE_WEIGHT = 0.9
+
+
+def run_length(bits, blockers, field_size, position, d_row, d_col):
+    # Длина ряда камней bits от position и свободна ли клетка за ним
+    row, col = divmod(position, field_size)
+    count = 0
+    while True:
+        row += d_row
+        col += d_col
+        if not (0 <= row < field_size and 0 <= col < field_size):
+            return count, False
+        cell = row * field_size + col
+        if bits >> cell & 1:
+            count += 1
+        else:
+            return count, not blockers >> cell & 1
+
+
+def line_value(bits, blockers, field_size, winning_length, position):
+    value = 0
+    for d_row, d_col in DIRECTIONS:
+        forward, open_forward = run_length(bits, blockers, field_size, position, d_row, d_col)
+        backward, open_backward = run_length(bits, blockers, field_size, position, -d_row, -d_col)
+        open_ends = open_forward + open_backward
+        if not open_ends:
+            continue
+        # Открытая с двух сторон линия стоит вчетверо дороже полуоткрытой
+        length = min(1 + forward + backward, winning_length - 1)
+        value += 10 ** (length + 5 - winning_length) * open_ends * open_ends
+    return value
+
+
+def best_move(field_size, winning_length, x_bits, o_bits, symbol, rng=random):
+    me, opp = (x_bits, o_bits) if symbol == "X" else (o_bits, x_bits)
+    candidates = candidate_moves(x_bits, o_bits, field_size)
+
+    for position in candidates:
+        if has_line_at(me | 1 << position, field_size, winning_length, position):
+            return position
+    for position in candidates:
+        if has_line_at(opp | 1 << position, field_size, winning_length, position):
+            return position
+
+    best_score = -1
+    best_moves = []
+    for position in candidates:
+        score = line_value(me, opp, field_size, winning_length, position)
+        score += DEFENCE_WEIGHT * line_value(opp, me, field_size, winning_length, position)
+        if score > best_score:
+            best_score = score
+            best_moves = [position]
+        elif score == best_score:
+            best_moves.append(position)
+    return rng.choice(best_moves) if best_moves else None
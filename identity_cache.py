@@ -0,0 +1,48 @@
+import time
+from collections import OrderedDict
+
+
+def display_name(user, user_id):
+    if user.username:
+        return user.username.lstrip('@')
+    if user.first_name:
+        return user.first_name
+    return f"User_{user_id}"
+
+
+class IdentityCache:
+    def __init__(self, max_size=10_000, ttl=3600):
+        self.max_size = max_size
+        self.ttl = ttl
+        self.entries = OrderedDict()  # Ключ: ID пользователя, значение: (имя, срок действия)
+
+    def remember(self, user):
+        if user is None:
+            return
+        self.put(user.id, display_name(user, user.id))
+
+    def put(self, user_id, name):
+        self.entries[user_id] = (name, time.monotonic() + self.ttl)
+        self.entries.move_to_end(user_id)
+        while len(self.entries) > self.max_size:
+            self.entries.popitem(last=False)
+
+    def get(self, user_id):
+        entry = self.entries.get(user_id)
+        if entry is None:
+            return None
+        name, expires = entry
+        if expires < time.monotonic():
+            del self.entries[user_id]
+            return None
+        self.entries.move_to_end(user_id)
+        return name
+
+    async def resolve(self, user_id, bot):
+        # Запрос get_chat только если имени нет в кэше
+        name = self.get(user_id)
+        if name is None:
+            user = await bot.get_chat(user_id)
+            name = display_name(user, user_id)
+            self.put(user_id, name)
+        return name
@@ -12,11 +12,37 @@ game_mode_keyboard = types.ReplyKeyboardMarkup(
 )
 game_mode_keyboard.add("Против бота", "Против игрока", "Выход")
 
+# Кнопки выбора размера поля и соответствующие им размеры
+FIELD_SIZE_CHOICES = {
+    "Поле 3x3": 3,
+    "Поле 4x4": 4,
+    "Поле 5x5": 5,
+    "Поле 7x7": 7,
+    "Поле 10x10": 10,
+    "Гомоку 15x15": 15,
+}
+
 # Клавиатура выбора размера поля
 field_size_keyboard = types.ReplyKeyboardMarkup(
     resize_keyboard=True, one_time_keyboard=True
 )
-field_size_keyboard.row("Поле 3x3", "Поле 4x4", "Выход")
+field_size_keyboard.row("Поле 3x3", "Поле 4x4", "Поле 5x5")
+field_size_keyboard.row("Поле 7x7", "Поле 10x10", "Гомоку 15x15")
+field_size_keyboard.row("Выход")
+
+# Кнопки выбора сложности бота
+DIFFICULTY_CHOICES = {
+    "Лёгкий бот": "easy",
+    "Сильный бот": "hard",
+    "Бот Монте-Карло": "mcts",
+}
+
+# Клавиатура выбора сложности бота
+difficulty_keyboard = types.ReplyKeyboardMarkup(
+    resize_keyboard=True, one_time_keyboard=True
+)
+difficulty_keyboard.row("Лёгкий бот", "Сильный бот", "Бот Монте-Карло")
+difficulty_keyboard.row("Выход")
 
 # Клавиатура выбора символа
 play_keyboard = types.ReplyKeyboardMarkup(
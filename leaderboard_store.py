@@ -0,0 +1,76 @@
+import json
+import logging
+import os
+
+from sqlite_store import BatchedSQLiteStore
+
+
+class LeaderboardStore(BatchedSQLiteStore):
+    def __init__(self, path="leaderboard.db", json_path="leaderboard.json", flush_delay=1.0):
+        super().__init__(path, flush_delay)
+        self.json_path = json_path
+        self.pending = {}  # Ключ: ID игрока, значение: (ещё не записанные победы, имя)
+
+    def open(self):
+        self.connect()
+        with self.connection:
+            self.connection.execute(
+                "CREATE TABLE IF NOT EXISTS leaderboard ("
+                "identifier TEXT PRIMARY KEY, wins INTEGER NOT NULL, name TEXT)"
+            )
+            columns = [row[1] for row in self.connection.execute("PRAGMA table_info(leaderboard)")]
+            if "name" not in columns:
+                self.connection.execute("ALTER TABLE leaderboard ADD COLUMN name TEXT")
+        self.import_json()
+
+    def import_json(self):
+        # Переносит старый leaderboard.json, если база ещё пустая.
+        # В нём записи хранились по имени, поэтому имя остаётся и ключом
+        if not os.path.exists(self.json_path):
+            return
+        count = self.connection.execute("SELECT COUNT(*) FROM leaderboard").fetchone()[0]
+        if count:
+            return
+
+        with open(self.json_path, "r", encoding="utf-8") as file:
+            data = json.load(file)
+        with self.connection:
+            self.connection.executemany(
+                "INSERT INTO leaderboard (identifier, wins, name) VALUES (?, ?, ?)",
+                [(str(identifier), int(wins), str(identifier)) for identifier, wins in data.items()],
+            )
+        logging.info("Импортировано записей из %s: %d", self.json_path, len(data))
+
+    def load(self):
+        wins = {}
+        names = {}
+        rows = self.connection.execute("SELECT identifier, wins, name FROM leaderboard")
+        for identifier, count, name in rows:
+            wins[identifier] = count
+            names[identifier] = name or identifier
+        return wins, names
+
+    def increment(self, identifier, name, amount=1):
+        count = self.pending.get(identifier, (0, name))[0]
+        self.pending[identifier] = (count + amount, name)
+        self.schedule_flush()
+
+    def take_batch(self):
+        if not self.pending:
+            return None
+        batch, self.pending = self.pending, {}
+        return batch
+
+    def restore_batch(self, batch):
+        for identifier, (amount, name) in batch.items():
+            count = self.pending.get(identifier, (0, name))[0]
+            self.pending[identifier] = (count + amount, name)
+
+    def write_batch(self, batch):
+        with self.connection:
+            self.connection.executemany(
+                "INSERT INTO leaderboard (identifier, wins, name) VALUES (?, ?, ?) "
+                "ON CONFLICT(identifier) DO UPDATE SET "
+                "wins = wins + excluded.wins, name = excluded.name",
+                [(identifier, amount, name) for identifier, (amount, name) in batch.items()],
+            )
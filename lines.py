@@ -0,0 +1,140 @@
+# Маски выигрышных линий, посчитанные один раз для пары (размер поля, длина линии)
+_line_masks_cache = {}
+
+
+def get_line_masks(field_size, winning_length):
+    key = (field_size, winning_length)
+    masks = _line_masks_cache.get(key)
+    if masks is not None:
+        return masks
+
+    lines = []
+    last = field_size - winning_length + 1
+
+    for row in range(field_size):
+        for col in range(last):
+            lines.append([row * field_size + col + i for i in range(winning_length)])
+
+    for col in range(field_size):
+        for row in range(last):
+            lines.append([(row + i) * field_size + col for i in range(winning_length)])
+
+    for row in range(last):
+        for col in range(last):
+            lines.append([(row + i) * field_size + col + i for i in range(winning_length)])
+
+    for row in range(last):
+        for col in range(winning_length - 1, field_size):
+            lines.append([(row + i) * field_size + col - i for i in range(winning_length)])
+
+    masks = tuple(sum(1 << pos for pos in line) for line in lines)
+    _line_masks_cache[key] = masks
+    return masks
+
+
+# Для каждой клетки — только те линии, которые через неё проходят
+_cell_lines_cache = {}
+
+
+def get_cell_lines(field_size, winning_length):
+    key = (field_size, winning_length)
+    cell_lines = _cell_lines_cache.get(key)
+    if cell_lines is not None:
+        return cell_lines
+
+    masks = get_line_masks(field_size, winning_length)
+    cell_lines = tuple(
+        tuple(mask for mask in masks if mask >> pos & 1)
+        for pos in range(field_size * field_size)
+    )
+    _cell_lines_cache[key] = cell_lines
+    return cell_lines
+
+
+def board_to_bits(board, symbol):
+    bits = 0
+    for i, cell in enumerate(board):
+        if cell == symbol:
+            bits |= 1 << i
+    return bits
+
+
+# Размер поля и длина выигрышной линии: на больших полях — пять в ряд, как в гомоку
+WINNING_LENGTHS = {3: 3, 4: 3, 5: 4, 7: 5, 10: 5, 15: 5}
+MAX_FIELD_SIZE = 15
+# До этого размера выигрыш проверяется масками линий, дальше — обходом по направлениям
+MASK_FIELD_LIMIT = 5
+
+DIRECTIONS = ((0, 1), (1, 0), (1, 1), (1, -1))
+
+
+def winning_length_for(field_size):
+    length = WINNING_LENGTHS.get(field_size)
+    if length is not None:
+        return length
+    return min(field_size, 5)
+
+
+def count_in_direction(bits, field_size, position, d_row, d_col):
+    # Сколько подряд камней из bits стоит от position в направлении (d_row, d_col)
+    row, col = divmod(position, field_size)
+    count = 0
+    row += d_row
+    col += d_col
+    while 0 <= row < field_size and 0 <= col < field_size and bits >> (row * field_size + col) & 1:
+        count += 1
+        row += d_row
+        col += d_col
+    return count
+
+
+def has_line_at(bits, field_size, winning_length, position):
+    # Проверяет только четыре направления через последний ход
+    for d_row, d_col in DIRECTIONS:
+        count = 1 + count_in_direction(bits, field_size, position, d_row, d_col)
+        count += count_in_direction(bits, field_size, position, -d_row, -d_col)
+        if count >= winning_length:
+            return True
+    return False
+
+
+_neighbourhoods_cache = {}
+
+
+def get_neighbourhoods(field_size, radius):
+    # Для каждой клетки — маска клеток на расстоянии не больше radius
+    key = (field_size, radius)
+    neighbourhoods = _neighbourhoods_cache.get(key)
+    if neighbourhoods is not None:
+        return neighbourhoods
+
+    masks = []
+    for position in range(field_size * field_size):
+        row, col = divmod(position, field_size)
+        mask = 0
+        for near_row in range(max(row - radius, 0), min(row + radius + 1, field_size)):
+            for near_col in range(max(col - radius, 0), min(col + radius + 1, field_size)):
+                mask |= 1 << (near_row * field_size + near_col)
+        masks.append(mask)
+    neighbourhoods = tuple(masks)
+    _neighbourhoods_cache[key] = neighbourhoods
+    return neighbourhoods
+
+
+def iter_bits(bits):
+    while bits:
+        low = bits & -bits
+        yield low.bit_length() - 1
+        bits ^= low
+
+
+def candidate_moves(x_bits, o_bits, field_size, radius=2):
+    # Свободные клетки рядом с уже стоящими камнями; на пустом поле — центр
+    occupied = x_bits | o_bits
+    if not occupied:
+        return [(field_size // 2) * field_size + field_size // 2]
+    neighbourhoods = get_neighbourhoods(field_size, radius)
+    near = 0
+    for position in iter_bits(occupied):
+        near |= neighbourhoods[position]
+    return list(iter_bits(near & ~occupied))
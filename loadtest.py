@@ -0,0 +1,545 @@
+import argparse
+import asyncio
+import itertools
+import json
+import logging
+import os
+import random
+import tempfile
+import time
+from collections import Counter, deque, namedtuple
+from urllib.parse import parse_qsl
+
+from aiohttp import web
+
+from display import SYMBOLS
+from keyboards import FIELD_SIZE_CHOICES
+from outbound import TokenBucket
+
+TOKEN = "100000:loadtest"
+FIELD_SIZE_TEXTS = {size: text for text, size in FIELD_SIZE_CHOICES.items()}
+# Сообщения, после которых партия для игрока закончена
+GAME_OVER_TEXTS = (
+    "Победитель", "Противник сдался", "Противник вышел", "Противник не сделал ход",
+    "Вы сдались", "Вы вышли", "Время на ход вышло", "Сессия закрыта", "Игра не найдена",
+)
+
+# Что пользователь получил от бота: сообщение, правку сообщения или ответ на нажатие кнопки
+Event = namedtuple("Event", "kind text markup message_id")
+
+
+class FaultInjector:
+    # Задержка каждого запроса и ответы 429: случайные и при превышении общего лимита
+    def __init__(self, latency=0.0, jitter=0.0, throttle_share=0.0, retry_after=1, api_rate=0.0, rng=None):
+        self.latency = latency
+        self.jitter = jitter
+        self.throttle_share = throttle_share
+        self.retry_after = retry_after
+        self.bucket = TokenBucket(api_rate, api_rate) if api_rate else None
+        self.rng = rng or random.Random()
+
+    async def apply(self):
+        # Возвращает retry_after, если запрос нужно отклонить с кодом 429
+        delay = self.latency + self.rng.uniform(0, self.jitter) if self.jitter else self.latency
+        if delay:
+            await asyncio.sleep(delay)
+        if self.throttle_share and self.rng.random() < self.throttle_share:
+            return self.retry_after
+        if self.bucket is not None:
+            self.bucket.refill()
+            if self.bucket.tokens < 1:
+                return self.retry_after
+            self.bucket.tokens -= 1
+        return None
+
+
+class FakeTelegramAPI:
+    # Локальная замена Bot API: бот ходит сюда по HTTP, пользователи кладут обновления напрямую
+    def __init__(self, faults, host="127.0.0.1", port=8081):
+        self.faults = faults
+        self.host = host
+        self.port = port
+        self.runner = None
+        self.updates = deque()
+        self.update_ids = itertools.count(1)
+        self.updates_ready = asyncio.Event()
+        self.message_ids = itertools.count(1)
+        self.query_ids = itertools.count(1)
+        self.queries = {}  # Ключ: id нажатия, значение: chat_id
+        self.users = {}  # Ключ: chat_id, значение: SyntheticUser
+        self.calls = Counter()
+        self.throttled = Counter()
+        self.methods = {
+            "getMe": self.get_me,
+            "getUpdates": self.get_updates,
+            "sendMessage": self.send_message,
+            "editMessageText": self.edit_message_text,
+            "answerCallbackQuery": self.answer_callback_query,
+            "getChat": self.get_chat,
+            "setMyCommands": self.accept,
+            "deleteWebhook": self.accept,
+        }
+
+    @property
+    def url(self):
+        return f"http://{self.host}:{self.port}"
+
+    async def start(self):
+        app = web.Application()
+        app.router.add_route("*", "/bot{token}/{method}", self.handle)
+        self.runner = web.AppRunner(app)
+        await self.runner.setup()
+        await web.TCPSite(self.runner, self.host, self.port).start()
+
+    async def stop(self):
+        # Отпускаем висящий длинный опрос getUpdates, иначе остановка ждёт его таймаута
+        self.updates_ready.set()
+        if self.runner is not None:
+            await self.runner.cleanup()
+            self.runner = None
+
+    async def handle(self, request):
+        method = request.match_info["method"]
+        # telebot шлёт параметры формой и для GET, поэтому тело разбираем сами
+        params = dict(request.query)
+        params.update(parse_qsl(await request.text()))
+        self.calls[method] += 1
+
+        handler = self.methods.get(method)
+        if handler is None:
+            return self.error(404, "Not Found: method not found")
+        if method != "getUpdates":
+            retry_after = await self.faults.apply()
+            if retry_after is not None:
+                self.throttled[method] += 1
+                return self.error(429, f"Too Many Requests: retry after {retry_after}", retry_after)
+        return web.json_response({"ok": True, "result": await handler(params)})
+
+    def error(self, code, description, retry_after=None):
+        body = {"ok": False, "error_code": code, "description": description}
+        if retry_after is not None:
+            body["parameters"] = {"retry_after": retry_after}
+        return web.json_response(body, status=code)
+
+    def push_update(self, kind, payload):
+        self.updates.append({"update_id": next(self.update_ids), kind: payload})
+        self.updates_ready.set()
+
+    def deliver(self, chat_id, event):
+        user = self.users.get(chat_id)
+        if user is not None:
+            user.receive(event)
+
+    def message(self, chat_id, text, markup=None, message_id=None):
+        message = {
+            "message_id": message_id or next(self.message_ids),
+            "date": int(time.time()),
+            "chat": {"id": chat_id, "type": "private"},
+            "text": text,
+        }
+        # В Message бывает только инлайн-клавиатура
+        if markup and "inline_keyboard" in markup:
+            message["reply_markup"] = markup
+        return message
+
+    async def accept(self, params):
+        return True
+
+    async def get_me(self, params):
+        return {"id": 100000, "is_bot": True, "first_name": "Loadtest", "username": "loadtest_bot"}
+
+    async def get_updates(self, params):
+        offset = int(params.get("offset") or 0)
+        while self.updates and self.updates[0]["update_id"] < offset:
+            self.updates.popleft()
+        if not self.updates:
+            self.updates_ready.clear()
+            try:
+                await asyncio.wait_for(self.updates_ready.wait(), float(params.get("timeout") or 0))
+            except asyncio.TimeoutError:
+                pass
+        return list(itertools.islice(self.updates, int(params.get("limit") or 100)))
+
+    async def send_message(self, params):
+        chat_id = int(params["chat_id"])
+        markup = json.loads(params["reply_markup"]) if "reply_markup" in params else None
+        message = self.message(chat_id, params["text"], markup)
+        self.deliver(chat_id, Event("message", params["text"], markup, message["message_id"]))
+        return message
+
+    async def edit_message_text(self, params):
+        chat_id = int(params["chat_id"])
+        message_id = int(params["message_id"])
+        markup = json.loads(params["reply_markup"]) if "reply_markup" in params else None
+        self.deliver(chat_id, Event("edit", params["text"], markup, message_id))
+        return self.message(chat_id, params["text"], markup, message_id)
+
+    async def answer_callback_query(self, params):
+        chat_id = self.queries.pop(params["callback_query_id"], None)
+        if chat_id is not None:
+            self.deliver(chat_id, Event("answer", params.get("text", ""), None, None))
+        return True
+
+    async def get_chat(self, params):
+        chat_id = int(params["chat_id"])
+        return {"id": chat_id, "type": "private", "username": f"user{chat_id}", "first_name": f"User {chat_id}"}
+
+
+class LoadStats:
+    def __init__(self):
+        self.counts = Counter()
+        self.reactions = []  # Время от действия пользователя до первого ответа бота
+        self.loop_lag = []
+
+    def summary(self, elapsed):
+        reactions = sorted(self.reactions)
+        lag = sorted(self.loop_lag)
+        return {
+            "seconds": elapsed,
+            "updates_per_second": (self.counts["messages"] + self.counts["callbacks"]) / elapsed,
+            "moves_per_second": self.counts["moves"] / elapsed,
+            "events": dict(self.counts),
+            "reaction_p50_ms": percentile(reactions, 0.5) * 1000,
+            "reaction_p99_ms": percentile(reactions, 0.99) * 1000,
+            "loop_lag_p50_ms": percentile(lag, 0.5) * 1000,
+            "loop_lag_p99_ms": percentile(lag, 0.99) * 1000,
+            "loop_lag_max_ms": (lag[-1] if lag else 0.0) * 1000,
+        }
+
+
+def percentile(ordered, fraction):
+    if not ordered:
+        return 0.0
+    return ordered[min(int(fraction * len(ordered)), len(ordered) - 1)]
+
+
+class SyntheticUser:
+    def __init__(self, chat_id, api, stats, rng, options):
+        self.chat_id = chat_id
+        self.api = api
+        self.stats = stats
+        self.rng = rng
+        self.options = options
+        self.inbox = asyncio.Queue()
+        self.acted_at = None
+        api.users[chat_id] = self
+
+    def receive(self, event):
+        if self.acted_at is not None:
+            self.stats.reactions.append(time.monotonic() - self.acted_at)
+            self.acted_at = None
+        self.inbox.put_nowait(event)
+
+    def user(self):
+        return {"id": self.chat_id, "is_bot": False, "first_name": f"User {self.chat_id}",
+                "username": f"user{self.chat_id}"}
+
+    def send_text(self, text):
+        self.stats.counts["messages"] += 1
+        self.acted_at = time.monotonic()
+        self.api.push_update("message", {
+            "message_id": next(self.api.message_ids),
+            "date": int(time.time()),
+            "chat": {"id": self.chat_id, "type": "private"},
+            "from": self.user(),
+            "text": text,
+        })
+
+    def press(self, event, data):
+        self.stats.counts["callbacks"] += 1
+        self.acted_at = time.monotonic()
+        query_id = str(next(self.api.query_ids))
+        self.api.queries[query_id] = self.chat_id
+        self.api.push_update("callback_query", {
+            "id": query_id,
+            "from": self.user(),
+            "chat_instance": str(self.chat_id),
+            "data": data,
+            "message": self.api.message(self.chat_id, event.text, event.markup, event.message_id),
+        })
+
+    async def think(self, mean):
+        if mean:
+            await asyncio.sleep(min(self.rng.expovariate(1 / mean), mean * 5))
+
+    async def next_event(self, timeout):
+        try:
+            return await asyncio.wait_for(self.inbox.get(), timeout)
+        except asyncio.TimeoutError:
+            return None
+
+    async def expect(self, *prefixes, timeout=None, count_timeout=True):
+        # Ждём сообщение с одним из префиксов, остальное пропускаем
+        deadline = time.monotonic() + (timeout or self.options.reply_timeout)
+        while True:
+            event = await self.next_event(deadline - time.monotonic())
+            if event is None:
+                if count_timeout:
+                    self.stats.counts["timeouts"] += 1
+                return None
+            if event.kind != "answer" and event.text.startswith(prefixes):
+                return event
+
+    async def run(self):
+        while True:
+            await self.think(self.options.idle)
+            self.send_text("/start")
+            if not await self.expect("Привет"):
+                await self.reset()
+                continue
+            self.send_text("Да")
+            if not await self.expect("Выберите режим"):
+                await self.reset()
+                continue
+            if self.rng.random() < self.options.bot_share:
+                await self.play_against_bot()
+            else:
+                await self.play_against_player()
+
+    async def reset(self):
+        # После потерянного ответа выходим из игры, чтобы начать с чистого листа
+        self.send_text("Выход")
+        await self.expect("Вы вышли", "Привет")
+
+    async def choose_field(self):
+        field_size = self.rng.choice(self.options.field_sizes)
+        self.send_text(FIELD_SIZE_TEXTS[field_size])
+
+    async def play_against_bot(self):
+        self.send_text("Против бота")
+        if not await self.expect("Выберите размер"):
+            return await self.reset()
+        await self.choose_field()
+        if not await self.expect("Выберите сложность"):
+            return await self.reset()
+        self.send_text("Лёгкий бот")
+        if not await self.expect("Выберите: Крестик"):
+            return await self.reset()
+        symbol = self.rng.choice("XO")
+        self.send_text("Крестик" if symbol == "X" else "Нолик")
+        if not await self.expect("Ты выбрал"):
+            return await self.reset()
+        await self.play(symbol)
+
+    async def play_against_player(self):
+        self.send_text("Против игрока")
+        if not await self.expect("Выберите размер"):
+            return await self.reset()
+        await self.choose_field()
+        event = await self.expect("Вы в очереди", "Игра начинается")
+        if event is None:
+            return await self.reset()
+
+        if event.text.startswith("Вы в очереди"):
+            self.stats.counts["queued"] += 1
+            leaves = self.rng.random() < self.options.leave_queue_share
+            patience = self.options.queue_patience if leaves else self.options.queue_timeout
+            event = await self.expect("Игра начинается", timeout=patience, count_timeout=False)
+            if event is None:
+                self.stats.counts["queue_exits"] += 1
+                self.send_text("Выйти из очереди")
+                event = await self.expect("Вы вышли", "Игра начинается", "Ошибка")
+                if event is None or not event.text.startswith("Игра начинается"):
+                    return
+
+        await self.play("X" if "Крестики" in event.text else "O")
+
+    def is_my_turn(self, board, symbol):
+        x_count = board.text.count(SYMBOLS["X"])
+        o_count = board.text.count(SYMBOLS["O"])
+        return (x_count == o_count) == (symbol == "X")
+
+    async def play(self, symbol):
+        self.stats.counts["games"] += 1
+        deadline = time.monotonic() + self.options.game_timeout
+        board = None
+        pressed = None
+        while True:
+            event = await self.next_event(deadline - time.monotonic())
+            if event is None:
+                self.stats.counts["game_timeouts"] += 1
+                return await self.reset()
+            if event.kind == "answer":
+                if event.text:
+                    # Нажатие отклонено: пробуем ещё раз по последней доске
+                    self.stats.counts["rejected"] += 1
+                    pressed = None
+            elif event.markup and "inline_keyboard" in event.markup:
+                board = event
+            elif event.text.startswith(GAME_OVER_TEXTS):
+                self.stats.counts["games_finished"] += 1
+                return
+
+            if board is None or pressed == board.text or not self.is_my_turn(board, symbol):
+                continue
+            await self.think(self.options.think)
+            if self.rng.random() < self.options.surrender_share:
+                self.stats.counts["surrenders"] += 1
+                self.press(board, "surrender")
+                await self.expect("Вы сдались", "Игра не найдена")
+                return
+
+            buttons = [button["callback_data"] for row in board.markup["inline_keyboard"] for button in row]
+            moves = [data for data in buttons if data.startswith("move_")]
+            if moves:
+                self.stats.counts["moves"] += 1
+                self.press(board, self.rng.choice(moves))
+            else:
+                # В окне большого поля нет свободных клеток: сдвигаем его
+                self.press(board, self.rng.choice([data for data in buttons if data.startswith("view_")]))
+            pressed = board.text
+
+
+class ErrorCounter(logging.Handler):
+    def __init__(self):
+        super().__init__(logging.ERROR)
+        self.count = 0
+
+    def emit(self, record):
+        self.count += 1
+
+
+async def monitor_loop_lag(samples, interval=0.05):
+    # Насколько позже заказанного просыпается корутина: мера загрузки цикла событий
+    loop = asyncio.get_running_loop()
+    while True:
+        started = loop.time()
+        await asyncio.sleep(interval)
+        samples.append(loop.time() - started - interval)
+
+
+async def cancel_all(tasks):
+    # До Python 3.12 wait_for может проглотить отмену, поэтому отменяем, пока задачи не завершатся
+    pending = set(tasks)
+    while pending:
+        for task in pending:
+            task.cancel()
+        _, pending = await asyncio.wait(pending, timeout=1)
+
+
+def api_results():
+    from outbound import API_CALLS, API_THROTTLED
+
+    results = Counter()
+    for (method, result), value in API_CALLS.values.items():
+        results[result] += value
+    results["throttled"] = sum(API_THROTTLED.values.values())
+    return dict(results)
+
+
+async def run_load(options):
+    # Импорт здесь: бот открывает базы в текущем каталоге, а он к этому моменту временный
+    import bot as bot_module
+    from outbound import OutboundScheduler
+    from webhook import configure_api
+
+    rng = random.Random(options.seed)
+    faults = FaultInjector(
+        options.latency, options.jitter, options.throttle_share, options.retry_after,
+        options.api_rate, random.Random(rng.random()),
+    )
+    api = FakeTelegramAPI(faults, port=options.port)
+    await api.start()
+    configure_api(api.url)
+
+    bot = bot_module.TicTacToeBot(TOKEN)
+    if options.lift_limits:
+        bot.outbound = OutboundScheduler(
+            bot.bot, global_rate=1e9, global_burst=1e9, chat_rate=1e9, chat_burst=1e9
+        )
+    errors = ErrorCounter()
+    logging.getLogger().addHandler(errors)
+
+    stats = LoadStats()
+    polling = asyncio.create_task(bot.start_polling())
+    monitor = asyncio.create_task(monitor_loop_lag(stats.loop_lag))
+    users = [
+        SyntheticUser(2_000_000 + i, api, stats, random.Random(rng.random()), options)
+        for i in range(options.users)
+    ]
+
+    async def start_user(user, delay):
+        await asyncio.sleep(delay)
+        await user.run()
+
+    started = time.monotonic()
+    tasks = [
+        asyncio.create_task(start_user(user, options.ramp * i / len(users)))
+        for i, user in enumerate(users)
+    ]
+    try:
+        await asyncio.sleep(options.duration)
+    finally:
+        elapsed = time.monotonic() - started
+        await cancel_all(tasks + [monitor])
+        # Даём боту дослать начатое, чтобы обрыв соединений не попал в ошибки
+        drain_deadline = time.monotonic() + options.reply_timeout
+        while bot.outbound.queue_depth() and time.monotonic() < drain_deadline:
+            await asyncio.sleep(0.1)
+        logged_errors = errors.count
+        polling.cancel()
+        await asyncio.gather(polling, return_exceptions=True)
+        await api.stop()
+        logging.getLogger().removeHandler(errors)
+
+    summary = stats.summary(elapsed)
+    summary.update({
+        "users": options.users,
+        "api_calls": dict(api.calls),
+        "injected_429": dict(api.throttled),
+        "bot_api_results": api_results(),
+        "logged_errors": logged_errors,
+    })
+    return summary
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Нагрузочный прогон бота против локального Bot API")
+    parser.add_argument("--users", type=int, default=1000)
+    parser.add_argument("--duration", type=float, default=60, help="длительность прогона, с")
+    parser.add_argument("--ramp", type=float, default=10, help="за сколько секунд подключаются все пользователи")
+    parser.add_argument("--field-sizes", default="3,4,5", help="размеры полей через запятую")
+    parser.add_argument("--bot-share", type=float, default=0.2, help="доля партий против бота")
+    parser.add_argument("--think", type=float, default=1.0, help="среднее время на ход, с")
+    parser.add_argument("--idle", type=float, default=2.0, help="средняя пауза между партиями, с")
+    parser.add_argument("--surrender-share", type=float, default=0.02, help="вероятность сдаться на каждом ходу")
+    parser.add_argument("--leave-queue-share", type=float, default=0.1, help="доля уходящих из очереди")
+    parser.add_argument("--queue-patience", type=float, default=3.0, help="сколько ждут уходящие из очереди, с")
+    parser.add_argument("--queue-timeout", type=float, default=30.0)
+    parser.add_argument("--reply-timeout", type=float, default=10.0)
+    parser.add_argument("--game-timeout", type=float, default=120.0)
+    parser.add_argument("--latency", type=float, default=0.0, help="задержка каждого запроса к Bot API, с")
+    parser.add_argument("--jitter", type=float, default=0.0, help="случайная добавка к задержке, с")
+    parser.add_argument("--throttle-share", type=float, default=0.0, help="доля запросов с ответом 429")
+    parser.add_argument("--api-rate", type=float, default=0.0, help="лимит запросов в секунду, сверх — 429")
+    parser.add_argument("--retry-after", type=int, default=1)
+    parser.add_argument("--lift-limits", action="store_true", help="снять ограничения исходящей очереди бота")
+    parser.add_argument("--port", type=int, default=8081)
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--log-level", default="WARNING")
+    parser.add_argument("--output", help="куда записать JSON с результатами")
+    args = parser.parse_args()
+    args.field_sizes = [int(size) for size in args.field_sizes.split(",")]
+    for size in args.field_sizes:
+        if size not in FIELD_SIZE_TEXTS:
+            parser.error(f"нет кнопки для поля {size}x{size}")
+
+    output = os.path.abspath(args.output) if args.output else None
+    workdir = os.getcwd()
+    with tempfile.TemporaryDirectory() as directory:
+        os.chdir(directory)
+        try:
+            import bot  # noqa: F401  настраивает логирование, уровень задаём после
+            logging.getLogger().setLevel(args.log_level.upper())
+            summary = asyncio.run(run_load(args))
+        finally:
+            os.chdir(workdir)
+
+    print(json.dumps(summary, ensure_ascii=False, indent=2))
+    if output:
+        with open(output, "w", encoding="utf-8") as file:
+            json.dump(summary, file, ensure_ascii=False, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,233 @@
+import math
+import random
+import time
+from collections import OrderedDict
+
+from lines import (
+    MASK_FIELD_LIMIT,
+    candidate_moves,
+    get_cell_lines,
+    get_neighbourhoods,
+    has_line_at,
+    iter_bits,
+)
+
+DEFAULT_TIME_BUDGET = 0.3
+EXPLORATION = 1.4
+# Сколько деревьев держит один процесс для повторного использования между ходами
+MAX_TREES = 256
+
+
+class Node:
+    __slots__ = ("move", "parent", "children", "untried", "visits", "wins", "x_bits", "o_bits", "turn")
+
+    def __init__(self, move, parent, x_bits, o_bits, turn, untried):
+        self.move = move
+        self.parent = parent
+        self.children = {}
+        self.untried = untried
+        self.visits = 0
+        # Очки с точки зрения игрока, который сделал move
+        self.wins = 0.0
+        self.x_bits = x_bits
+        self.o_bits = o_bits
+        # 0 — ходят крестики, 1 — нолики
+        self.turn = turn
+
+
+class MCTSSearch:
+    def __init__(self, field_size, winning_length, exploration=EXPLORATION, rng=None):
+        self.field_size = field_size
+        self.winning_length = winning_length
+        self.board_size = field_size * field_size
+        self.full_mask = (1 << self.board_size) - 1
+        self.exploration = exploration
+        self.rng = rng or random.Random()
+        self.small = field_size <= MASK_FIELD_LIMIT
+        self.cell_lines = get_cell_lines(field_size, winning_length) if self.small else None
+        self.neighbourhoods = get_neighbourhoods(field_size, 1)
+
+    def wins_with(self, bits, position):
+        if self.cell_lines is None:
+            return has_line_at(bits, self.field_size, self.winning_length, position)
+        for mask in self.cell_lines[position]:
+            if bits & mask == mask:
+                return True
+        return False
+
+    def moves(self, x_bits, o_bits):
+        # На больших полях дерево растёт только по клеткам рядом с камнями
+        if self.small:
+            occupied = x_bits | o_bits
+            moves = [pos for pos in range(self.board_size) if not occupied >> pos & 1]
+        else:
+            moves = candidate_moves(x_bits, o_bits, self.field_size, radius=1)
+        self.rng.shuffle(moves)
+        return moves
+
+    def new_node(self, move, parent, x_bits, o_bits, turn):
+        return Node(move, parent, x_bits, o_bits, turn, self.moves(x_bits, o_bits))
+
+    def select_child(self, node):
+        log_visits = math.log(node.visits)
+        best_child = None
+        best_value = -1.0
+        for child in node.children.values():
+            value = child.wins / child.visits + self.exploration * math.sqrt(log_visits / child.visits)
+            if value > best_value:
+                best_value = value
+                best_child = child
+        return best_child
+
+    def playout(self, x_bits, o_bits, turn):
+        # Случайная доигровка; возвращает 0 или 1 — победившая сторона, None — ничья
+        stones = [x_bits, o_bits]
+        occupied = x_bits | o_bits
+        if self.small:
+            free = [pos for pos in range(self.board_size) if not occupied >> pos & 1]
+        else:
+            free = candidate_moves(x_bits, o_bits, self.field_size, radius=1)
+        seen = occupied
+        for pos in free:
+            seen |= 1 << pos
+
+        while free:
+            index = self.rng.randrange(len(free))
+            free[index], free[-1] = free[-1], free[index]
+            pos = free.pop()
+            stones[turn] |= 1 << pos
+            if self.wins_with(stones[turn], pos):
+                return turn
+            if not self.small:
+                # Новые соседи сыгранного камня становятся кандидатами
+                fresh = self.neighbourhoods[pos] & ~seen
+                seen |= fresh
+                free.extend(iter_bits(fresh))
+            turn ^= 1
+        return None
+
+    def iterate(self, root):
+        node = root
+        # Выбор: спускаемся по UCT, пока узел полностью раскрыт
+        while not node.untried and node.children:
+            node = self.select_child(node)
+
+        winner = None
+        terminal = node.move is not None and self.wins_with(
+            node.o_bits if node.turn == 0 else node.x_bits, node.move
+        )
+        if terminal:
+            winner = node.turn ^ 1
+        elif node.untried:
+            # Раскрытие одного нового хода
+            move = node.untried.pop()
+            x_bits, o_bits = node.x_bits, node.o_bits
+            if node.turn == 0:
+                x_bits |= 1 << move
+            else:
+                o_bits |= 1 << move
+            child = self.new_node(move, node, x_bits, o_bits, node.turn ^ 1)
+            node.children[move] = child
+            node = child
+            mover = child.turn ^ 1
+            if self.wins_with(x_bits if mover == 0 else o_bits, move):
+                winner = mover
+            elif x_bits | o_bits != self.full_mask:
+                winner = self.playout(x_bits, o_bits, child.turn)
+
+        # Обратное распространение результата
+        while node is not None:
+            node.visits += 1
+            mover = node.turn ^ 1
+            if winner is None:
+                node.wins += 0.5
+            elif winner == mover:
+                node.wins += 1.0
+            node = node.parent
+
+    def search(self, root, deadline):
+        # Строгий бюджет: время проверяется после каждой итерации
+        iterations = 0
+        while time.monotonic() < deadline:
+            self.iterate(root)
+            iterations += 1
+        return iterations
+
+    def immediate_move(self, x_bits, o_bits, turn):
+        # Выигрыш в один ход берём сразу, иначе закрываем выигрыш соперника
+        me, opp = (x_bits, o_bits) if turn == 0 else (o_bits, x_bits)
+        moves = self.moves(x_bits, o_bits)
+        for pos in moves:
+            if self.wins_with(me | 1 << pos, pos):
+                return pos
+        for pos in moves:
+            if self.wins_with(opp | 1 << pos, pos):
+                return pos
+        return None
+
+
+# Деревья прошлых ходов живут в каждом процессе отдельно
+_trees = OrderedDict()
+_searches = {}
+
+
+def get_search(field_size, winning_length):
+    key = (field_size, winning_length)
+    search = _searches.get(key)
+    if search is None:
+        search = MCTSSearch(field_size, winning_length)
+        _searches[key] = search
+    return search
+
+
+def find_root(search, tree_key, x_bits, o_bits, turn):
+    # Переиспользуем поддерево, если новая позиция получена из старой ходами в дереве
+    node = _trees.pop(tree_key, None)
+    while node is not None and (node.x_bits, node.o_bits) != (x_bits, o_bits):
+        if node.x_bits & ~x_bits or node.o_bits & ~o_bits:
+            node = None
+            break
+        # Ход из узла делает сторона node.turn, поэтому ищем его только среди её новых камней
+        if node.turn == 0:
+            added = x_bits & ~node.x_bits
+        else:
+            added = o_bits & ~node.o_bits
+        node = next((child for move, child in node.children.items() if added >> move & 1), None)
+    if node is not None and node.turn == turn:
+        node.parent = None
+        node.move = None
+        return node
+    return search.new_node(None, None, x_bits, o_bits, turn)
+
+
+def root_visits(field_size, winning_length, x_bits, o_bits, symbol,
+                time_budget=DEFAULT_TIME_BUDGET, tree_key=None):
+    # Одна независимая партия поиска; результаты нескольких процессов складываются
+    deadline = time.monotonic() + time_budget
+    search = get_search(field_size, winning_length)
+    turn = 0 if symbol == "X" else 1
+
+    move = search.immediate_move(x_bits, o_bits, turn)
+    if move is not None:
+        return {move: 1}
+
+    root = find_root(search, tree_key, x_bits, o_bits, turn)
+    search.search(root, deadline)
+    if tree_key is not None:
+        _trees[tree_key] = root
+        while len(_trees) > MAX_TREES:
+            _trees.popitem(last=False)
+    return {move: child.visits for move, child in root.children.items()}
+
+
+def best_of(visits):
+    if not visits:
+        return None
+    return max(visits, key=visits.get)
+
+
+def find_mcts_move(field_size, winning_length, x_bits, o_bits, symbol,
+                   time_budget=DEFAULT_TIME_BUDGET, tree_key=None):
+    return best_of(root_visits(
+        field_size, winning_length, x_bits, o_bits, symbol, time_budget, tree_key
+    ))
@@ -0,0 +1,100 @@
+import argparse
+import gc
+import random
+import tracemalloc
+
+from chat_session import ChatSession
+from game import TicTacToeGame
+from lines import get_cell_lines, get_line_masks
+
+
+class LegacyGame:
+    # Прежняя раскладка игры: __dict__, доска списком строк и словарь масок
+    def __init__(self, player_symbol, mode="player", field_size=3, difficulty="easy"):
+        self.field_size = field_size
+        self.board_size = field_size * field_size
+        self.board = [""] * self.board_size
+        self.player_symbol = player_symbol
+        self.bot_symbol = "O" if player_symbol == "X" else "X"
+        self.current_player = "X"
+        self.mode = mode
+        self.difficulty = difficulty
+        self.winner = None
+        self.winning_length = 3 if field_size in (3, 4) else field_size
+        self.line_masks = get_line_masks(field_size, self.winning_length)
+        self.cell_lines = get_cell_lines(field_size, self.winning_length)
+        self.moves_count = 0
+        self.bitboards = {"X": 0, "O": 0}
+        self.version = 0
+        self.sequence = 0
+
+    def make_move(self, position):
+        self.board[position] = self.current_player
+        self.bitboards[self.current_player] |= 1 << position
+        self.moves_count += 1
+        self.sequence += 1
+        self.current_player = "O" if self.current_player == "X" else "X"
+
+
+def legacy_entry(chat_id, opponent_id, game, symbol):
+    return {
+        "game": game,
+        "opponent": opponent_id,
+        "symbol": symbol,
+        "message_id": random.randrange(1 << 31),
+        "game_key": chat_id,
+        "rendered": hash((chat_id, symbol)),
+    }
+
+
+def compact_entry(chat_id, opponent_id, game, symbol):
+    session = ChatSession(
+        mode="player", field_size=game.field_size, symbol=symbol, opponent=opponent_id,
+        message_id=random.randrange(1 << 31), game_key=chat_id, game=game,
+    )
+    session.rendered = hash((chat_id, symbol))
+    return session
+
+
+def build_games(game_class, make_entry, count, field_size, moves):
+    # Партия на двоих: одна игра и две записи чатов, как в TicTacToeBot.games
+    games = {}
+    for i in range(count):
+        chat_id = 10 ** 9 + 2 * i
+        opponent_id = chat_id + 1
+        game = game_class("X", mode="player", field_size=field_size)
+        for position in random.sample(range(field_size * field_size), moves):
+            game.make_move(position)
+        games[chat_id] = make_entry(chat_id, opponent_id, game, "X")
+        games[opponent_id] = make_entry(opponent_id, chat_id, game, "O")
+    return games
+
+
+def measure(game_class, make_entry, count, field_size, moves):
+    random.seed(1)
+    gc.collect()
+    tracemalloc.start()
+    games = build_games(game_class, make_entry, count, field_size, moves)
+    size, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    del games
+    return size / count
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Память на одну живую партию")
+    parser.add_argument("--games", type=int, default=20000)
+    parser.add_argument("--moves", type=int, default=4)
+    args = parser.parse_args()
+
+    for field_size in (3, 4):
+        before = measure(LegacyGame, legacy_entry, args.games, field_size, args.moves)
+        after = measure(TicTacToeGame, compact_entry, args.games, field_size, args.moves)
+        print(
+            f"{field_size}x{field_size}: было {before:.0f} Б на партию, "
+            f"стало {after:.0f} Б ({after / before:.0%})"
+        )
+
+
+if __name__ == "__main__":
+    main()
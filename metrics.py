@@ -0,0 +1,206 @@
+import bisect
+import logging
+import time
+
+from aiohttp import web
+
+# Границы корзин гистограмм задержек, в секундах
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5)
+
+
+def escape_label(value):
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def format_labels(names, values):
+    if not names:
+        return ""
+    pairs = ",".join(f'{name}="{escape_label(value)}"' for name, value in zip(names, values))
+    return "{" + pairs + "}"
+
+
+def format_value(value):
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class Counter:
+    kind = "counter"
+
+    def __init__(self, name, help_text, label_names=()):
+        self.name = name
+        self.help_text = help_text
+        self.label_names = tuple(label_names)
+        self.values = {}  # Ключ: кортеж значений меток, значение: счётчик
+
+    def inc(self, *labels, amount=1):
+        self.values[labels] = self.values.get(labels, 0) + amount
+
+    def get(self, *labels):
+        return self.values.get(labels, 0)
+
+    def samples(self):
+        for labels, value in self.values.items():
+            yield self.name, self.label_names, labels, value
+
+
+class Gauge:
+    kind = "gauge"
+
+    def __init__(self, name, help_text, function):
+        # Значение считается в момент запроса метрик, на горячем пути ничего не делается
+        self.name = name
+        self.help_text = help_text
+        self.function = function
+
+    def samples(self):
+        yield self.name, (), (), self.function()
+
+
+class HistogramSeries:
+    __slots__ = ("bounds", "counts", "count", "total")
+
+    def __init__(self, bounds):
+        self.bounds = bounds
+        self.counts = [0] * (len(bounds) + 1)
+        self.count = 0
+        self.total = 0.0
+
+    def observe(self, value):
+        self.counts[bisect.bisect_left(self.bounds, value)] += 1
+        self.count += 1
+        self.total += value
+
+    def percentile(self, fraction):
+        # Верхняя граница корзины, в которую попадает нужная доля наблюдений
+        if not self.count:
+            return 0
+        rank = fraction * self.count
+        seen = 0
+        for index, count in enumerate(self.counts):
+            seen += count
+            if seen >= rank:
+                return self.bounds[index] if index < len(self.bounds) else float("inf")
+        return float("inf")
+
+    def snapshot(self):
+        return {
+            "count": self.count,
+            "avg": self.total / self.count if self.count else 0,
+            "p50": self.percentile(0.5),
+            "p99": self.percentile(0.99),
+        }
+
+
+class Histogram:
+    kind = "histogram"
+
+    def __init__(self, name, help_text, label_names=(), bounds=LATENCY_BUCKETS):
+        self.name = name
+        self.help_text = help_text
+        self.label_names = tuple(label_names)
+        self.bounds = tuple(bounds)
+        self.series = {}  # Ключ: кортеж значений меток, значение: HistogramSeries
+
+    def labels(self, *labels):
+        series = self.series.get(labels)
+        if series is None:
+            series = HistogramSeries(self.bounds)
+            self.series[labels] = series
+        return series
+
+    def observe(self, value, *labels):
+        self.labels(*labels).observe(value)
+
+    def time(self, *labels):
+        return Timer(self.labels(*labels))
+
+    def samples(self):
+        names = self.label_names + ("le",)
+        for labels, series in self.series.items():
+            cumulative = 0
+            for bound, count in zip(self.bounds + (float("inf"),), series.counts):
+                cumulative += count
+                yield self.name + "_bucket", names, labels + (format_value(bound),), cumulative
+            yield self.name + "_sum", self.label_names, labels, series.total
+            yield self.name + "_count", self.label_names, labels, series.count
+
+
+class Timer:
+    __slots__ = ("series", "started")
+
+    def __init__(self, series):
+        self.series = series
+
+    def __enter__(self):
+        self.started = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.series.observe(time.perf_counter() - self.started)
+        return False
+
+
+class MetricsRegistry:
+    def __init__(self):
+        self.metrics = {}
+
+    def register(self, metric):
+        # Повторная регистрация отдаёт уже созданную метрику
+        return self.metrics.setdefault(metric.name, metric)
+
+    def counter(self, name, help_text, label_names=()):
+        return self.register(Counter(name, help_text, label_names))
+
+    def histogram(self, name, help_text, label_names=(), bounds=LATENCY_BUCKETS):
+        return self.register(Histogram(name, help_text, label_names, bounds))
+
+    def gauge(self, name, help_text, function):
+        # Функцию датчика можно заменить: важен последний владелец, например новый бот
+        gauge = self.register(Gauge(name, help_text, function))
+        gauge.function = function
+        return gauge
+
+    def render(self):
+        # Текстовый формат Prometheus
+        lines = []
+        for metric in self.metrics.values():
+            lines.append(f"# HELP {metric.name} {metric.help_text}")
+            lines.append(f"# TYPE {metric.name} {metric.kind}")
+            try:
+                for name, label_names, labels, value in metric.samples():
+                    lines.append(f"{name}{format_labels(label_names, labels)} {format_value(value)}")
+            except Exception:
+                logging.exception("Ошибка чтения метрики %s", metric.name)
+        return "\n".join(lines) + "\n"
+
+
+REGISTRY = MetricsRegistry()
+
+
+class MetricsServer:
+    def __init__(self, registry=REGISTRY, host="127.0.0.1", port=9100, path="/metrics"):
+        self.registry = registry
+        self.host = host
+        self.port = port
+        self.path = path
+        self.runner = None
+
+    async def handle_metrics(self, request):
+        return web.Response(
+            text=self.registry.render(), content_type="text/plain", charset="utf-8"
+        )
+
+    async def start(self):
+        app = web.Application()
+        app.router.add_get(self.path, self.handle_metrics)
+        self.runner = web.AppRunner(app)
+        await self.runner.setup()
+        await web.TCPSite(self.runner, self.host, self.port).start()
+        logging.info("Метрики доступны на %s:%s%s", self.host, self.port, self.path)
+
+    async def stop(self):
+        if self.runner is not None:
+            await self.runner.cleanup()
+            self.runner = None
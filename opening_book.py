@@ -0,0 +1,260 @@
+import argparse
+import mmap
+import os
+import struct
+import sys
+import time
+
+from lines import get_cell_lines
+
+BOOK_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "books")
+
+# Заголовок: сигнатура, версия, размер поля, длина линии, число записей
+HEADER = struct.Struct("<4sBBBxI")
+# Запись: ключ позиции, лучший ход, оценка для того, кто ходит
+RECORD = struct.Struct("<IBb")
+MAGIC = b"TTTB"
+VERSION = 1
+
+WIN_SCORE = 100
+
+
+def book_path(field_size, winning_length):
+    return os.path.join(BOOK_DIR, f"book_{field_size}x{field_size}_{winning_length}.bin")
+
+
+def get_symmetries(field_size):
+    # 8 поворотов и отражений квадратного поля: perm[клетка] -> клетка
+    def cell(row, col):
+        return row * field_size + col
+
+    last = field_size - 1
+    transforms = (
+        lambda r, c: cell(r, c),
+        lambda r, c: cell(c, last - r),
+        lambda r, c: cell(last - r, last - c),
+        lambda r, c: cell(last - c, r),
+        lambda r, c: cell(r, last - c),
+        lambda r, c: cell(c, r),
+        lambda r, c: cell(last - r, c),
+        lambda r, c: cell(last - c, last - r),
+    )
+    return tuple(
+        tuple(transform(pos // field_size, pos % field_size) for pos in range(field_size * field_size))
+        for transform in transforms
+    )
+
+
+def permute_bits(bits, perm):
+    result = 0
+    while bits:
+        low = bits & -bits
+        result |= 1 << perm[low.bit_length() - 1]
+        bits ^= low
+    return result
+
+
+def canonical_key(x_bits, o_bits, board_size, symmetries):
+    # Возвращает минимальный ключ среди симметричных позиций и номер преобразования
+    best_key = None
+    best_index = 0
+    for index, perm in enumerate(symmetries):
+        key = permute_bits(x_bits, perm) | permute_bits(o_bits, perm) << board_size
+        if best_key is None or key < best_key:
+            best_key = key
+            best_index = index
+    return best_key, best_index
+
+
+class BookSolver:
+    def __init__(self, field_size, winning_length):
+        self.field_size = field_size
+        self.winning_length = winning_length
+        self.board_size = field_size * field_size
+        self.full_mask = (1 << self.board_size) - 1
+        self.cell_lines = get_cell_lines(field_size, winning_length)
+        self.symmetries = get_symmetries(field_size)
+        self.scores = {}
+
+    def wins_with(self, bits, position):
+        for mask in self.cell_lines[position]:
+            if bits & mask == mask:
+                return True
+        return False
+
+    def child_score(self, me, opp, pos):
+        # Оценка хода pos с точки зрения того, кто ходит
+        child = me | 1 << pos
+        if self.wins_with(child, pos):
+            return WIN_SCORE - 1
+        if child | opp == self.full_mask:
+            return 0
+        score = -self.solve(opp, child)
+        if score > 0:
+            return score - 1
+        if score < 0:
+            return score + 1
+        return 0
+
+    def solve(self, me, opp):
+        x_bits, o_bits = (me, opp) if self.x_to_move(me, opp) else (opp, me)
+        key, _ = canonical_key(x_bits, o_bits, self.board_size, self.symmetries)
+        score = self.scores.get(key)
+        if score is not None:
+            return score
+
+        score = -WIN_SCORE
+        occupied = me | opp
+        for pos in range(self.board_size):
+            if occupied >> pos & 1:
+                continue
+            score = max(score, self.child_score(me, opp, pos))
+            if score == WIN_SCORE - 1:
+                break
+
+        self.scores[key] = score
+        return score
+
+    def x_to_move(self, me, opp):
+        return bin(me).count("1") == bin(opp).count("1")
+
+    def best_move(self, key):
+        x_bits = key & self.full_mask
+        o_bits = key >> self.board_size
+        if self.x_to_move(x_bits, o_bits):
+            me, opp = x_bits, o_bits
+        else:
+            me, opp = o_bits, x_bits
+
+        best_score = -WIN_SCORE - 1
+        best_pos = None
+        occupied = me | opp
+        for pos in range(self.board_size):
+            if occupied >> pos & 1:
+                continue
+            score = self.child_score(me, opp, pos)
+            if score > best_score:
+                best_score = score
+                best_pos = pos
+        return best_pos, best_score
+
+    def build(self, max_stones):
+        self.solve(0, 0)
+        best_moves = {}
+        # Поиск лучшего хода досчитывает позиции, отсечённые при решении
+        pending = list(self.scores)
+        while pending:
+            for key in pending:
+                if bin(key).count("1") <= max_stones:
+                    best_moves[key] = self.best_move(key)
+            pending = [key for key in self.scores if key not in best_moves]
+            pending = [key for key in pending if bin(key).count("1") <= max_stones]
+
+        return [(key, move, score) for key, (move, score) in sorted(best_moves.items())]
+
+
+def write_book(path, field_size, winning_length, records):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, "wb") as file:
+        file.write(HEADER.pack(MAGIC, VERSION, field_size, winning_length, len(records)))
+        for key, move, score in records:
+            file.write(RECORD.pack(key, move, score))
+
+
+class OpeningBook:
+    def __init__(self, path):
+        self.path = path
+        self.data = None
+        self.count = 0
+        self.field_size = 0
+        self.board_size = 0
+        self.symmetries = ()
+        self.inverse = ()
+
+    def load(self):
+        # Файл отображается в память только для чтения и разделяется между процессами
+        with open(self.path, "rb") as file:
+            self.data = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+
+        magic, version, field_size, _, count = HEADER.unpack_from(self.data, 0)
+        if magic != MAGIC or version != VERSION:
+            raise ValueError(f"Некорректный файл дебютной книги: {self.path}")
+
+        self.count = count
+        self.field_size = field_size
+        self.board_size = field_size * field_size
+        self.symmetries = get_symmetries(field_size)
+        self.inverse = tuple(
+            tuple(perm.index(pos) for pos in range(self.board_size))
+            for perm in self.symmetries
+        )
+
+    def find(self, key):
+        low, high = 0, self.count
+        while low < high:
+            middle = (low + high) // 2
+            record_key, move, score = RECORD.unpack_from(
+                self.data, HEADER.size + middle * RECORD.size
+            )
+            if record_key < key:
+                low = middle + 1
+            elif record_key > key:
+                high = middle
+            else:
+                return move, score
+        return None
+
+    def lookup(self, x_bits, o_bits):
+        key, index = canonical_key(x_bits, o_bits, self.board_size, self.symmetries)
+        record = self.find(key)
+        if record is None:
+            return None
+        # Ход хранится для канонической позиции, возвращаем его на исходное поле
+        return self.inverse[index][record[0]]
+
+
+_books = {}
+
+
+def get_book(field_size, winning_length):
+    key = (field_size, winning_length)
+    if key in _books:
+        return _books[key]
+
+    path = book_path(field_size, winning_length)
+    book = None
+    if os.path.exists(path):
+        book = OpeningBook(path)
+        book.load()
+    _books[key] = book
+    return book
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Генерация дебютной книги")
+    parser.add_argument("field_size", type=int)
+    parser.add_argument("winning_length", type=int)
+    parser.add_argument(
+        "--max-stones", type=int, default=None,
+        help="сохранять только позиции с не более чем этим числом фигур",
+    )
+    args = parser.parse_args()
+
+    max_stones = args.max_stones
+    if max_stones is None:
+        max_stones = args.field_size * args.field_size
+
+    sys.setrecursionlimit(10_000)
+    started = time.perf_counter()
+    solver = BookSolver(args.field_size, args.winning_length)
+    records = solver.build(max_stones)
+    path = book_path(args.field_size, args.winning_length)
+    write_book(path, args.field_size, args.winning_length, records)
+    print(
+        f"{path}: {len(records)} позиций из {len(solver.scores)}, "
+        f"{time.perf_counter() - started:.1f} с"
+    )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,207 @@
+import asyncio
+import itertools
+import logging
+import time
+
+from telebot.asyncio_helper import ApiTelegramException
+
+from metrics import REGISTRY
+
+PRIORITY_BOARD = 0
+PRIORITY_INFO = 1
+
+# Ограничения Telegram: около 30 сообщений в секунду всего и 1 в секунду на чат
+GLOBAL_RATE = 30
+GLOBAL_BURST = 30
+CHAT_RATE = 1
+CHAT_BURST = 3
+MAX_RETRIES = 3
+MAX_CHAT_BUCKETS = 10_000
+
+API_CALLS = REGISTRY.counter("bot_api_calls_total", "Запросы к Bot API", ("method", "result"))
+API_SECONDS = REGISTRY.histogram("bot_api_call_seconds", "Время запроса к Bot API", ("method",))
+API_THROTTLED = REGISTRY.counter("bot_api_429_total", "Ответы 429 от Bot API", ("method",))
+
+
+class TokenBucket:
+    def __init__(self, rate, capacity):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated = time.monotonic()
+
+    def refill(self):
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def is_full(self):
+        self.refill()
+        return self.tokens >= self.capacity
+
+    async def acquire(self):
+        # Токен резервируется сразу, а при нехватке ждём его накопления
+        self.refill()
+        self.tokens -= 1
+        if self.tokens < 0:
+            await asyncio.sleep(-self.tokens / self.rate)
+
+
+class OutboundScheduler:
+    def __init__(self, bot, global_rate=GLOBAL_RATE, global_burst=GLOBAL_BURST,
+                 chat_rate=CHAT_RATE, chat_burst=CHAT_BURST, max_retries=MAX_RETRIES):
+        self.bot = bot
+        self.global_bucket = TokenBucket(global_rate, global_burst)
+        self.chat_rate = chat_rate
+        self.chat_burst = chat_burst
+        self.chat_buckets = {}  # Ключ: chat_id, значение: TokenBucket
+        self.max_retries = max_retries
+        self.queue = None
+        self.chat_queues = {}  # Ключ: chat_id, значение: очередь запросов этого чата
+        self.drain_tasks = {}  # Ключ: chat_id, значение: задача, разбирающая очередь чата
+        self.counter = itertools.count()
+        self.dispatcher = None
+
+    def chat_bucket(self, chat_id):
+        bucket = self.chat_buckets.get(chat_id)
+        if bucket is None:
+            if len(self.chat_buckets) >= MAX_CHAT_BUCKETS:
+                # Полные корзины ничем не отличаются от новых, их можно забыть
+                self.chat_buckets = {
+                    key: value for key, value in self.chat_buckets.items()
+                    if not value.is_full() or key in self.chat_queues
+                }
+            bucket = TokenBucket(self.chat_rate, self.chat_burst)
+            self.chat_buckets[chat_id] = bucket
+        return bucket
+
+    def start(self):
+        if self.dispatcher is None:
+            self.queue = asyncio.PriorityQueue()
+            self.dispatcher = asyncio.create_task(self.dispatch())
+
+    async def stop(self):
+        # Неотправленные запросы отменяются, иначе их ждущие обработчики повисли бы навсегда
+        queues = list(self.chat_queues.values())
+        if self.queue is not None:
+            queues.append(self.queue)
+        tasks = list(self.drain_tasks.values())
+        if self.dispatcher is not None:
+            tasks.append(self.dispatcher)
+            self.dispatcher = None
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        for queue in queues:
+            while not queue.empty():
+                queue.get_nowait()[-1].cancel()
+        # Задачи, отменённые до запуска, не успели убрать свои очереди
+        self.chat_queues.clear()
+        self.drain_tasks.clear()
+
+    async def dispatch(self):
+        # Глобальный лимит раздаётся по приоритету: сначала доски, потом сообщения
+        while True:
+            _, _, method, job, future = await self.queue.get()
+            try:
+                await self.global_bucket.acquire()
+            except asyncio.CancelledError:
+                future.cancel()
+                raise
+            if not future.cancelled():
+                asyncio.create_task(self.run(method, job, future))
+
+    async def run(self, method, job, future):
+        try:
+            result = await self.call_with_retry(method, job)
+        except Exception as e:
+            if not future.done():
+                future.set_exception(e)
+        else:
+            if not future.done():
+                future.set_result(result)
+
+    async def call_with_retry(self, method, job):
+        for attempt in range(self.max_retries + 1):
+            started = time.perf_counter()
+            try:
+                result = await job()
+            except ApiTelegramException as e:
+                API_SECONDS.observe(time.perf_counter() - started, method)
+                if e.error_code == 400 and "message is not modified" in e.description:
+                    API_CALLS.inc(method, "not_modified")
+                    return None
+                if e.error_code == 429:
+                    API_THROTTLED.inc(method)
+                if e.error_code != 429 or attempt == self.max_retries:
+                    API_CALLS.inc(method, "error")
+                    raise
+                retry_after = e.result_json.get("parameters", {}).get("retry_after", 1)
+                logging.warning("Telegram просит подождать %s с", retry_after)
+                await asyncio.sleep(retry_after)
+            except Exception:
+                API_CALLS.inc(method, "error")
+                raise
+            else:
+                API_SECONDS.observe(time.perf_counter() - started, method)
+                API_CALLS.inc(method, "ok")
+                return result
+
+    async def drain_chat(self, chat_id, queue):
+        # Приоритет действует только между чатами. Внутри чата запросы уходят по порядку
+        # и по одному, чтобы правка доски не обогнала «Ваш ход» или итог партии.
+        # Каждый запрос ждёт токен чата
+        bucket = self.chat_bucket(chat_id)
+        try:
+            while not queue.empty():
+                item = queue.get_nowait()
+                try:
+                    await bucket.acquire()
+                except asyncio.CancelledError:
+                    item[-1].cancel()
+                    raise
+                self.queue.put_nowait(item)
+                await asyncio.wait([item[-1]])
+        finally:
+            del self.chat_queues[chat_id]
+            del self.drain_tasks[chat_id]
+
+    def queue_depth(self):
+        queued = self.queue.qsize() if self.queue is not None else 0
+        return queued + sum(queue.qsize() for queue in self.chat_queues.values())
+
+    async def submit(self, chat_id, priority, job, method="request"):
+        self.start()
+        future = asyncio.get_running_loop().create_future()
+        item = (priority, next(self.counter), method, job, future)
+
+        queue = self.chat_queues.get(chat_id)
+        if queue is None:
+            queue = asyncio.Queue()
+            self.chat_queues[chat_id] = queue
+            queue.put_nowait(item)
+            self.drain_tasks[chat_id] = asyncio.create_task(self.drain_chat(chat_id, queue))
+        else:
+            queue.put_nowait(item)
+        return await future
+
+    async def send_message(self, chat_id, text, priority=PRIORITY_INFO, **kwargs):
+        return await self.submit(
+            chat_id, priority, lambda: self.bot.send_message(chat_id, text, **kwargs), "sendMessage"
+        )
+
+    async def edit_message_text(self, chat_id, message_id, text, priority=PRIORITY_BOARD, **kwargs):
+        return await self.submit(
+            chat_id,
+            priority,
+            lambda: self.bot.edit_message_text(
+                chat_id=chat_id, message_id=message_id, text=text, **kwargs
+            ),
+            "editMessageText",
+        )
+
+    async def send_to_all(self, chat_ids, text, priority=PRIORITY_INFO, **kwargs):
+        # Рассылка обоим игрокам одновременно, а не по очереди
+        return await asyncio.gather(
+            *(self.send_message(chat_id, text, priority, **kwargs) for chat_id in chat_ids if chat_id)
+        )
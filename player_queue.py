@@ -1,29 +1,205 @@
-from collections import deque
+import time
+from collections import OrderedDict, deque
+
+from metrics import REGISTRY
+
+ENTRY_TTL = 600
+RATING_WINDOW = 100
+WINDOW_GROWTH = 10  # На сколько очков рейтинга расширяется окно за секунду ожидания
+BUCKET_WIDTH = 50
+WAIT_SAMPLES = 1000
+
+QUEUE_WAIT = REGISTRY.histogram(
+    "bot_queue_wait_seconds", "Ожидание соперника до начала партии",
+    bounds=(1, 5, 10, 30, 60, 120, 300, 600),
+)
+QUEUE_MATCHES = REGISTRY.counter("bot_queue_matches_total", "Пары, собранные в очереди подбора")
+QUEUE_EXPIRED = REGISTRY.counter("bot_queue_expired_total", "Игроки, выбывшие из очереди по таймауту")
+
+
+class QueueEntry:
+    __slots__ = ("player_id", "rating", "joined_at", "bucket")
+
+    def __init__(self, player_id, rating, joined_at, bucket):
+        self.player_id = player_id
+        self.rating = rating
+        self.joined_at = joined_at
+        # Номер корзины рейтинга, у игроков без рейтинга None
+        self.bucket = bucket
 
 
 class PlayerQueue:
-    def __init__(self):
-        self.queues = {}  # Ключ: размер поля, значение: очередь игроков
+    # Все очереди — OrderedDict, поэтому постановка, подбор и выход стоят O(1).
+    # Игроки с рейтингом дополнительно лежат в корзинах шириной BUCKET_WIDTH очков,
+    # и соперник ищется от своей корзины наружу только в пределах окна подбора
+    def __init__(self, entry_ttl=ENTRY_TTL, rating_window=RATING_WINDOW, window_growth=WINDOW_GROWTH,
+                 bucket_width=BUCKET_WIDTH):
+        self.queues = {}  # Ключ: размер поля, значение: OrderedDict игроков в порядке прихода
+        self.buckets = {}  # Ключ: размер поля, значение: {номер корзины: OrderedDict игроков}
+        self.unrated = {}  # Ключ: размер поля, значение: OrderedDict игроков без рейтинга
+        self.entry_ttl = entry_ttl
+        self.rating_window = rating_window
+        self.window_growth = window_growth
+        self.bucket_width = bucket_width
+        self.wait_times = deque(maxlen=WAIT_SAMPLES)
+        self.matched = 0
+        self.expired = 0
 
-    def add_player(self, player_id, field_size):
+    def add_player(self, player_id, field_size, rating=None):
         # Добавляет игрока в очередь для указанного размера поля
-        if field_size not in self.queues:
-            self.queues[field_size] = deque()
-        if player_id not in self.queues[field_size]:
-            self.queues[field_size].append(player_id)
+        queue = self.queues.setdefault(field_size, OrderedDict())
+        if player_id in queue:
+            return
+        bucket = None if rating is None else int(rating // self.bucket_width)
+        entry = QueueEntry(player_id, rating, time.monotonic(), bucket)
+        queue[player_id] = entry
+        if bucket is None:
+            self.unrated.setdefault(field_size, OrderedDict())[player_id] = entry
+        else:
+            buckets = self.buckets.setdefault(field_size, {})
+            buckets.setdefault(bucket, OrderedDict())[player_id] = entry
+
+    def window(self, entry, now):
+        # Окно подбора по рейтингу расширяется, пока игрок ждёт
+        return self.rating_window + self.window_growth * (now - entry.joined_at)
+
+    def is_compatible(self, entry, other, now):
+        if entry.rating is None or other.rating is None:
+            return True
+        difference = abs(entry.rating - other.rating)
+        return difference <= max(self.window(entry, now), self.window(other, now))
+
+    def first_other(self, players, entry):
+        # Самый давний игрок, кроме entry: просматриваются не больше двух первых
+        for other in players.values():
+            if other is not entry:
+                return other
+        return None
+
+    def bucket_opponent(self, players, entry, now):
+        for other in players.values():
+            if other is not entry and self.is_compatible(entry, other, now):
+                return other
+        return None
+
+    def rated_opponent(self, field_size, entry, now):
+        # Шире всех окно у самого давнего игрока, поэтому дальше него искать незачем
+        queue = self.queues[field_size]
+        limit = max(self.window(entry, now), self.window(next(iter(queue.values())), now))
+        buckets = self.buckets.get(field_size, {})
+        for distance in range(int(limit // self.bucket_width) + 2):
+            candidates = [
+                self.bucket_opponent(buckets[bucket], entry, now)
+                for bucket in {entry.bucket - distance, entry.bucket + distance}
+                if bucket in buckets
+            ]
+            candidates = [other for other in candidates if other is not None]
+            if candidates:
+                return min(candidates, key=lambda other: abs(other.rating - entry.rating))
+        return None
+
+    def find_opponent(self, field_size, entry, now):
+        if entry.bucket is None:
+            return self.first_other(self.queues[field_size], entry)
+        opponent = self.rated_opponent(field_size, entry, now)
+        if opponent is None:
+            opponent = self.first_other(self.unrated.get(field_size, {}), entry)
+        return opponent
 
     def get_opponent(self, player_id, field_size):
         # Возвращает ID противника и удаляет обоих из очереди
-        if field_size in self.queues and len(self.queues[field_size]) >= 2:
-            self.queues[field_size].remove(player_id)
-            opponent_id = self.queues[field_size].popleft()
-            return opponent_id
-        return None
+        self.expire(field_size)
+        queue = self.queues.get(field_size)
+        if not queue or player_id not in queue:
+            return None
+
+        now = time.monotonic()
+        entry = queue[player_id]
+        opponent = self.find_opponent(field_size, entry, now)
+        if opponent is None:
+            return None
+
+        self.pair(field_size, entry, opponent, now)
+        return opponent.player_id
+
+    def rematch(self, now=None):
+        # Повторный подбор среди ждущих: окна расширились, и соседи по рейтингу могли сойтись.
+        # Первыми подбираются самые давние игроки. Возвращает пары (игрок, противник, размер поля)
+        now = time.monotonic() if now is None else now
+        self.expire(now=now)
+        pairs = []
+        for field_size, queue in self.queues.items():
+            for entry in list(queue.values()):
+                if entry.player_id not in queue:
+                    continue
+                opponent = self.find_opponent(field_size, entry, now)
+                if opponent is not None:
+                    self.pair(field_size, entry, opponent, now)
+                    pairs.append((entry.player_id, opponent.player_id, field_size))
+        return pairs
+
+    def pair(self, field_size, entry, opponent, now):
+        for matched in (entry, opponent):
+            self.discard(field_size, matched)
+            self.wait_times.append(now - matched.joined_at)
+            QUEUE_WAIT.observe(now - matched.joined_at)
+        self.matched += 1
+        QUEUE_MATCHES.inc()
+
+    def discard(self, field_size, entry):
+        del self.queues[field_size][entry.player_id]
+        if entry.bucket is None:
+            del self.unrated[field_size][entry.player_id]
+            return
+        buckets = self.buckets[field_size]
+        bucket = buckets[entry.bucket]
+        del bucket[entry.player_id]
+        if not bucket:
+            del buckets[entry.bucket]
 
     def remove_player(self, player_id, field_size):
         # Удаляет игрока из очереди
-        if field_size in self.queues and player_id in self.queues[field_size]:
-            self.queues[field_size].remove(player_id)
+        queue = self.queues.get(field_size)
+        entry = queue.get(player_id) if queue is not None else None
+        if entry is None:
+            return False
+        self.discard(field_size, entry)
+        return True
+
+    def is_waiting(self, player_id, field_size):
+        queue = self.queues.get(field_size)
+        return queue is not None and player_id in queue
+
+    def expire(self, field_size=None, now=None):
+        # Игроки стоят в порядке прихода, поэтому просроченные всегда в начале очереди
+        now = time.monotonic() if now is None else now
+        sizes = list(self.queues) if field_size is None else [field_size]
+        expired = []
+        for size in sizes:
+            queue = self.queues.get(size)
+            while queue:
+                entry = next(iter(queue.values()))
+                if now - entry.joined_at < self.entry_ttl:
+                    break
+                self.discard(size, entry)
+                expired.append((entry.player_id, size))
+        self.expired += len(expired)
+        if expired:
+            QUEUE_EXPIRED.inc(amount=len(expired))
+        return expired
+
+    def wait_stats(self):
+        waits = sorted(self.wait_times)
+        stats = {
+            "waiting": {size: len(queue) for size, queue in self.queues.items()},
+            "matched": self.matched,
+            "expired": self.expired,
+        }
+        if waits:
+            stats["wait_avg"] = sum(waits) / len(waits)
+            stats["wait_p50"] = waits[len(waits) // 2]
+            stats["wait_p90"] = waits[int(len(waits) * 0.9)]
+        return stats
 
     def __len__(self):
         return sum(len(queue) for queue in self.queues.values())
@@ -0,0 +1,193 @@
+TOP_SIZE = 10
+PAGE_SIZE = 10
+
+
+class FenwickTree:
+    def __init__(self, capacity=64):
+        self.capacity = capacity
+        self.tree = [0] * (capacity + 1)
+
+    def grow(self, index):
+        # Увеличиваем ёмкость вдвое и пересобираем дерево за O(n)
+        counts = [self.prefix(i) - self.prefix(i - 1) for i in range(1, self.capacity + 1)]
+        capacity = self.capacity
+        while capacity < index:
+            capacity *= 2
+        self.capacity = capacity
+        self.tree = [0] * (capacity + 1)
+        for i, count in enumerate(counts, start=1):
+            if count:
+                self.add(i, count)
+
+    def add(self, index, delta):
+        if index > self.capacity:
+            self.grow(index)
+        while index <= self.capacity:
+            self.tree[index] += delta
+            index += index & -index
+
+    def prefix(self, index):
+        index = min(index, self.capacity)
+        total = 0
+        while index > 0:
+            total += self.tree[index]
+            index -= index & -index
+        return total
+
+    def lower_bound(self, target):
+        # Наименьший индекс, у которого префиксная сумма не меньше target
+        position = 0
+        step = 1 << self.capacity.bit_length()
+        while step:
+            nxt = position + step
+            if nxt <= self.capacity and self.tree[nxt] < target:
+                position = nxt
+                target -= self.tree[nxt]
+            step >>= 1
+        return position + 1
+
+
+class Bucket:
+    # Игроки с одинаковым числом побед в порядке достижения. Выбывшие оставляют
+    # пустой слот, а дерево Фенвика над слотами находит k-го игрока за O(log n)
+    def __init__(self):
+        self.slots = []  # ID игроков по порядку прихода, у выбывших None
+        self.index = {}  # Ключ: ID игрока, значение: номер слота (с единицы)
+        self.alive = FenwickTree(capacity=8)
+
+    def __len__(self):
+        return len(self.index)
+
+    def append(self, identifier):
+        self.slots.append(identifier)
+        self.index[identifier] = len(self.slots)
+        self.alive.add(len(self.slots), 1)
+
+    def remove(self, identifier):
+        slot = self.index.pop(identifier)
+        self.slots[slot - 1] = None
+        self.alive.add(slot, -1)
+        # Пустых слотов не больше, чем игроков: пересборка окупается удалениями
+        if len(self.slots) > 2 * len(self.index) + 8:
+            self.compact()
+
+    def compact(self):
+        identifiers = [identifier for identifier in self.slots if identifier is not None]
+        self.slots = []
+        self.index = {}
+        self.alive = FenwickTree(capacity=max(8, len(identifiers)))
+        for identifier in identifiers:
+            self.append(identifier)
+
+    def slice(self, offset, limit):
+        # Игроки с offset-го по порядку, не больше limit
+        end = min(offset + limit, len(self.index))
+        return [self.slots[self.alive.lower_bound(k + 1) - 1] for k in range(offset, end)]
+
+
+class RankedLeaderboard:
+    def __init__(self, wins=None, names=None, top_size=TOP_SIZE):
+        self.top_size = top_size
+        self.names = dict(names or {})  # Ключ: ID игрока, значение: отображаемое имя
+        self.wins = {}  # Ключ: ID игрока, значение: число побед
+        self.buckets = {}  # Ключ: число побед, значение: Bucket
+        self.counts = FenwickTree()
+        self.top_text = None
+
+        for identifier, count in sorted((wins or {}).items(), key=lambda item: item[1]):
+            if count > 0:
+                self.insert(identifier, count)
+
+    def __len__(self):
+        return len(self.wins)
+
+    def __bool__(self):
+        return bool(self.wins)
+
+    def items(self):
+        return self.wins.items()
+
+    def get(self, identifier, default=None):
+        return self.wins.get(identifier, default)
+
+    def insert(self, identifier, count):
+        self.wins[identifier] = count
+        bucket = self.buckets.get(count)
+        if bucket is None:
+            bucket = self.buckets[count] = Bucket()
+        bucket.append(identifier)
+        self.counts.add(count, 1)
+
+    def remove(self, identifier):
+        count = self.wins.pop(identifier)
+        bucket = self.buckets[count]
+        bucket.remove(identifier)
+        if not bucket:
+            del self.buckets[count]
+        self.counts.add(count, -1)
+        return count
+
+    def count_above(self, count):
+        return len(self.wins) - self.counts.prefix(count)
+
+    def set_name(self, identifier, name):
+        if self.names.get(identifier) == name:
+            return
+        self.names[identifier] = name
+        rank = self.rank(identifier)
+        if rank is not None and rank <= self.top_size:
+            self.top_text = None
+
+    def add_win(self, identifier, amount=1):
+        count = amount
+        if identifier in self.wins:
+            count += self.remove(identifier)
+        self.insert(identifier, count)
+
+        # Топ меняется, только если игрок оказался в нём после обновления
+        position = self.count_above(count) + len(self.buckets[count])
+        if position <= self.top_size:
+            self.top_text = None
+
+    def rank(self, identifier):
+        count = self.wins.get(identifier)
+        if count is None:
+            return None
+        return self.count_above(count) + 1
+
+    def count_at(self, position):
+        # Число побед у игрока на позиции position (с нуля от лидера)
+        return self.counts.lower_bound(len(self.wins) - position)
+
+    def page(self, page, page_size=PAGE_SIZE):
+        start = page * page_size
+        end = min(start + page_size, len(self.wins))
+        entries = []
+        position = start
+        while position < end:
+            count = self.count_at(position)
+            offset = position - self.count_above(count)
+            for identifier in self.buckets[count].slice(offset, end - position):
+                entries.append((identifier, count))
+            position = start + len(entries)
+        return entries
+
+    def pages_count(self, page_size=PAGE_SIZE):
+        return max(1, (len(self.wins) + page_size - 1) // page_size)
+
+    def format_entries(self, entries, start):
+        lines = []
+        for idx, (identifier, wins) in enumerate(entries, start=start + 1):
+            name = self.names.get(identifier, identifier)
+            if "@" not in name:
+                name = f"@{name}"
+            lines.append(f"{idx}. {name} - Побед: {wins}\n")
+        return "".join(lines)
+
+    def format_top(self):
+        if self.top_text is None:
+            self.top_text = self.format_entries(self.page(0, self.top_size), 0)
+        return self.top_text
+
+    def format_page(self, page, page_size=PAGE_SIZE):
+        return self.format_entries(self.page(page, page_size), page * page_size)
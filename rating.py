@@ -0,0 +1,98 @@
+import json
+import time
+
+from sqlite_store import BatchedSQLiteStore
+
+DEFAULT_RATING = 1500.0
+K_FACTOR = 32.0
+
+# Бот участвует в рейтинге как отдельный игрок для каждой сложности
+BOT_IDS = {"easy": -1, "hard": -2, "mcts": -3}
+
+
+def expected_score(rating, opponent_rating):
+    return 1.0 / (1.0 + 10 ** ((opponent_rating - rating) / 400.0))
+
+
+def elo_update(rating_a, rating_b, score_a, k_factor=K_FACTOR):
+    delta = k_factor * (score_a - expected_score(rating_a, rating_b))
+    return rating_a + delta, rating_b - delta
+
+
+class RatingStore(BatchedSQLiteStore):
+    def __init__(self, path="ratings.db", history_path="rating_history.jsonl", flush_delay=1.0):
+        super().__init__(path, flush_delay)
+        self.history_path = history_path
+        self.ratings = {}  # Ключ: (ID игрока, размер поля, режим), значение: (рейтинг, число игр)
+        self.sizes = {}  # Ключ: (ID игрока, режим), значение: размеры полей, на которых он играл
+        self.dirty = set()
+        self.history = []
+
+    def open(self):
+        self.connect()
+        with self.connection:
+            self.connection.execute(
+                "CREATE TABLE IF NOT EXISTS ratings ("
+                "user_id INTEGER NOT NULL, field_size INTEGER NOT NULL, mode TEXT NOT NULL, "
+                "rating REAL NOT NULL, games INTEGER NOT NULL, "
+                "PRIMARY KEY (user_id, field_size, mode))"
+            )
+        rows = self.connection.execute(
+            "SELECT user_id, field_size, mode, rating, games FROM ratings"
+        )
+        self.ratings = {
+            (user_id, field_size, mode): (rating, games)
+            for user_id, field_size, mode, rating, games in rows
+        }
+        for user_id, field_size, mode in self.ratings:
+            self.sizes.setdefault((user_id, mode), set()).add(field_size)
+
+    def get(self, user_id, field_size, mode="player"):
+        return self.ratings.get((user_id, field_size, mode), (DEFAULT_RATING, 0))[0]
+
+    def played_sizes(self, user_id, mode="player"):
+        return sorted(self.sizes.get((user_id, mode), ()))
+
+    def record_game(self, player_a, player_b, score_a, field_size, mode):
+        # score_a: 1 — победа первого игрока, 0.5 — ничья, 0 — поражение
+        key_a = (player_a, field_size, mode)
+        key_b = (player_b, field_size, mode)
+        rating_a, games_a = self.ratings.get(key_a, (DEFAULT_RATING, 0))
+        rating_b, games_b = self.ratings.get(key_b, (DEFAULT_RATING, 0))
+        rating_a, rating_b = elo_update(rating_a, rating_b, score_a)
+
+        self.ratings[key_a] = (rating_a, games_a + 1)
+        self.ratings[key_b] = (rating_b, games_b + 1)
+        self.dirty.update((key_a, key_b))
+        for player in (player_a, player_b):
+            self.sizes.setdefault((player, mode), set()).add(field_size)
+        self.history.append([time.time(), field_size, mode, player_a, player_b, score_a])
+
+        self.schedule_flush()
+        return rating_a, rating_b
+
+    def take_batch(self):
+        if not self.dirty and not self.history:
+            return None
+        rows = [key + self.ratings[key] for key in self.dirty]
+        history, self.history = self.history, []
+        self.dirty = set()
+        return rows, history
+
+    def restore_batch(self, batch):
+        rows, history = batch
+        self.dirty.update(row[:3] for row in rows)
+        self.history = history + self.history
+
+    def write_batch(self, batch):
+        rows, history = batch
+        with self.connection:
+            self.connection.executemany(
+                "INSERT INTO ratings (user_id, field_size, mode, rating, games) "
+                "VALUES (?, ?, ?, ?, ?) ON CONFLICT(user_id, field_size, mode) "
+                "DO UPDATE SET rating = excluded.rating, games = excluded.games",
+                rows,
+            )
+        if history:
+            with open(self.history_path, "a", encoding="utf-8") as file:
+                file.writelines(json.dumps(entry) + "\n" for entry in history)
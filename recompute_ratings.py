@@ -0,0 +1,85 @@
+import argparse
+import json
+import sqlite3
+import time
+
+import numpy as np
+
+from rating import DEFAULT_RATING, K_FACTOR
+
+
+def load_history(path):
+    with open(path, "r", encoding="utf-8") as file:
+        return [json.loads(line) for line in file if line.strip()]
+
+
+def split_rounds(players_a, players_b):
+    # Партия попадает в раунд после последних партий обоих игроков, поэтому
+    # внутри раунда игрок встречается не больше одного раза и порядок сохраняется
+    last_round = {}
+    rounds = np.empty(len(players_a), dtype=np.int64)
+    for i, (a, b) in enumerate(zip(players_a, players_b)):
+        current = max(last_round.get(a, -1), last_round.get(b, -1)) + 1
+        last_round[a] = current
+        last_round[b] = current
+        rounds[i] = current
+    return rounds
+
+
+def recompute(games, k_factor=K_FACTOR):
+    # games: список (игрок A, игрок B, результат A) в хронологическом порядке
+    players = sorted({player for a, b, _ in games for player in (a, b)})
+    index = {player: i for i, player in enumerate(players)}
+    a_idx = np.array([index[a] for a, _, _ in games], dtype=np.int64)
+    b_idx = np.array([index[b] for _, b, _ in games], dtype=np.int64)
+    scores = np.array([score for _, _, score in games], dtype=np.float64)
+
+    ratings = np.full(len(players), DEFAULT_RATING)
+    counts = np.bincount(np.concatenate([a_idx, b_idx]), minlength=len(players))
+
+    rounds = split_rounds(a_idx.tolist(), b_idx.tolist())
+    order = np.argsort(rounds, kind="stable")
+    boundaries = np.flatnonzero(np.diff(rounds[order])) + 1
+    for batch in np.split(order, boundaries):
+        a = a_idx[batch]
+        b = b_idx[batch]
+        expected = 1.0 / (1.0 + 10.0 ** ((ratings[b] - ratings[a]) / 400.0))
+        delta = k_factor * (scores[batch] - expected)
+        ratings[a] += delta
+        ratings[b] -= delta
+
+    return {player: (float(ratings[i]), int(counts[i])) for player, i in index.items()}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Пересчёт рейтингов по истории партий")
+    parser.add_argument("--history", default="rating_history.jsonl")
+    parser.add_argument("--db", default="ratings.db")
+    args = parser.parse_args()
+
+    started = time.perf_counter()
+    groups = {}
+    for _, field_size, mode, player_a, player_b, score_a in load_history(args.history):
+        groups.setdefault((field_size, mode), []).append((player_a, player_b, score_a))
+
+    rows = []
+    for (field_size, mode), games in groups.items():
+        for player, (rating, count) in recompute(games).items():
+            rows.append((player, field_size, mode, rating, count))
+
+    connection = sqlite3.connect(args.db)
+    with connection:
+        connection.execute("DELETE FROM ratings")
+        connection.executemany(
+            "INSERT INTO ratings (user_id, field_size, mode, rating, games) VALUES (?, ?, ?, ?, ?)",
+            rows,
+        )
+    connection.close()
+    print(
+        f"Пересчитано партий: {sum(len(games) for games in groups.values())}, "
+        f"игроков: {len(rows)}, {time.perf_counter() - started:.2f} с"
+    )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,216 @@
+import random
+import time
+
+import gomoku
+from lines import MASK_FIELD_LIMIT, get_cell_lines, get_line_masks
+from opening_book import get_book
+
+WIN_SCORE = 1_000_000
+# Оценки выше этой границы означают форсированный выигрыш
+MATE_BOUND = WIN_SCORE - 1000
+
+EXACT = 0
+LOWER = 1
+UPPER = 2
+
+DEFAULT_TIME_BUDGET = 0.05
+MAX_TABLE_SIZE = 500_000
+
+
+class SearchTimeout(Exception):
+    pass
+
+
+def popcount(bits):
+    return bin(bits).count("1")
+
+
+class NegamaxSearch:
+    def __init__(self, field_size, winning_length):
+        self.field_size = field_size
+        self.winning_length = winning_length
+        self.board_size = field_size * field_size
+        self.full_mask = (1 << self.board_size) - 1
+        self.line_masks = get_line_masks(field_size, winning_length)
+        self.cell_lines = get_cell_lines(field_size, winning_length)
+
+        # Сначала перебираем клетки, через которые проходит больше линий
+        self.cell_order = tuple(
+            sorted(range(self.board_size), key=lambda pos: -len(self.cell_lines[pos]))
+        )
+
+        rng = random.Random(field_size * 1000 + winning_length)
+        self.zobrist = (
+            tuple(rng.getrandbits(64) for _ in range(self.board_size)),
+            tuple(rng.getrandbits(64) for _ in range(self.board_size)),
+        )
+
+        # Таблица транспозиций общая для всех игр с этим размером поля
+        self.table = {}
+        self.deadline = 0.0
+        self.nodes = 0
+
+    def hash_position(self, x_bits, o_bits):
+        key = 0
+        for pos in range(self.board_size):
+            if x_bits >> pos & 1:
+                key ^= self.zobrist[0][pos]
+            elif o_bits >> pos & 1:
+                key ^= self.zobrist[1][pos]
+        return key
+
+    def wins_with(self, bits, position):
+        for mask in self.cell_lines[position]:
+            if bits & mask == mask:
+                return True
+        return False
+
+    def evaluate(self, me, opp):
+        score = 0
+        for mask in self.line_masks:
+            if mask & opp == 0:
+                count = popcount(mask & me)
+                score += count * count
+            elif mask & me == 0:
+                count = popcount(mask & opp)
+                score -= count * count
+        return score
+
+    def ordered_moves(self, me, opp, hint):
+        occupied = me | opp
+        wins, blocks, rest = [], [], []
+        for pos in self.cell_order:
+            if occupied >> pos & 1 or pos == hint:
+                continue
+            if self.wins_with(me | 1 << pos, pos):
+                wins.append(pos)
+            elif self.wins_with(opp | 1 << pos, pos):
+                blocks.append(pos)
+            else:
+                rest.append(pos)
+
+        if hint is not None and not occupied >> hint & 1:
+            if self.wins_with(me | 1 << hint, hint):
+                wins.insert(0, hint)
+            else:
+                blocks.insert(0, hint)
+        return wins + blocks + rest
+
+    def negamax(self, me, opp, turn, key, depth, alpha, beta):
+        self.nodes += 1
+        if self.nodes & 1023 == 0 and time.monotonic() > self.deadline:
+            raise SearchTimeout()
+
+        if me | opp == self.full_mask:
+            return 0
+
+        alpha_orig = alpha
+        hint = None
+        entry = self.table.get(key)
+        if entry is not None:
+            entry_depth, entry_score, entry_flag, hint = entry
+            if entry_depth >= depth:
+                if entry_flag == EXACT:
+                    return entry_score
+                if entry_flag == LOWER:
+                    alpha = max(alpha, entry_score)
+                else:
+                    beta = min(beta, entry_score)
+                if alpha >= beta:
+                    return entry_score
+
+        if depth == 0:
+            return self.evaluate(me, opp)
+
+        best_score = -WIN_SCORE - 1
+        best_move = None
+        for pos in self.ordered_moves(me, opp, hint):
+            child = me | 1 << pos
+            if self.wins_with(child, pos):
+                score = WIN_SCORE - 1
+            else:
+                score = -self.negamax(
+                    opp, child, turn ^ 1, key ^ self.zobrist[turn][pos],
+                    depth - 1, -beta, -alpha,
+                )
+                # Чем дальше выигрыш, тем ниже оценка
+                if score > MATE_BOUND:
+                    score -= 1
+                elif score < -MATE_BOUND:
+                    score += 1
+
+            if score > best_score:
+                best_score = score
+                best_move = pos
+            if score > alpha:
+                alpha = score
+            if alpha >= beta or best_score == WIN_SCORE - 1:
+                break
+
+        if best_score <= alpha_orig:
+            flag = UPPER
+        elif best_score >= beta:
+            flag = LOWER
+        else:
+            flag = EXACT
+        self.table[key] = (depth, best_score, flag, best_move)
+        return best_score
+
+    def best_move(self, x_bits, o_bits, symbol, time_budget=DEFAULT_TIME_BUDGET):
+        if symbol == "X":
+            me, opp, turn = x_bits, o_bits, 0
+        else:
+            me, opp, turn = o_bits, x_bits, 1
+
+        empty_count = self.board_size - popcount(me | opp)
+        if empty_count == 0:
+            return None
+
+        key = self.hash_position(x_bits, o_bits)
+        self.deadline = time.monotonic() + time_budget
+        self.nodes = 0
+        move = self.ordered_moves(me, opp, None)[0]
+
+        # Итеративное углубление: берём ход последней завершённой глубины
+        for depth in range(1, empty_count + 1):
+            try:
+                score = self.negamax(
+                    me, opp, turn, key, depth, -WIN_SCORE - 1, WIN_SCORE + 1
+                )
+            except SearchTimeout:
+                break
+            move = self.table[key][3]
+            if abs(score) > MATE_BOUND:
+                break
+
+        if len(self.table) > MAX_TABLE_SIZE:
+            self.table.clear()
+        return move
+
+
+_searches = {}
+
+
+def get_search(field_size, winning_length):
+    key = (field_size, winning_length)
+    search = _searches.get(key)
+    if search is None:
+        search = NegamaxSearch(field_size, winning_length)
+        _searches[key] = search
+    return search
+
+
+def find_best_move(field_size, winning_length, x_bits, o_bits, symbol,
+                   time_budget=DEFAULT_TIME_BUDGET):
+    # Перебор по всему полю возможен только на малых досках, на больших — оценка угроз
+    if field_size > MASK_FIELD_LIMIT:
+        return gomoku.best_move(field_size, winning_length, x_bits, o_bits, symbol)
+
+    book = get_book(field_size, winning_length)
+    if book is not None:
+        move = book.lookup(x_bits, o_bits)
+        if move is not None:
+            return move
+
+    search = get_search(field_size, winning_length)
+    return search.best_move(x_bits, o_bits, symbol, time_budget)
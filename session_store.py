@@ -0,0 +1,105 @@
+import json
+
+from sqlite_store import SQLiteStore
+
+
+class VersionConflict(Exception):
+    pass
+
+
+def dump_record(record):
+    return json.dumps(record, separators=(",", ":"), ensure_ascii=False)
+
+
+def load_record(data):
+    return json.loads(data)
+
+
+class MemorySessionStore:
+    def __init__(self):
+        self.records = {}  # Ключ: ключ записи, значение: (данные, версия)
+
+    async def get(self, key):
+        return self.records.get(key)
+
+    async def put(self, key, data, version=None):
+        # version=None — запись без проверки, иначе версия должна совпасть с текущей
+        current = self.records.get(key)
+        current_version = current[1] if current else 0
+        if version is not None and version != current_version:
+            raise VersionConflict(key)
+        self.records[key] = (data, current_version + 1)
+        return current_version + 1
+
+    async def delete(self, key):
+        self.records.pop(key, None)
+
+    async def items(self, prefix):
+        return [
+            (key, data, version)
+            for key, (data, version) in self.records.items()
+            if key.startswith(prefix)
+        ]
+
+    async def close(self):
+        pass
+
+
+class SQLiteSessionStore(SQLiteStore):
+    # Базу могут делить несколько процессов: бот читает сессию при промахе кэша,
+    # а версии не дают применить два конфликтующих хода. Очередь подбора
+    # и таймеры остаются в памяти своего процесса
+    def __init__(self, path="sessions.db"):
+        super().__init__(path, isolation_level=None)
+        self.connect()
+        self.connection.execute(
+            "CREATE TABLE IF NOT EXISTS sessions ("
+            "key TEXT PRIMARY KEY, version INTEGER NOT NULL, data TEXT NOT NULL)"
+        )
+
+    def get_sync(self, key):
+        row = self.connection.execute(
+            "SELECT data, version FROM sessions WHERE key = ?", (key,)
+        ).fetchone()
+        return tuple(row) if row else None
+
+    def put_sync(self, key, data, version):
+        cursor = self.connection.cursor()
+        cursor.execute("BEGIN IMMEDIATE")
+        try:
+            row = cursor.execute("SELECT version FROM sessions WHERE key = ?", (key,)).fetchone()
+            current_version = row[0] if row else 0
+            if version is not None and version != current_version:
+                raise VersionConflict(key)
+            cursor.execute(
+                "INSERT INTO sessions (key, version, data) VALUES (?, ?, ?) "
+                "ON CONFLICT(key) DO UPDATE SET version = excluded.version, data = excluded.data",
+                (key, current_version + 1, data),
+            )
+        except BaseException:
+            cursor.execute("ROLLBACK")
+            raise
+        cursor.execute("COMMIT")
+        return current_version + 1
+
+    def delete_sync(self, key):
+        self.connection.execute("DELETE FROM sessions WHERE key = ?", (key,))
+
+    def items_sync(self, prefix):
+        rows = self.connection.execute(
+            "SELECT key, data, version FROM sessions WHERE key >= ? AND key < ?",
+            (prefix, prefix + "\uffff"),
+        )
+        return [tuple(row) for row in rows]
+
+    async def get(self, key):
+        return await self.run(self.get_sync, key)
+
+    async def put(self, key, data, version=None):
+        return await self.run(self.put_sync, key, data, version)
+
+    async def delete(self, key):
+        await self.run(self.delete_sync, key)
+
+    async def items(self, prefix):
+        return await self.run(self.items_sync, prefix)
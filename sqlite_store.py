@@ -0,0 +1,120 @@
+import asyncio
+import logging
+import os
+import sqlite3
+from abc import ABC, abstractmethod
+from concurrent.futures import ThreadPoolExecutor
+
+_databases = {}  # Ключ: абсолютный путь к базе, значение: SQLiteDatabase
+
+
+class SQLiteDatabase:
+    # Одно соединение и один поток на файл базы: хранилища с тем же путём их делят
+    def __init__(self, path, options):
+        self.path = path
+        self.options = options
+        self.connection = sqlite3.connect(path, check_same_thread=False, **options)
+        self.connection.execute("PRAGMA journal_mode=WAL")
+        self.connection.execute("PRAGMA synchronous=NORMAL")
+        # Все обращения к базе идут через один поток
+        self.executor = ThreadPoolExecutor(max_workers=1)
+        self.users = 0
+
+    @classmethod
+    def acquire(cls, path, options):
+        key = os.path.abspath(path)
+        database = _databases.get(key)
+        if database is None:
+            database = _databases[key] = cls(path, options)
+        elif database.options != options:
+            raise ValueError(f"База {path} уже открыта с другими настройками")
+        database.users += 1
+        return database
+
+    async def release(self):
+        self.users -= 1
+        if self.users:
+            return
+        del _databases[os.path.abspath(self.path)]
+        loop = asyncio.get_running_loop()
+        await loop.run_in_executor(self.executor, self.connection.close)
+        self.executor.shutdown()
+
+
+class SQLiteStore:
+    def __init__(self, path, **options):
+        self.path = path
+        self.options = options
+        self.database = None
+        self.connection = None
+
+    def connect(self):
+        self.database = SQLiteDatabase.acquire(self.path, self.options)
+        self.connection = self.database.connection
+        return self.connection
+
+    async def run(self, function, *args):
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self.database.executor, function, *args)
+
+    async def close(self):
+        if self.database is not None:
+            database, self.database = self.database, None
+            self.connection = None
+            await database.release()
+
+
+class BatchedSQLiteStore(SQLiteStore, ABC):
+    # Изменения копятся в памяти flush_delay секунд и пишутся одной транзакцией.
+    # Наследник собирает пачку в take_batch, пишет в write_batch
+    # и возвращает в restore_batch, если запись не удалась
+    def __init__(self, path, flush_delay=1.0):
+        super().__init__(path)
+        self.flush_delay = flush_delay
+        self.flush_task = None
+        self.closing = False
+
+    @abstractmethod
+    def take_batch(self):
+        pass
+
+    @abstractmethod
+    def write_batch(self, batch):
+        pass
+
+    @abstractmethod
+    def restore_batch(self, batch):
+        pass
+
+    def schedule_flush(self):
+        if self.flush_task is None:
+            self.flush_task = asyncio.create_task(self.delayed_flush())
+
+    async def delayed_flush(self):
+        await asyncio.sleep(self.flush_delay)
+        self.flush_task = None
+        await self.flush()
+
+    async def flush(self):
+        batch = self.take_batch()
+        if batch is None:
+            return True
+        try:
+            await self.run(self.write_batch, batch)
+        except (sqlite3.Error, OSError) as e:
+            logging.error("Ошибка записи в %s: %s", self.path, e)
+            self.restore_batch(batch)
+            # Пачка вернулась в память: пробуем снова, не дожидаясь новых изменений
+            if not self.closing:
+                self.schedule_flush()
+            return False
+        return True
+
+    async def close(self):
+        self.closing = True
+        if self.flush_task is not None:
+            self.flush_task.cancel()
+            self.flush_task = None
+        if not await self.flush():
+            logging.error("Последняя запись в %s не удалась, несохранённые изменения потеряны", self.path)
+        await super().close()
@@ -0,0 +1,30 @@
+import unittest
+
+import numpy as np
+
+from batch_engine import BatchEngine
+from game import TicTacToeGame
+
+
+class BatchEngineTest(unittest.TestCase):
+    def test_large_board_moves_stay_near_stones(self):
+        engine = BatchEngine(7, seed=1)
+        me = np.zeros((2, 49), dtype=np.float32)
+        opp = np.zeros((2, 49), dtype=np.float32)
+        opp[1, 0] = 1
+        moves = engine.choose_moves(me, opp, "heuristic")
+        self.assertEqual(moves[0], 24)  # Пустое поле — центр
+
+        game = TicTacToeGame("X", field_size=7)
+        game.make_move(0)
+        self.assertIn(moves[1], game.candidate_positions())
+
+    def test_small_board_uses_every_empty_cell(self):
+        engine = BatchEngine(3, seed=1)
+        empty = np.ones((1, 9), dtype=bool)
+        stones = np.zeros((1, 9), dtype=np.float32)
+        self.assertTrue(engine.candidate_cells(stones, stones, empty).all())
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,163 @@
+import itertools
+import os
+import tempfile
+import unittest
+
+from benchmark import FakeAsyncTeleBot, make_call, make_message, make_user
+from outbound import OutboundScheduler
+from session_store import SQLiteSessionStore
+
+
+class RecordingTeleBot(FakeAsyncTeleBot):
+    def __init__(self):
+        super().__init__()
+        self.sent = []
+
+    async def send_message(self, chat_id, text, **kwargs):
+        self.sent.append((chat_id, text))
+        return await super().send_message(chat_id, text, **kwargs)
+
+
+class BotTestCase(unittest.IsolatedAsyncioTestCase):
+    async def asyncSetUp(self):
+        # Бот открывает базы в текущем каталоге
+        self.workdir = os.getcwd()
+        self.directory = tempfile.TemporaryDirectory()
+        os.chdir(self.directory.name)
+        self.bots = []
+        self.query_ids = itertools.count()
+        self.bot, self.fake = self.make_bot()
+
+    def make_bot(self, session_store=None):
+        import bot as bot_module
+
+        fake = RecordingTeleBot()
+        bot = bot_module.TicTacToeBot("test", session_store=session_store, bot=fake)
+        bot.outbound = OutboundScheduler(
+            fake, global_rate=1e9, global_burst=1e9, chat_rate=1e9, chat_burst=1e9
+        )
+        self.bots.append(bot)
+        return bot, fake
+
+    async def asyncTearDown(self):
+        for bot in self.bots:
+            await bot.shutdown()
+        os.chdir(self.workdir)
+        self.directory.cleanup()
+
+    async def send(self, chat_id, *texts, fake=None):
+        for text in texts:
+            await (fake or self.fake).message_handlers[0](make_message(chat_id, text))
+
+    async def press(self, chat_id, data, fake=None):
+        await (fake or self.fake).callback_handlers[0](make_call(chat_id, data, self.query_ids))
+
+    def last_message(self, chat_id):
+        return [text for sent_to, text in self.fake.sent if sent_to == chat_id][-1]
+
+
+class QueueExitTest(BotTestCase):
+    async def test_exit_while_queued_leaves_queue(self):
+        await self.send(1, "Против игрока", "Поле 3x3")
+        self.assertTrue(self.bot.player_queue.is_waiting(1, 3))
+
+        await self.send(1, "Выход")
+        self.assertFalse(self.bot.player_queue.is_waiting(1, 3))
+        self.assertNotIn(1, self.bot.games)
+
+        # Следующий игрок не должен попасть в партию с ушедшим
+        await self.send(2, "Против игрока", "Поле 3x3")
+        self.assertIsNone(self.bot.games[2].game)
+        self.assertTrue(self.last_message(2).startswith("Вы в очереди"))
+
+    async def test_exit_from_queue_button(self):
+        await self.send(1, "Против игрока", "Поле 4x4", "Выйти из очереди")
+        self.assertEqual(len(self.bot.player_queue), 0)
+        self.assertNotIn(1, self.bot.games)
+
+
+    async def test_menu_exits_do_not_leak_locks(self):
+        for chat_id in range(1, 11):
+            await self.send(chat_id, "Против бота", "Выход")
+        self.assertEqual(self.bot.games, {})
+        self.assertEqual(self.bot.game_locks, {})
+
+
+class RedrawTest(BotTestCase):
+    async def test_final_board_is_drawn_after_game_ends_mid_redraw(self):
+        await self.send(1, "Против бота", "Поле 3x3", "Лёгкий бот", "Крестик")
+        game = self.bot.games[1].game
+        position = game.empty_positions()[0]
+        render_board = self.bot.render_board
+        rendered = []
+
+        async def render(chat_id, game_data):
+            rendered.append(game_data.game.get_board())
+            await render_board(chat_id, game_data)
+            if len(rendered) == 1:
+                # Пока идёт перерисовка, ход завершает партию и просит показать доску
+                game.make_move(position)
+                await self.bot.display_board(chat_id)
+                self.bot.games.pop(chat_id)
+
+        self.bot.render_board = render
+        await self.bot.display_board(1)
+        self.assertEqual(len(rendered), 2)
+        self.assertNotEqual(rendered[-1][position], "")
+        self.assertNotIn(1, self.bot.redraws)
+
+
+class SharedStoreTest(BotTestCase):
+    async def test_game_moves_between_processes(self):
+        # Два процесса с одной базой сессий, обновления чата приходят то в один, то в другой
+        first, first_fake = self.make_bot(SQLiteSessionStore("shared.db"))
+        second, second_fake = self.make_bot(SQLiteSessionStore("shared.db"))
+        await self.send(1, "Против бота", "Поле 3x3", "Лёгкий бот", "Крестик", fake=first_fake)
+        self.assertNotIn(1, second.games)
+
+        await self.press(1, "move_0_0", fake=second_fake)
+        game = second.games[1].game
+        self.assertEqual(game.get_board()[0], "X")
+        self.assertEqual(game.sequence, 2)
+
+        position = game.empty_positions()[0]
+        await self.press(1, f"move_{position}_{game.sequence}", fake=first_fake)
+        game = first.games[1].game
+        self.assertEqual(game.get_board()[0], "X")
+        self.assertEqual(game.get_board()[position], "X")
+        self.assertEqual(game.sequence, 4)
+
+
+class LeaderboardTest(BotTestCase):
+    async def test_shows_ratings_for_played_sizes(self):
+        self.bot.ratings.record_game(1, 2, 1, 5, "player")
+        self.bot.ratings.record_game(1, 3, 0, 3, "player")
+        text = self.bot.format_leaderboard_page(0, make_user(1))
+        self.assertIn("3x3 — ", text)
+        self.assertIn("5x5 — ", text)
+        self.assertNotIn("4x4", text)
+
+        text = self.bot.format_leaderboard_page(0, make_user(4))
+        self.assertNotIn("Ваш рейтинг", text)
+
+
+class RematchTest(BotTestCase):
+    async def test_waiting_players_are_paired_when_windows_widen(self):
+        ratings = {1: 1300.0, 2: 1700.0}
+        self.bot.ratings.get = lambda user_id, field_size, mode="player": ratings[user_id]
+        await self.send(1, "Против игрока", "Поле 3x3")
+        await self.send(2, "Против игрока", "Поле 3x3")
+        self.assertEqual(len(self.bot.player_queue), 2)
+        self.assertIn(("rematch",), self.bot.timers)
+
+        # Игроки ждут уже минуту: окно подбора покрывает разницу рейтингов
+        for entry in self.bot.player_queue.queues[3].values():
+            entry.joined_at -= 60
+        await self.bot.rematch_queue()
+        self.assertEqual(len(self.bot.player_queue), 0)
+        self.assertEqual(self.bot.games[1].opponent, 2)
+        self.assertEqual(self.bot.games[2].opponent, 1)
+
+
+if __name__ == "__main__":
+    unittest.main()
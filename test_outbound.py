@@ -0,0 +1,53 @@
+import asyncio
+import unittest
+
+from benchmark import FakeAsyncTeleBot
+from outbound import PRIORITY_BOARD, OutboundScheduler
+
+
+class OrderedTeleBot(FakeAsyncTeleBot):
+    def __init__(self, latency=0.0):
+        super().__init__(latency)
+        self.sent = []
+
+    async def send_message(self, chat_id, text, **kwargs):
+        self.sent.append(text)
+        return await super().send_message(chat_id, text, **kwargs)
+
+    async def edit_message_text(self, chat_id=None, message_id=None, text=None, **kwargs):
+        self.sent.append(text)
+        return await super().edit_message_text(chat_id, message_id, text, **kwargs)
+
+
+class OutboundSchedulerTest(unittest.IsolatedAsyncioTestCase):
+    async def test_chat_messages_keep_order(self):
+        fake = OrderedTeleBot(latency=0.01)
+        outbound = OutboundScheduler(fake, chat_rate=1e9, chat_burst=1e9)
+        await asyncio.gather(
+            outbound.send_message(1, "Ваш ход"),
+            outbound.edit_message_text(1, 1, "доска", priority=PRIORITY_BOARD),
+            outbound.send_message(1, "Победитель: X"),
+        )
+        self.assertEqual(fake.sent, ["Ваш ход", "доска", "Победитель: X"])
+        await outbound.stop()
+
+    async def test_stop_cancels_pending_requests(self):
+        fake = OrderedTeleBot()
+        outbound = OutboundScheduler(fake, chat_rate=0.01, chat_burst=1)
+        tasks = [
+            asyncio.create_task(outbound.send_message(chat_id, str(index)))
+            for chat_id in (1, 2)
+            for index in range(3)
+        ]
+        await asyncio.sleep(0.05)
+        await outbound.stop()
+
+        done, pending = await asyncio.wait(tasks, timeout=1)
+        self.assertFalse(pending)
+        self.assertEqual(sum(task.cancelled() for task in done), 4)
+        self.assertEqual(outbound.chat_queues, {})
+        self.assertEqual(outbound.drain_tasks, {})
+
+
+if __name__ == "__main__":
+    unittest.main()
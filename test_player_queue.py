@@ -0,0 +1,78 @@
+import time
+import unittest
+
+from metrics import REGISTRY
+from player_queue import QUEUE_EXPIRED, QUEUE_MATCHES, PlayerQueue
+
+
+class PlayerQueueTest(unittest.TestCase):
+    def test_join_and_leave(self):
+        queue = PlayerQueue()
+        queue.add_player(1, 3, rating=1500)
+        self.assertTrue(queue.is_waiting(1, 3))
+        self.assertTrue(queue.remove_player(1, 3))
+        self.assertFalse(queue.remove_player(1, 3))
+
+        queue.add_player(2, 3, rating=1500)
+        self.assertIsNone(queue.get_opponent(2, 3))
+        self.assertEqual(len(queue), 1)
+
+    def test_matches_nearest_rating(self):
+        queue = PlayerQueue()
+        queue.add_player(1, 3, rating=1400)
+        queue.add_player(2, 3, rating=1560)
+        queue.add_player(3, 3, rating=1520)
+        self.assertEqual(queue.get_opponent(3, 3), 2)
+        self.assertEqual(len(queue), 1)
+        self.assertEqual(list(queue.buckets[3]), [28])
+
+    def test_unrated_player_matches_anyone(self):
+        queue = PlayerQueue()
+        queue.add_player(1, 3, rating=2500)
+        queue.add_player(2, 3)
+        self.assertEqual(queue.get_opponent(2, 3), 1)
+
+    def test_rematch_after_window_grows(self):
+        queue = PlayerQueue(rating_window=100, window_growth=10)
+        queue.add_player(1, 3, rating=1300)
+        queue.add_player(2, 3, rating=1700)
+        self.assertIsNone(queue.get_opponent(2, 3))
+
+        now = time.monotonic()
+        self.assertEqual(queue.rematch(now=now), [])
+        self.assertEqual(queue.rematch(now=now + 31), [(1, 2, 3)])
+        self.assertEqual(len(queue), 0)
+        self.assertEqual(queue.buckets[3], {})
+
+    def test_expire_clears_buckets(self):
+        queue = PlayerQueue(entry_ttl=10)
+        queue.add_player(1, 4, rating=1500)
+        queue.add_player(2, 4)
+        self.assertEqual(queue.expire(now=time.monotonic() + 11), [(1, 4), (2, 4)])
+        self.assertEqual(queue.buckets[4], {})
+        self.assertEqual(queue.unrated[4], {})
+        self.assertFalse(queue.is_waiting(1, 4))
+
+    def test_rematch_pairs_oldest_first(self):
+        queue = PlayerQueue(rating_window=100, window_growth=0)
+        for player_id, rating in ((1, 1500), (2, 1900), (3, 1560), (4, 1950), (5, 1540)):
+            queue.add_player(player_id, 3, rating=rating)
+        self.assertEqual(queue.rematch(), [(1, 5, 3), (2, 4, 3)])
+        self.assertEqual(list(queue.queues[3]), [3])
+        self.assertEqual(list(queue.buckets[3]), [31])
+
+    def test_metrics(self):
+        queue = PlayerQueue(entry_ttl=10)
+        matches, expired = QUEUE_MATCHES.get(), QUEUE_EXPIRED.get()
+        queue.add_player(1, 3, rating=1500)
+        queue.add_player(2, 3, rating=1500)
+        queue.get_opponent(2, 3)
+        queue.add_player(3, 3, rating=1500)
+        queue.expire(now=time.monotonic() + 11)
+        self.assertEqual(QUEUE_MATCHES.get(), matches + 1)
+        self.assertEqual(QUEUE_EXPIRED.get(), expired + 1)
+        self.assertIn("bot_queue_wait_seconds_count", REGISTRY.render())
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,36 @@
+import random
+import unittest
+
+from ranking import RankedLeaderboard
+
+
+class RankedLeaderboardTest(unittest.TestCase):
+    def test_pages_follow_wins_then_arrival(self):
+        rng = random.Random(7)
+        leaderboard = RankedLeaderboard()
+        wins = {}
+        arrivals = {}
+        for step in range(3000):
+            identifier = str(rng.randrange(200))
+            leaderboard.add_win(identifier)
+            wins[identifier] = wins.get(identifier, 0) + 1
+            arrivals[identifier] = step
+
+        expected = sorted(wins, key=lambda identifier: (-wins[identifier], arrivals[identifier]))
+        for page in range(leaderboard.pages_count()):
+            self.assertEqual(
+                leaderboard.page(page),
+                [(identifier, wins[identifier]) for identifier in expected[page * 10:page * 10 + 10]],
+            )
+        self.assertEqual(leaderboard.rank(expected[0]), 1)
+
+    def test_deep_page_inside_one_tie(self):
+        leaderboard = RankedLeaderboard({str(i): 1 for i in range(1000)})
+        for i in range(0, 1000, 2):
+            leaderboard.add_win(str(i))
+        # Вторая половина таблицы — игроки с одной победой в порядке прихода
+        self.assertEqual(leaderboard.page(70), [(str(i), 1) for i in range(401, 420, 2)])
+
+
+if __name__ == "__main__":
+    unittest.main()
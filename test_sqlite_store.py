@@ -0,0 +1,87 @@
+import os
+import sqlite3
+import tempfile
+import unittest
+
+from leaderboard_store import LeaderboardStore
+from rating import RatingStore
+from session_store import SQLiteSessionStore
+from sqlite_store import BatchedSQLiteStore
+
+
+class BatchedStoreTest(unittest.IsolatedAsyncioTestCase):
+    async def asyncSetUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+
+    async def asyncTearDown(self):
+        self.directory.cleanup()
+
+    def path(self, name):
+        return os.path.join(self.directory.name, name)
+
+    async def test_ratings_survive_reopen(self):
+        store = RatingStore(self.path("ratings.db"), self.path("history.jsonl"), flush_delay=60)
+        store.open()
+        rating_a, _ = store.record_game(1, 2, 1, 3, "player")
+        await store.close()
+
+        store = RatingStore(self.path("ratings.db"), self.path("history.jsonl"))
+        store.open()
+        self.assertEqual(store.get(1, 3), rating_a)
+        await store.close()
+
+    async def test_failed_write_is_requeued(self):
+        store = LeaderboardStore(self.path("leaderboard.db"), self.path("leaderboard.json"), flush_delay=60)
+        store.open()
+        store.increment("1", "Аня")
+
+        def fail(batch):
+            raise sqlite3.OperationalError("database is locked")
+
+        store.write_batch = fail
+        with self.assertLogs(level="ERROR"):
+            await store.flush()
+        self.assertEqual(store.pending, {"1": (1, "Аня")})
+        # Вернувшаяся пачка записывается повторно без новых изменений
+        self.assertIsNotNone(store.flush_task)
+
+        store.increment("1", "Аня")
+        del store.write_batch
+        await store.close()
+
+        store = LeaderboardStore(self.path("leaderboard.db"), self.path("leaderboard.json"))
+        store.open()
+        self.assertEqual(store.load()[0], {"1": 2})
+        await store.close()
+
+    async def test_failed_final_flush_is_logged(self):
+        store = LeaderboardStore(self.path("leaderboard.db"), self.path("leaderboard.json"), flush_delay=60)
+        store.open()
+        store.increment("1", "Аня")
+
+        def fail(batch):
+            raise sqlite3.OperationalError("disk I/O error")
+
+        store.write_batch = fail
+        with self.assertLogs(level="ERROR") as logs:
+            await store.close()
+        self.assertIn("потеряны", logs.output[-1])
+        self.assertIsNone(store.flush_task)
+
+    async def test_stores_share_database_per_file(self):
+        first = SQLiteSessionStore(self.path("sessions.db"))
+        second = SQLiteSessionStore(self.path("sessions.db"))
+        self.assertIs(first.database, second.database)
+
+        await first.put("chat:1", "{}")
+        await first.close()
+        self.assertEqual(await second.get("chat:1"), ("{}", 1))
+        await second.close()
+
+    def test_hooks_are_abstract(self):
+        with self.assertRaises(TypeError):
+            BatchedSQLiteStore(self.path("any.db"))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,98 @@
+import asyncio
+import logging
+import math
+import time
+
+from metrics import REGISTRY
+
+TICK = 1.0
+SLOTS = 512
+
+TIMERS_FIRED = REGISTRY.counter("bot_timers_fired_total", "Сработавшие таймеры", ("kind",))
+
+
+class Timer:
+    __slots__ = ("key", "slot", "rounds", "callback", "args")
+
+    def __init__(self, key, slot, rounds, callback, args):
+        self.key = key
+        self.slot = slot
+        # Сколько полных оборотов колеса таймер ещё пропускает
+        self.rounds = rounds
+        self.callback = callback
+        self.args = args
+
+
+class TimingWheel:
+    # Хешированное колесо таймеров: постановка и отмена за O(1),
+    # за тик просматривается только одна ячейка колеса
+    def __init__(self, tick=TICK, slots=SLOTS):
+        self.tick = tick
+        self.slots = [{} for _ in range(slots)]  # В ячейке ключ таймера -> Timer
+        self.timers = {}  # Ключ: ключ таймера, значение: Timer
+        self.started = time.monotonic()
+        self.ticks = 0  # Сколько тиков уже обработано
+        self.task = None
+
+    def schedule(self, key, delay, callback, *args):
+        # Таймер с тем же ключом заменяется: так перезапускаются часы хода и простоя
+        self.cancel(key)
+        target = math.ceil((time.monotonic() + delay - self.started) / self.tick)
+        target = max(target, self.ticks + 1)
+        slot = target % len(self.slots)
+        timer = Timer(key, slot, (target - self.ticks - 1) // len(self.slots), callback, args)
+        self.slots[slot][key] = timer
+        self.timers[key] = timer
+
+    def cancel(self, key):
+        timer = self.timers.pop(key, None)
+        if timer is None:
+            return False
+        del self.slots[timer.slot][key]
+        return True
+
+    def advance(self):
+        # Один тик: возвращает таймеры, у которых наступил срок
+        self.ticks += 1
+        slot = self.slots[self.ticks % len(self.slots)]
+        due = []
+        for timer in slot.values():
+            if timer.rounds:
+                timer.rounds -= 1
+            else:
+                due.append(timer)
+        for timer in due:
+            del slot[timer.key]
+            del self.timers[timer.key]
+        return due
+
+    def start(self):
+        if self.task is None:
+            self.task = asyncio.create_task(self.run())
+
+    async def stop(self):
+        if self.task is not None:
+            self.task.cancel()
+            self.task = None
+
+    async def run(self):
+        while True:
+            # Тики отсчитываются от запуска колеса, поэтому задержки цикла не копятся
+            delay = self.started + (self.ticks + 1) * self.tick - time.monotonic()
+            if delay > 0:
+                await asyncio.sleep(delay)
+            for timer in self.advance():
+                asyncio.create_task(self.fire(timer))
+
+    async def fire(self, timer):
+        TIMERS_FIRED.inc(timer.key[0] if isinstance(timer.key, tuple) else "timer")
+        try:
+            await timer.callback(*timer.args)
+        except Exception:
+            logging.exception("Ошибка таймера %s", timer.key)
+
+    def __contains__(self, key):
+        return key in self.timers
+
+    def __len__(self):
+        return len(self.timers)
@@ -0,0 +1,82 @@
+import asyncio
+import hmac
+import logging
+
+from aiohttp import web
+from telebot import asyncio_helper, types
+
+SECRET_HEADER = "X-Telegram-Bot-Api-Secret-Token"
+
+
+def configure_api(api_url=None, connection_limit=100):
+    # Все запросы к Bot API идут через одну сессию aiohttp с пулом соединений.
+    # api_url позволяет направить бота на локальный поддельный сервер Telegram
+    if api_url:
+        asyncio_helper.API_URL = api_url.rstrip("/") + "/bot{0}/{1}"
+    asyncio_helper.REQUEST_LIMIT = connection_limit
+
+
+class WebhookServer:
+    def __init__(self, bot, secret_token, host="127.0.0.1", port=8080, path="/webhook",
+                 workers=16, max_queue=1000):
+        self.bot = bot
+        self.secret_token = secret_token
+        self.host = host
+        self.port = port
+        self.path = path
+        self.workers_count = workers
+        self.queue = asyncio.Queue(maxsize=max_queue)
+        self.workers = []
+        self.runner = None
+
+    async def handle_update(self, request):
+        token = request.headers.get(SECRET_HEADER, "")
+        if not hmac.compare_digest(token, self.secret_token):
+            return web.Response(status=403)
+
+        try:
+            data = await request.json()
+        except ValueError:
+            return web.Response(status=400)
+
+        try:
+            self.queue.put_nowait(data)
+        except asyncio.QueueFull:
+            # Очередь заполнена: Telegram повторит доставку позже
+            logging.warning("Очередь обновлений переполнена")
+            return web.Response(status=503)
+        return web.Response()
+
+    async def worker(self):
+        while True:
+            data = await self.queue.get()
+            try:
+                update = types.Update.de_json(data)
+                await self.bot.process_new_updates([update])
+            except Exception:
+                logging.exception("Ошибка обработки обновления")
+            finally:
+                self.queue.task_done()
+
+    async def start(self, webhook_url=None):
+        app = web.Application()
+        app.router.add_post(self.path, self.handle_update)
+        self.runner = web.AppRunner(app)
+        await self.runner.setup()
+        await web.TCPSite(self.runner, self.host, self.port).start()
+
+        self.workers = [
+            asyncio.create_task(self.worker()) for _ in range(self.workers_count)
+        ]
+        if webhook_url:
+            await self.bot.set_webhook(url=webhook_url, secret_token=self.secret_token)
+        logging.info("Webhook слушает %s:%s%s", self.host, self.port, self.path)
+
+    async def stop(self):
+        if self.runner is not None:
+            await self.runner.cleanup()
+            self.runner = None
+        await self.queue.join()
+        for task in self.workers:
+            task.cancel()
+        self.workers = []